@@ -0,0 +1,129 @@
+import re
+import time
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+
+def normalize_question(question: str) -> str:
+    """Lower-case, drop punctuation and collapse whitespace so trivial rewordings share a key"""
+    return " ".join(re.sub(r"[^\w\s]", " ", question.lower()).split())
+
+
+class AnswerCache:
+    """
+    Two-level answer cache scoped per document. Level one is an exact match
+    on the normalised question; level two is the closest cached question by
+    cosine similarity of its embedding, accepted above `threshold`.
+    Entries expire after `ttl` seconds and the least recently used entry is
+    dropped once `max_entries` is reached.
+    """
+
+    def __init__(self, max_entries: int = 2048, ttl: float = 3600.0, threshold: float = 0.92):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.threshold = threshold
+        self._entries: "OrderedDict[Tuple[str, str], Dict[str, Any]]" = OrderedDict()
+        self._by_doc: Dict[str, set] = {}
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.semantic_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, doc_id: str, question: str, embedding: Optional[Sequence[float]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Look up a cached answer. Without an embedding only the exact level is
+        tried and a miss is not counted, so callers can probe cheaply before
+        paying for the embedding and then call again with it.
+        """
+        key = (doc_id, normalize_question(question))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._live(key, now)
+            if entry is not None:
+                self.exact_hits += 1
+                return entry["payload"]
+            if embedding is None:
+                return None
+            best_key, best_score = self._nearest(doc_id, self._unit(embedding), now)
+            if best_key is not None and best_score >= self.threshold:
+                self.semantic_hits += 1
+                self._entries.move_to_end(best_key)
+                return self._entries[best_key]["payload"]
+            self.misses += 1
+            return None
+
+    def put(self, doc_id: str, question: str, embedding: Optional[Sequence[float]], payload: Dict[str, Any]) -> None:
+        key = (doc_id, normalize_question(question))
+        with self._lock:
+            self._drop(key)
+            self._entries[key] = {
+                "payload": payload,
+                "vector": self._unit(embedding) if embedding is not None else None,
+                "expires": time.monotonic() + self.ttl,
+            }
+            self._by_doc.setdefault(doc_id, set()).add(key)
+            while len(self._entries) > self.max_entries:
+                self._drop(next(iter(self._entries)))
+                self.evictions += 1
+
+    def invalidate(self, doc_id: str) -> int:
+        """Forget every answer for a document, e.g. when it is deleted or re-indexed"""
+        with self._lock:
+            keys = list(self._by_doc.get(doc_id, ()))
+            for key in keys:
+                self._drop(key)
+            return len(keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.exact_hits + self.semantic_hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "max_entries": self.max_entries,
+                "exact_hits": self.exact_hits,
+                "semantic_hits": self.semantic_hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round((self.exact_hits + self.semantic_hits) / lookups, 4) if lookups else 0.0,
+            }
+
+    @staticmethod
+    def _unit(embedding: Sequence[float]) -> np.ndarray:
+        v = np.asarray(embedding, dtype=np.float32)
+        norm = float(np.linalg.norm(v))
+        return v / norm if norm else v
+
+    def _live(self, key: Tuple[str, str], now: float, touch: bool = True) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is None:
+            return None
+        if entry["expires"] < now:
+            self._drop(key)
+            return None
+        if touch:
+            self._entries.move_to_end(key)
+        return entry
+
+    def _nearest(self, doc_id: str, vector: np.ndarray, now: float) -> Tuple[Optional[Tuple[str, str]], float]:
+        candidates = []
+        for key in list(self._by_doc.get(doc_id, ())):
+            entry = self._live(key, now, touch=False)
+            if entry is not None and entry["vector"] is not None:
+                candidates.append((key, entry["vector"]))
+        if not candidates:
+            return None, 0.0
+        scores = np.stack([v for _, v in candidates]) @ vector
+        best = int(np.argmax(scores))
+        return candidates[best][0], float(scores[best])
+
+    def _drop(self, key: Tuple[str, str]) -> None:
+        if self._entries.pop(key, None) is not None:
+            keys = self._by_doc.get(key[0])
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_doc[key[0]]
@@ -1,5 +1,5 @@
 from pydantic import BaseModel, Field
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Literal, Optional
 from datetime import datetime
 
 class DocumentUploadResponse(BaseModel):
@@ -12,19 +12,81 @@ class DocumentUploadResponse(BaseModel):
     file_type: str
     summary: str
 
+class UploadJobResponse(BaseModel):
+    status: str
+    message: str
+    job_id: str
+    document_id: str
+    filename: str
+
+class JobStatusResponse(BaseModel):
+    job_id: str
+    document_id: str
+    filename: str
+    status: str
+    progress: float
+    message: str
+    error: Optional[str] = None
+    result: Optional[DocumentUploadResponse] = None
+    created_at: datetime
+    updated_at: datetime
+
 class QuestionRequest(BaseModel):
     document_id: str
     question: str
     conversation_history: Optional[List[Dict]] = []
+    max_context_tokens: Optional[int] = Field(None, gt=0)
+    retrieval_mode: Optional[Literal["auto", "hybrid", "vector", "lexical"]] = None
+    # Server-side history from POST /sessions; conversation_history is ignored when set
+    session_id: Optional[str] = None
 
 class QuestionResponse(BaseModel):
     answer: str
     justification: str
     snippet: str
+    snippet_location: Optional[Dict[str, int]] = None
+    status: str
+    citations: List[Dict[str, Any]] = []
+    cached: bool = False
+    timestamp: datetime = Field(default_factory=datetime.now)
+
+class BatchQuestionRequest(BaseModel):
+    document_id: str
+    questions: List[str] = Field(..., min_length=1)
+    max_context_tokens: Optional[int] = Field(None, gt=0)
+    retrieval_mode: Optional[Literal["auto", "hybrid", "vector", "lexical"]] = None
+
+class BatchAnswer(BaseModel):
+    question: str
     status: str
+    answer: Optional[str] = None
+    snippet: str = ""
+    snippet_location: Optional[Dict[str, int]] = None
+    citations: List[Dict[str, Any]] = []
+    cached: bool = False
+    error: Optional[str] = None
+
+class BatchQuestionResponse(BaseModel):
+    document_id: str
+    status: str
+    results: List[BatchAnswer]
+    llm_calls: int
     timestamp: datetime = Field(default_factory=datetime.now)
 
+class CollectionCreateRequest(BaseModel):
+    name: str = Field(..., min_length=1)
+    document_ids: List[str] = []
+
+class CollectionDocumentsRequest(BaseModel):
+    document_ids: List[str] = Field(..., min_length=1)
+
+class CollectionQuestionRequest(BaseModel):
+    question: str
+    conversation_history: Optional[List[Dict]] = []
+    max_context_tokens: Optional[int] = Field(None, gt=0)
+
 class ChallengeQuestion(BaseModel):
+    challenge_id: Optional[str] = None
     question: str
     correct_answer: str
     explanation: str
@@ -41,7 +103,8 @@ class ChallengeQuestionsResponse(BaseModel):
 
 class EvaluateAnswerRequest(BaseModel):
     document_id: str
-    challenge_index: int
+    challenge_id: Optional[str] = None
+    challenge_index: Optional[int] = None
     user_answer: str
 
 class EvaluateAnswerResponse(BaseModel):
@@ -71,6 +134,9 @@ class HealthResponse(BaseModel):
     timestamp: datetime = Field(default_factory=datetime.now)
     version: str = "1.0.0"
 
+class SessionCreateRequest(BaseModel):
+    document_id: str
+
 class ConversationEntry(BaseModel):
     question: str
     answer: str
@@ -81,7 +147,10 @@ class SessionData(BaseModel):
     session_id: str
     document_id: Optional[str] = None
     document_info: Optional[DocumentInfo] = None
+    # Rolling summary of the turns no longer quoted verbatim, recent turns, and turns waiting to be folded in
+    summary: str = ""
     conversation_history: List[ConversationEntry] = []
+    unsummarized: List[ConversationEntry] = []
     challenge_questions: List[ChallengeQuestion] = []
     created_at: datetime = Field(default_factory=datetime.now)
     last_activity: datetime = Field(default_factory=datetime.now)
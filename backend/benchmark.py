@@ -0,0 +1,409 @@
+"""
+Offline benchmark of the ingest and query paths.
+
+Runs the FastAPI app in-process over httpx's ASGI transport with the stub
+LLM backend and hashed embeddings, so nothing touches the network. Builds a
+synthetic PDF/TXT/DOCX corpus, uploads it, then drives /ask and /challenges
+with concurrent clients. Results are written as JSON and can be compared
+against an earlier run:
+
+    cd backend
+    python benchmark.py --pages 50 --docs 2 --out baseline.json
+    python benchmark.py --pages 50 --docs 2 --compare baseline.json
+"""
+import argparse
+import asyncio
+import io
+import json
+import os
+import platform
+import random
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+# Metrics where a larger value is an improvement; every other numeric metric is "lower is better"
+HIGHER_IS_BETTER = ("throughput", "per_second", "hit_rate", "recall", "reduction")
+
+
+# ---------------- SYNTHETIC CORPUS ----------------
+
+def make_vocabulary(rng: random.Random, size: int = 4000) -> List[str]:
+    letters = "abcdefghijklmnopqrstuvwxyz"
+    return ["".join(rng.choice(letters) for _ in range(rng.randint(3, 10))) for _ in range(size)]
+
+
+def make_pages(rng: random.Random, vocabulary: List[str], pages: int, words_per_page: int) -> List[str]:
+    result = []
+    for _ in range(pages):
+        sentences, count = [], 0
+        while count < words_per_page:
+            length = rng.randint(8, 20)
+            sentences.append(" ".join(rng.choice(vocabulary) for _ in range(length)).capitalize() + ".")
+            count += length
+        result.append(" ".join(sentences))
+    return result
+
+
+def make_pdf(pages: List[str]) -> bytes:
+    """Minimal PDF with one Helvetica text stream per page, no external dependency"""
+    n = len(pages)
+    font_id = 3 + 2 * n
+    objects = [b"<< /Type /Catalog /Pages 2 0 R >>",
+               f"<< /Type /Pages /Kids [{' '.join(f'{3 + 2 * i} 0 R' for i in range(n))}] /Count {n} >>".encode()]
+    for i, text in enumerate(pages):
+        lines = [text[j:j + 90] for j in range(0, len(text), 90)]
+        escaped = (line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)") for line in lines)
+        content = ("BT /F1 9 Tf 30 810 Td 11 TL " + " ".join(f"({line}) '" for line in escaped) + " ET").encode("latin-1")
+        objects.append(f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 612 842] "
+                       f"/Resources << /Font << /F1 {font_id} 0 R >> >> /Contents {4 + 2 * i} 0 R >>".encode())
+        objects.append(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+    objects.append(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref)
+    return bytes(out)
+
+
+def make_txt(pages: List[str]) -> bytes:
+    return "\f".join(pages).encode("utf-8")
+
+
+def make_docx(pages: List[str]) -> bytes:
+    import docx
+
+    document = docx.Document()
+    for text in pages:
+        document.add_paragraph(text)
+    buffer = io.BytesIO()
+    document.save(buffer)
+    return buffer.getvalue()
+
+
+BUILDERS: Dict[str, Callable[[List[str]], bytes]] = {"pdf": make_pdf, "txt": make_txt, "docx": make_docx}
+
+
+def build_corpus(formats: List[str], docs: int, pages: int, words_per_page: int,
+                 seed: int) -> Tuple[List[Tuple[str, bytes, int]], List[str]]:
+    """[(filename, bytes, pages)] plus the vocabulary, identical for identical arguments"""
+    rng = random.Random(seed)
+    vocabulary = make_vocabulary(rng)
+    corpus = []
+    for fmt in formats:
+        for i in range(docs):
+            corpus.append((f"bench_{fmt}_{i}.{fmt}", BUILDERS[fmt](make_pages(rng, vocabulary, pages, words_per_page)),
+                           pages))
+    return corpus, vocabulary
+
+
+# ---------------- MEASUREMENT ----------------
+
+def percentiles(samples: List[float]) -> Dict[str, float]:
+    if not samples:
+        return {"count": 0}
+    ordered = sorted(samples)
+
+    def at(q: float) -> float:
+        return round(ordered[min(len(ordered) - 1, int(q * len(ordered)))] * 1000, 3)
+
+    return {"count": len(ordered), "p50_ms": at(0.50), "p95_ms": at(0.95), "p99_ms": at(0.99),
+            "max_ms": round(ordered[-1] * 1000, 3), "mean_ms": round(sum(ordered) / len(ordered) * 1000, 3)}
+
+
+def peak_rss_mb() -> Dict[str, float]:
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == "darwin" else 1024
+    return {"self_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / scale, 1),
+            "children_mb": round(resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss / scale, 1)}
+
+
+def dir_bytes(path: Path) -> int:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) if path.exists() else 0
+
+
+def git_commit() -> Optional[str]:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              check=True, cwd=Path(__file__).parent).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+async def run_concurrently(requests: List[Callable[[], Any]], concurrency: int) -> Tuple[List[float], int]:
+    """Run request coroutine factories with at most `concurrency` in flight; returns latencies and error count"""
+    latencies: List[float] = []
+    errors = 0
+    pending = iter(requests)
+
+    async def worker():
+        nonlocal errors
+        for request in pending:
+            started = time.perf_counter()
+            response = await request()
+            latencies.append(time.perf_counter() - started)
+            if response.status_code >= 400:
+                errors += 1
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies, errors
+
+
+# ---------------- BENCHMARK ----------------
+
+async def benchmark(args: argparse.Namespace) -> Dict[str, Any]:
+    import httpx
+    import main
+    from config import DATA_DIR
+
+    corpus, vocabulary = build_corpus(args.formats, args.docs, args.pages, args.words_per_page, args.seed)
+    rng = random.Random(args.seed + 1)
+    results: Dict[str, Any] = {}
+
+    await main.app.router.startup()
+    try:
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=None) as client:
+            # Ingestion: one document at a time so per-document timings are not mixed up
+            uploads, doc_ids = [], []
+            for filename, data, pages in corpus:
+                started = time.perf_counter()
+                job = (await client.post("/upload", files={"file": (filename, data)})).json()
+                while job["status"] not in ("ready", "failed"):
+                    await asyncio.sleep(0.01)
+                    job = (await client.get(f"/jobs/{job['job_id']}")).json()
+                elapsed = time.perf_counter() - started
+                if job["status"] != "ready":
+                    raise RuntimeError(f"Ingestion of {filename} failed: {job.get('error')}")
+                doc_ids.append(job["document_id"])
+                meta = main.store.read_meta(job["document_id"])
+                uploads.append({"file": filename, "bytes": len(data), "pages": pages, "seconds": elapsed,
+                                "chunks": meta["chunk_count"], "timings": meta.get("timings", {})})
+
+            by_format: Dict[str, Any] = {}
+            for fmt in args.formats:
+                rows = [u for u in uploads if u["file"].endswith("." + fmt)]
+                seconds = sum(u["seconds"] for u in rows)
+                stages: Dict[str, float] = {}
+                for u in rows:
+                    for stage, value in u["timings"].items():
+                        stages[stage] = round(stages.get(stage, 0.0) + value, 4)
+                by_format[fmt] = {
+                    "documents": len(rows),
+                    "seconds": round(seconds, 4),
+                    "pages_per_second": round(sum(u["pages"] for u in rows) / seconds, 2),
+                    "mb_per_second": round(sum(u["bytes"] for u in rows) / seconds / 1e6, 3),
+                    "chunks": sum(u["chunks"] for u in rows),
+                    "stage_seconds": stages,
+                }
+            results["ingest"] = by_format
+
+            # Vector storage: resident size against float32, and how often the compact scan plus
+            # re-scoring returns the same top 10 as an exact float32 scan
+            from embeddings import get_embeddings
+            from vector_index import VectorIndex
+            questions = [f"What is {' '.join(rng.choice(vocabulary) for _ in range(6))}?"
+                         for _ in range(args.recall_queries)]
+            query_vectors = get_embeddings().embed_documents(questions) if questions else []
+            resident = float32_resident = vector = float32_vector = 0
+            recalls = []
+            for doc_id in doc_ids:
+                index = main.get_index(doc_id)
+                exact_index = VectorIndex(index.path, storage="float32")
+                resident += index.resident_bytes()
+                float32_resident += exact_index.resident_bytes()
+                vector += index.vector_bytes()
+                float32_vector += exact_index.vector_bytes()
+                if query_vectors:
+                    found = index.search_by_vectors(query_vectors, 10)
+                    exact = index.search_by_vectors(query_vectors, 10, exact=True)
+                    recalls += [len({i for i, _ in a} & {i for i, _ in b}) / max(1, len(b))
+                                for a, b in zip(found, exact)]
+            results["vectors"] = {
+                "storage": args.vector_storage,
+                "resident_bytes": resident,
+                "float32_resident_bytes": float32_resident,
+                "memory_reduction": round(float32_resident / max(1, resident), 2),
+                "vector_bytes": vector,
+                "float32_vector_bytes": float32_vector,
+                "vector_memory_reduction": round(float32_vector / max(1, vector), 2),
+                "recall_at_10": round(sum(recalls) / len(recalls), 4) if recalls else None,
+            }
+
+            # /ask: unique questions so the answer cache does not flatter the numbers
+            def ask(i: int):
+                doc_id = doc_ids[i % len(doc_ids)]
+                words = " ".join(rng.choice(vocabulary) for _ in range(6))
+                return lambda: client.post("/ask", json={"document_id": doc_id, "question": f"What is {words} ({i})?"})
+
+            started = time.perf_counter()
+            latencies, errors = await run_concurrently([ask(i) for i in range(args.queries)], args.concurrency)
+            results["ask"] = {**percentiles(latencies), "errors": errors,
+                              "throughput_rps": round(len(latencies) / (time.perf_counter() - started), 2)}
+
+            # /ask/batch: the same number of fresh questions, sent per document in batches
+            if args.batch_size:
+                batches = []
+                for start in range(0, args.queries, args.batch_size):
+                    doc_id = doc_ids[(start // args.batch_size) % len(doc_ids)]
+                    questions = [f"What is {' '.join(rng.choice(vocabulary) for _ in range(6))} ({i})?"
+                                 for i in range(start, min(start + args.batch_size, args.queries))]
+                    batches.append(lambda d=doc_id, q=questions: client.post(
+                        "/ask/batch", json={"document_id": d, "questions": q}))
+                started = time.perf_counter()
+                latencies, errors = await run_concurrently(batches, args.concurrency)
+                results["ask_batch"] = {**percentiles(latencies), "errors": errors,
+                                        "questions_per_second": round(args.queries / (time.perf_counter() - started), 2)}
+
+            # /challenges: first call per document generates and stores the set, later calls read it back
+            cold = []
+            for doc_id in doc_ids:
+                started = time.perf_counter()
+                await client.get("/challenges", params={"document_id": doc_id, "count": args.challenges})
+                cold.append(time.perf_counter() - started)
+            results["challenges_cold"] = percentiles(cold)
+            started = time.perf_counter()
+            latencies, errors = await run_concurrently(
+                [lambda i=i: client.get("/challenges", params={"document_id": doc_ids[i % len(doc_ids)],
+                                                                "count": args.challenges})
+                 for i in range(args.queries)], args.concurrency)
+            results["challenges"] = {**percentiles(latencies), "errors": errors,
+                                     "throughput_rps": round(len(latencies) / (time.perf_counter() - started), 2)}
+
+            stats = (await client.get("/cache/stats")).json()
+            results["cache"] = {name: {k: v for k, v in value.items() if isinstance(v, (int, float))}
+                                for name, value in stats.items()}
+    finally:
+        await main.app.router.shutdown()
+
+    results["disk"] = {
+        "index_bytes": sum(dir_bytes(main.store.index_path(d)) for d in doc_ids),
+        "data_dir_bytes": dir_bytes(DATA_DIR),
+    }
+    results["peak_rss"] = peak_rss_mb()
+    return results
+
+
+# ---------------- BASELINES ----------------
+
+def flatten(data: Dict[str, Any], prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in data.items():
+        name = f"{prefix}.{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, name))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], tolerance: float) -> List[Dict[str, Any]]:
+    """Per-metric change against a baseline; a change worse than `tolerance` (fraction) is a regression"""
+    now, before = flatten(current["results"]), flatten(baseline["results"])
+    rows = []
+    for name in sorted(now.keys() & before.keys()):
+        # Counts describe the workload, not its performance
+        if name.rsplit(".", 1)[-1] in ("count", "documents", "chunks", "errors", "entries") or not before[name]:
+            continue
+        change = (now[name] - before[name]) / abs(before[name])
+        worse = -change if any(tag in name for tag in HIGHER_IS_BETTER) else change
+        rows.append({"metric": name, "baseline": before[name], "current": now[name],
+                     "change": round(change, 4), "regression": worse > tolerance})
+    return rows
+
+
+def print_report(report: Dict[str, Any], comparison: Optional[List[Dict[str, Any]]]) -> None:
+    print(json.dumps(report["results"], indent=2))
+    if comparison is None:
+        return
+    print(f"\n{'metric':<48} {'baseline':>12} {'current':>12} {'change':>8}")
+    for row in comparison:
+        flag = "  REGRESSION" if row["regression"] else ""
+        print(f"{row['metric']:<48} {row['baseline']:>12.3f} {row['current']:>12.3f} {row['change']:>+8.1%}{flag}")
+
+
+def parse_args(argv: Optional[List[str]] = None) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--formats", default="pdf,txt,docx", type=lambda s: [f.strip() for f in s.split(",") if f],
+                        help="comma-separated corpus formats (pdf, txt, docx)")
+    parser.add_argument("--docs", type=int, default=2, help="documents per format")
+    parser.add_argument("--pages", type=int, default=40, help="pages per document")
+    parser.add_argument("--words-per-page", type=int, default=400)
+    parser.add_argument("--queries", type=int, default=200, help="requests per query benchmark")
+    parser.add_argument("--concurrency", type=int, default=16, help="concurrent clients")
+    parser.add_argument("--batch-size", type=int, default=32, help="questions per /ask/batch request, 0 skips it")
+    parser.add_argument("--challenges", type=int, default=3, help="challenges per /challenges request")
+    parser.add_argument("--llm-latency", type=float, default=0.05, help="stub LLM latency in seconds")
+    parser.add_argument("--embed-backend", default="hash",
+                        help="embedding backend; anything but 'hash' needs the model available locally")
+    parser.add_argument("--vector-storage", default="float32", choices=("float32", "float16", "int8"),
+                        help="vectors scanned at query time (VECTOR_STORAGE)")
+    parser.add_argument("--recall-queries", type=int, default=50,
+                        help="queries used to measure recall of compact vector storage against float32")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--data-dir", help="where to store documents (default: a fresh temporary directory)")
+    parser.add_argument("--out", help="write the report as JSON to this file")
+    parser.add_argument("--compare", help="baseline JSON report to compare against")
+    parser.add_argument("--tolerance", type=float, default=0.10, help="allowed relative change before flagging")
+    parser.add_argument("--fail-on-regression", action="store_true", help="exit with status 1 on any regression")
+    args = parser.parse_args(argv)
+    unknown = set(args.formats) - set(BUILDERS)
+    if unknown:
+        parser.error(f"unknown formats: {', '.join(sorted(unknown))}")
+    return args
+
+
+def main_cli(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="bench-")
+    # Settings are read at import time, so they must be in place before the app is imported
+    os.environ.update({
+        "LLM_BACKEND": "stub",
+        "STUB_LLM_LATENCY": str(args.llm_latency),
+        "EMBED_BACKEND": args.embed_backend,
+        "EMBED_WARMUP": "false",
+        "VECTOR_STORAGE": args.vector_storage,
+        "DATA_DIR": data_dir,
+    })
+    sys.path.insert(0, str(Path(__file__).parent))
+    results = asyncio.run(benchmark(args))
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpus": os.cpu_count(),
+            "params": {k: v for k, v in vars(args).items() if k not in ("out", "compare", "data_dir")},
+        },
+        "results": results,
+    }
+    comparison = None
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text(encoding="utf-8"))
+        if baseline["meta"]["params"] != report["meta"]["params"]:
+            print("warning: baseline was recorded with different parameters", file=sys.stderr)
+        comparison = compare(report, baseline, args.tolerance)
+        report["comparison"] = {"baseline": args.compare, "tolerance": args.tolerance, "metrics": comparison}
+    print_report(report, comparison)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2), encoding="utf-8")
+        print(f"\nreport written to {args.out}")
+    if args.fail_on_regression and comparison and any(row["regression"] for row in comparison):
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main_cli())
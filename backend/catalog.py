@@ -0,0 +1,401 @@
+import json
+import sqlite3
+import threading
+import logging
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from config import DATA_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+DOCUMENT_FIELDS = ("doc_id", "filename", "file_type", "word_count", "char_count", "page_count",
+                   "chunk_count", "summary", "index_path", "status", "upload_timestamp")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    doc_id TEXT PRIMARY KEY,
+    filename TEXT NOT NULL,
+    file_type TEXT NOT NULL,
+    word_count INTEGER NOT NULL DEFAULT 0,
+    char_count INTEGER NOT NULL DEFAULT 0,
+    page_count INTEGER NOT NULL DEFAULT 0,
+    chunk_count INTEGER NOT NULL DEFAULT 0,
+    summary TEXT NOT NULL DEFAULT '',
+    index_path TEXT NOT NULL,
+    status TEXT NOT NULL DEFAULT 'ready',
+    upload_timestamp TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS jobs (
+    job_id TEXT PRIMARY KEY,
+    document_id TEXT NOT NULL,
+    status TEXT NOT NULL,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS jobs_document ON jobs (document_id, status);
+CREATE TABLE IF NOT EXISTS challenges (
+    challenge_id TEXT PRIMARY KEY,
+    doc_id TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    chunk INTEGER NOT NULL,
+    question TEXT NOT NULL,
+    correct_answer TEXT NOT NULL,
+    explanation TEXT NOT NULL DEFAULT '',
+    difficulty TEXT NOT NULL DEFAULT 'medium',
+    created_at TEXT NOT NULL
+);
+CREATE UNIQUE INDEX IF NOT EXISTS challenges_document ON challenges (doc_id, position);
+CREATE TABLE IF NOT EXISTS collections (
+    collection_id TEXT PRIMARY KEY,
+    name TEXT NOT NULL,
+    generation INTEGER NOT NULL DEFAULT 0,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS collection_documents (
+    collection_id TEXT NOT NULL,
+    doc_id TEXT NOT NULL,
+    added_at TEXT NOT NULL,
+    PRIMARY KEY (collection_id, doc_id)
+);
+CREATE INDEX IF NOT EXISTS collection_documents_doc ON collection_documents (doc_id);
+CREATE TABLE IF NOT EXISTS summaries (
+    doc_id TEXT PRIMARY KEY,
+    status TEXT NOT NULL,
+    error TEXT,
+    updated_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS summary_parts (
+    key TEXT PRIMARY KEY,
+    summary TEXT NOT NULL,
+    created_at TEXT NOT NULL
+);
+CREATE TABLE IF NOT EXISTS sessions (
+    session_id TEXT PRIMARY KEY,
+    document_id TEXT,
+    version INTEGER NOT NULL DEFAULT 0,
+    data TEXT NOT NULL,
+    updated_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS sessions_updated ON sessions (updated_at);
+CREATE INDEX IF NOT EXISTS sessions_document ON sessions (document_id);
+CREATE TABLE IF NOT EXISTS access_log (
+    doc_id TEXT NOT NULL,
+    hour TEXT NOT NULL,
+    hits INTEGER NOT NULL DEFAULT 0,
+    PRIMARY KEY (doc_id, hour)
+);
+CREATE INDEX IF NOT EXISTS access_log_hour ON access_log (hour);
+"""
+
+
+class DocumentCatalog:
+    """
+    SQLite-backed catalog of documents, ingestion jobs and conversation
+    sessions. WAL mode lets every uvicorn worker process read and write the
+    same file, so any worker can serve any document, session or job.
+    """
+
+    def __init__(self, path: Path = DATA_DIR / "catalog.sqlite"):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        # One connection per thread: sqlite3 connections must not be shared across threads
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(str(self.path), timeout=30)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    # ---------------- documents ----------------
+
+    def upsert(self, meta: Dict[str, Any], index_path: Path, status: str = "ready") -> None:
+        row = {field: meta.get(field) for field in DOCUMENT_FIELDS}
+        row.update(index_path=str(index_path), status=status)
+        row["upload_timestamp"] = str(row["upload_timestamp"] or datetime.now().isoformat())
+        for field in ("word_count", "char_count", "page_count", "chunk_count"):
+            row[field] = row[field] or 0
+        row["summary"] = row["summary"] or ""
+        with self._conn() as conn:
+            conn.execute(
+                f"INSERT OR REPLACE INTO documents ({', '.join(DOCUMENT_FIELDS)}) "
+                f"VALUES ({', '.join(':' + f for f in DOCUMENT_FIELDS)})", row
+            )
+
+    def get(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM documents WHERE doc_id = ?", (doc_id,)).fetchone()
+        return self._document(row) if row else None
+
+    def __contains__(self, doc_id: str) -> bool:
+        return self._conn().execute("SELECT 1 FROM documents WHERE doc_id = ?", (doc_id,)).fetchone() is not None
+
+    def list(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute("SELECT * FROM documents ORDER BY upload_timestamp DESC").fetchall()
+        return [self._document(r) for r in rows]
+
+    def delete(self, doc_id: str) -> bool:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM challenges WHERE doc_id = ?", (doc_id,))
+            conn.execute("DELETE FROM summaries WHERE doc_id = ?", (doc_id,))
+            conn.execute("DELETE FROM sessions WHERE document_id = ?", (doc_id,))
+            conn.execute("DELETE FROM access_log WHERE doc_id = ?", (doc_id,))
+            return conn.execute("DELETE FROM documents WHERE doc_id = ?", (doc_id,)).rowcount > 0
+
+    def rebuild_from_store(self, store) -> int:
+        """Register every fully ingested document found on disk that the catalog does not know yet"""
+        added = 0
+        for doc_dir in sorted(p for p in store.root.iterdir() if p.is_dir()):
+            doc_id = doc_dir.name
+            if doc_id in self or not store.is_ready(doc_id):
+                continue
+            self.upsert(store.read_meta(doc_id), store.index_path(doc_id))
+            added += 1
+        if added:
+            logger.info(f"Catalog restored {added} documents from {store.root}")
+        return added
+
+    @staticmethod
+    def _document(row: sqlite3.Row) -> Dict[str, Any]:
+        doc = dict(row)
+        doc["upload_timestamp"] = datetime.fromisoformat(doc["upload_timestamp"])
+        return doc
+
+    # ---------------- challenges ----------------
+
+    def add_challenges(self, doc_id: str, challenges: List[Dict[str, Any]]) -> None:
+        """Store challenges by position; an existing challenge at the same position is kept"""
+        now = datetime.now().isoformat()
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO challenges (challenge_id, doc_id, position, chunk, question, correct_answer, "
+                "explanation, difficulty, created_at) VALUES (:challenge_id, :doc_id, :position, :chunk, :question, "
+                ":correct_answer, :explanation, :difficulty, :created_at)",
+                [{"explanation": "", "difficulty": "medium", **c, "doc_id": doc_id, "created_at": now}
+                 for c in challenges]
+            )
+
+    def delete_challenges(self, doc_id: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM challenges WHERE doc_id = ?", (doc_id,))
+
+    def list_challenges(self, doc_id: str, limit: int = -1) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT * FROM challenges WHERE doc_id = ? ORDER BY position LIMIT ?", (doc_id, limit)
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def get_challenge(self, challenge_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM challenges WHERE challenge_id = ?", (challenge_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_challenge_at(self, doc_id: str, position: int) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT * FROM challenges WHERE doc_id = ? AND position = ?", (doc_id, position)
+        ).fetchone()
+        return dict(row) if row else None
+
+    # ---------------- summaries ----------------
+
+    def set_summary_status(self, doc_id: str, status: str, summary: Optional[str] = None,
+                           error: Optional[str] = None) -> None:
+        """Record the background summary's state; a finished `summary` replaces the document's quick one"""
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO summaries (doc_id, status, error, updated_at) VALUES (?, ?, ?, ?)",
+                         (doc_id, status, error, datetime.now().isoformat()))
+            if summary is not None:
+                conn.execute("UPDATE documents SET summary = ? WHERE doc_id = ?", (summary, doc_id))
+
+    def get_summary_status(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT * FROM summaries WHERE doc_id = ?", (doc_id,)).fetchone()
+        return dict(row) if row else None
+
+    def get_summary_parts(self, keys: List[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        # Stay below SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            part = keys[i:i + 500]
+            rows = self._conn().execute(
+                f"SELECT key, summary FROM summary_parts WHERE key IN ({', '.join('?' * len(part))})", part
+            ).fetchall()
+            found.update((r["key"], r["summary"]) for r in rows)
+        return found
+
+    def put_summary_part(self, key: str, summary: str) -> None:
+        with self._conn() as conn:
+            conn.execute("INSERT OR REPLACE INTO summary_parts (key, summary, created_at) VALUES (?, ?, ?)",
+                         (key, summary, datetime.now().isoformat()))
+
+    # ---------------- collections ----------------
+
+    def create_collection(self, collection_id: str, name: str) -> None:
+        with self._conn() as conn:
+            conn.execute("INSERT INTO collections (collection_id, name, created_at) VALUES (?, ?, ?)",
+                         (collection_id, name, datetime.now().isoformat()))
+
+    def get_collection(self, collection_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT c.*, COUNT(d.doc_id) AS document_count FROM collections c "
+            "LEFT JOIN collection_documents d ON d.collection_id = c.collection_id "
+            "WHERE c.collection_id = ? GROUP BY c.collection_id", (collection_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def list_collections(self) -> List[Dict[str, Any]]:
+        rows = self._conn().execute(
+            "SELECT c.*, COUNT(d.doc_id) AS document_count FROM collections c "
+            "LEFT JOIN collection_documents d ON d.collection_id = c.collection_id "
+            "GROUP BY c.collection_id ORDER BY c.created_at DESC"
+        ).fetchall()
+        return [dict(r) for r in rows]
+
+    def delete_collection(self, collection_id: str) -> bool:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM collection_documents WHERE collection_id = ?", (collection_id,))
+            return conn.execute("DELETE FROM collections WHERE collection_id = ?", (collection_id,)).rowcount > 0
+
+    def add_collection_documents(self, collection_id: str, doc_ids: List[str]) -> None:
+        """Record members and bump the generation, which tells other processes to reopen the index"""
+        now = datetime.now().isoformat()
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT OR IGNORE INTO collection_documents (collection_id, doc_id, added_at) VALUES (?, ?, ?)",
+                [(collection_id, doc_id, now) for doc_id in doc_ids]
+            )
+            conn.execute("UPDATE collections SET generation = generation + 1 WHERE collection_id = ?",
+                         (collection_id,))
+
+    def remove_collection_document(self, collection_id: str, doc_id: str) -> bool:
+        with self._conn() as conn:
+            removed = conn.execute("DELETE FROM collection_documents WHERE collection_id = ? AND doc_id = ?",
+                                   (collection_id, doc_id)).rowcount > 0
+            conn.execute("UPDATE collections SET generation = generation + 1 WHERE collection_id = ?",
+                         (collection_id,))
+            return removed
+
+    def collection_documents(self, collection_id: str) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT doc_id FROM collection_documents WHERE collection_id = ? ORDER BY added_at", (collection_id,)
+        ).fetchall()
+        return [r["doc_id"] for r in rows]
+
+    def collections_of(self, doc_id: str) -> List[str]:
+        rows = self._conn().execute(
+            "SELECT collection_id FROM collection_documents WHERE doc_id = ?", (doc_id,)
+        ).fetchall()
+        return [r["collection_id"] for r in rows]
+
+    # ---------------- sessions ----------------
+
+    def save_session(self, session_id: str, document_id: Optional[str], data: str, updated_at: str) -> int:
+        """Insert or replace a session; returns its new version"""
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT INTO sessions (session_id, document_id, version, data, updated_at) VALUES (?, ?, 1, ?, ?) "
+                "ON CONFLICT (session_id) DO UPDATE SET data = excluded.data, updated_at = excluded.updated_at, "
+                "version = version + 1", (session_id, document_id, data, updated_at)
+            )
+            row = conn.execute("SELECT version FROM sessions WHERE session_id = ?", (session_id,)).fetchone()
+        return row["version"]
+
+    def load_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute(
+            "SELECT version, data, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def session_version(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Version and last update of a session without its data, to validate an in-memory copy"""
+        row = self._conn().execute(
+            "SELECT version, updated_at FROM sessions WHERE session_id = ?", (session_id,)
+        ).fetchone()
+        return dict(row) if row else None
+
+    def delete_session(self, session_id: str) -> bool:
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM sessions WHERE session_id = ?", (session_id,)).rowcount > 0
+
+    def prune_sessions(self, before: str) -> int:
+        with self._conn() as conn:
+            return conn.execute("DELETE FROM sessions WHERE updated_at < ?", (before,)).rowcount
+
+    # ---------------- access log ----------------
+
+    def record_access(self, counts: Dict[str, int], hour: str) -> None:
+        with self._conn() as conn:
+            conn.executemany(
+                "INSERT INTO access_log (doc_id, hour, hits) VALUES (?, ?, ?) "
+                "ON CONFLICT (doc_id, hour) DO UPDATE SET hits = hits + excluded.hits",
+                [(doc_id, hour, hits) for doc_id, hits in counts.items()]
+            )
+
+    def hottest_documents(self, since: str, limit: int) -> List[str]:
+        """Ready documents with the most hits since the `since` hour, most hits first"""
+        rows = self._conn().execute(
+            "SELECT a.doc_id FROM access_log a JOIN documents d ON d.doc_id = a.doc_id "
+            "WHERE a.hour >= ? AND d.status = 'ready' GROUP BY a.doc_id ORDER BY SUM(a.hits) DESC LIMIT ?",
+            (since, limit)
+        ).fetchall()
+        return [r["doc_id"] for r in rows]
+
+    def prune_access(self, before: str) -> None:
+        with self._conn() as conn:
+            conn.execute("DELETE FROM access_log WHERE hour < ?", (before,))
+
+    # ---------------- jobs ----------------
+
+    def save_job(self, job: Dict[str, Any]) -> None:
+        with self._conn() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO jobs (job_id, document_id, status, data, updated_at) VALUES (?, ?, ?, ?, ?)",
+                (job["job_id"], job["document_id"], job["status"], json.dumps(job, default=str),
+                 str(job["updated_at"]))
+            )
+
+    def load_job(self, job_id: str) -> Optional[Dict[str, Any]]:
+        row = self._conn().execute("SELECT data FROM jobs WHERE job_id = ?", (job_id,)).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def find_active_job(self, document_id: str, finished: tuple, alive_since: str) -> Optional[Dict[str, Any]]:
+        """Newest unfinished job of the document whose owner touched it at or after `alive_since`"""
+        row = self._conn().execute(
+            f"SELECT data FROM jobs WHERE document_id = ? AND status NOT IN ({', '.join('?' * len(finished))}) "
+            "AND updated_at >= ? ORDER BY updated_at DESC LIMIT 1", (document_id, *finished, alive_since)
+        ).fetchone()
+        return json.loads(row["data"]) if row else None
+
+    def touch_jobs(self, job_ids: List[str], at: str) -> None:
+        with self._conn() as conn:
+            conn.executemany("UPDATE jobs SET updated_at = ? WHERE job_id = ?", [(at, j) for j in job_ids])
+
+    def fail_stale_jobs(self, finished: tuple, before: str, status: str, error: str) -> int:
+        """Mark unfinished jobs not touched since `before` as `status`; returns how many"""
+        with self._conn() as conn:
+            rows = conn.execute(
+                f"SELECT data FROM jobs WHERE status NOT IN ({', '.join('?' * len(finished))}) AND updated_at < ?",
+                (*finished, before)
+            ).fetchall()
+            for row in rows:
+                job = json.loads(row["data"])
+                job.update(status=status, error=error, message="Ingestion interrupted", updated_at=str(datetime.now()))
+                conn.execute("UPDATE jobs SET status = ?, data = ?, updated_at = ? WHERE job_id = ?",
+                             (status, json.dumps(job, default=str), job["updated_at"], job["job_id"]))
+        return len(rows)
+
+    def prune_jobs(self, keep: int, finished: tuple) -> None:
+        """Delete finished jobs beyond the newest `keep`; unfinished ones may still be polled"""
+        marks = ', '.join('?' * len(finished))
+        with self._conn() as conn:
+            conn.execute(
+                f"DELETE FROM jobs WHERE status IN ({marks}) AND job_id NOT IN "
+                f"(SELECT job_id FROM jobs WHERE status IN ({marks}) ORDER BY updated_at DESC LIMIT ?)",
+                (*finished, *finished, keep)
+            )
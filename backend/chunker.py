@@ -0,0 +1,131 @@
+import bisect
+import re
+from typing import Any, Callable, List, NamedTuple, Optional, Tuple
+
+CHUNK_SIZE = 2000
+CHUNK_OVERLAP = 400
+PAGE_SEPARATOR = "\n"
+
+# Whitespace that is not already a lone space or newline, and NUL bytes some PDF extractors leave behind
+_IRREGULAR = re.compile(r"[\s\x00]{2,}|[^\S \n]|\x00")
+# Preferred chunk boundaries, best first: paragraph, line, sentence, word
+_BOUNDARIES = ("\n\n", "\n", ". ", "? ", "! ", " ")
+
+
+def _normalize(match: "re.Match[str]") -> str:
+    run = match.group()
+    newlines = run.count("\n") + run.count("\r") - run.count("\r\n")
+    if newlines:
+        return "\n\n" if newlines > 1 else "\n"
+    return " " if run.strip("\x00") else ""
+
+
+def clean_text(text: str) -> str:
+    """
+    Normalize extracted text in one linear pass: drop NUL bytes, collapse
+    runs of spaces and tabs to one space, line breaks to a single newline
+    and blank lines to one paragraph break.
+    """
+    return _IRREGULAR.sub(_normalize, text).strip()
+
+
+class Span(NamedTuple):
+    """A chunk as offsets into the joined document text: characters, UTF-8 bytes, and its first page"""
+    start: int
+    end: int
+    byte_start: int
+    byte_end: int
+    page: int
+
+
+class Chunker:
+    """
+    Incremental, linear-time splitter over the document text joined page by
+    page. Chunks are at most `chunk_size` characters, end at the best nearby
+    paragraph, line, sentence or word boundary, and overlap the previous
+    chunk by about `chunk_overlap` characters starting at a word.
+
+    Only the text from the start of the next chunk onwards is buffered, and
+    `sink` receives every piece of joined text exactly once, so the stored
+    text and the emitted offsets always agree.
+    """
+
+    def __init__(self, chunk_size: int = CHUNK_SIZE, chunk_overlap: int = CHUNK_OVERLAP,
+                 sink: Optional[Callable[[str], Any]] = None):
+        if not 0 <= chunk_overlap < chunk_size // 2:
+            raise ValueError("chunk_overlap must be smaller than half of chunk_size")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        self.sink = sink
+        self.length = 0         # characters of joined text fed so far
+        self.buffer = ""
+        self.buffer_start = 0   # offsets of buffer[0] in the joined text
+        self.buffer_byte = 0
+        self.page_starts: List[int] = []
+        self.page_numbers: List[int] = []
+
+    def feed(self, page_number: int, text: str) -> List[Tuple[Span, str]]:
+        """Append a page; returns the chunks that can no longer change, with their text"""
+        piece = (PAGE_SEPARATOR if self.length else "") + text
+        self.page_starts.append(self.length + len(piece) - len(text))
+        self.page_numbers.append(page_number)
+        self.length += len(piece)
+        if self.sink is not None:
+            self.sink(piece)
+        self.buffer += piece
+        return self._split(final=False)
+
+    def flush(self) -> List[Tuple[Span, str]]:
+        """Emit the remaining text as the last chunks"""
+        return self._split(final=True)
+
+    def _split(self, final: bool) -> List[Tuple[Span, str]]:
+        buffer, size = self.buffer, self.chunk_size
+        chunks: List[Tuple[Span, str]] = []
+        pos = self._skip_space(buffer, 0)
+        byte_pos = len(buffer[:pos].encode("utf-8"))
+        while pos < len(buffer):
+            # Without more text coming, anything that fits is the last chunk
+            if len(buffer) - pos <= size:
+                if not final:
+                    break
+                end = len(buffer)
+            else:
+                end = self._boundary(buffer, pos, pos + size)
+            text = buffer[pos:end].rstrip()
+            if text:
+                byte_end = byte_pos + len(text.encode("utf-8"))
+                start = self.buffer_start + pos
+                page = self.page_numbers[max(0, bisect.bisect_right(self.page_starts, start) - 1)]
+                chunks.append((Span(start, start + len(text), self.buffer_byte + byte_pos,
+                                    self.buffer_byte + byte_end, page), text))
+            if end >= len(buffer):
+                pos = end
+                break
+            # Overlap: step back from the end, then forward to the next word so no chunk starts mid-word
+            nxt = max(pos + 1, end - self.chunk_overlap)
+            space = buffer.find(" ", nxt, end)
+            nxt = self._skip_space(buffer, space + 1 if space >= 0 else nxt)
+            byte_pos += len(buffer[pos:nxt].encode("utf-8"))
+            pos = nxt
+        # Keep only what the next chunk can still use
+        self.buffer = buffer[pos:]
+        self.buffer_start += pos
+        self.buffer_byte += byte_pos
+        return chunks
+
+    def _boundary(self, buffer: str, start: int, limit: int) -> int:
+        """End of the chunk starting at `start`: the best boundary in the back half of the window"""
+        floor = start + self.chunk_size // 2
+        for sep in _BOUNDARIES:
+            found = buffer.rfind(sep, floor, limit)
+            if found >= 0:
+                # Sentence ends keep their punctuation
+                return found + (1 if sep[0] in ".?!" else 0)
+        return limit
+
+    @staticmethod
+    def _skip_space(buffer: str, pos: int) -> int:
+        while pos < len(buffer) and buffer[pos].isspace():
+            pos += 1
+        return pos
@@ -0,0 +1,444 @@
+import heapq
+import json
+import os
+import shutil
+import threading
+import logging
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Sequence, Tuple
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; writers in one process are still serialized by a thread lock
+    fcntl = None
+
+from config import (
+    DATA_DIR, COLLECTION_SHARD_DOCS, COLLECTION_TRAIN_ROWS, COLLECTION_NPROBE, COLLECTION_SEARCH_THREADS,
+    COLLECTION_COMPACT_RATIO, VECTOR_RESCORE_FACTOR
+)
+from metrics import span
+from vector_index import quantize
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Files of one shard directory. Row files are appended to; rows past the manifest's count are uncommitted
+MANIFEST = "manifest.json"      # members, tombstones, committed row count and list state
+CODES = "codes.i8"              # int8 [rows, dim], vector = code * scale
+SCALES = "scales.f32"           # float32 [rows]
+NORMS = "norms.f32"             # float32 [rows], exact squared L2 norm of each vector
+OWNERS = "owners.i32"           # int32 [rows, 2], (member slot, chunk id in that document's index)
+# Written by each training under the manifest's "train_id", e.g. lists-12.i32, so a retrain never
+# changes files an older manifest points at; shards from before train_id use the bare names
+LISTS = "lists.i32"             # int32 [rows], inverted list of each row, only once trained
+CENTROIDS = "centroids.f32"     # float32 [nlist, dim]
+
+
+def trained_file(name: str, train_id: Optional[int]) -> str:
+    if train_id is None:
+        return name
+    stem, ext = name.split(".")
+    return f"{stem}-{train_id}.{ext}"
+
+KMEANS_ITERATIONS = 8
+KMEANS_MAX_SAMPLE = 16384
+
+_search_pool = ThreadPoolExecutor(max_workers=COLLECTION_SEARCH_THREADS, thread_name_prefix="collection-search")
+
+
+def kmeans(data: np.ndarray, nlist: int, iterations: int = KMEANS_ITERATIONS, seed: int = 0) -> np.ndarray:
+    """Lloyd's k-means; empty clusters are re-seeded from random points"""
+    rng = np.random.default_rng(seed)
+    centroids = data[rng.choice(len(data), nlist, replace=False)].copy()
+    for _ in range(iterations):
+        labels = assign(data, centroids)
+        counts = np.bincount(labels, minlength=nlist)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, labels, data)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = data[rng.choice(len(data), int(empty.sum()), replace=False)]
+    return centroids
+
+
+def assign(data: np.ndarray, centroids: np.ndarray, block: int = 8192) -> np.ndarray:
+    """Nearest centroid of every row, in blocks so the distance matrix stays small"""
+    cc = np.einsum("ij,ij->i", centroids, centroids)
+    labels = np.empty(len(data), dtype=np.int32)
+    for start in range(0, len(data), block):
+        labels[start:start + block] = np.argmin(cc[None, :] - 2.0 * (data[start:start + block] @ centroids.T), axis=1)
+    return labels
+
+
+class ShardView(NamedTuple):
+    """Immutable snapshot of a shard; searches use one view throughout, so writers never disturb them"""
+    codes: np.ndarray
+    scales: np.ndarray
+    norms: np.ndarray
+    owners: np.ndarray
+    members: Tuple[str, ...]
+    live_rows: np.ndarray
+    centroids: np.ndarray
+    list_rows: Tuple[np.ndarray, ...]
+
+    def search(self, query: np.ndarray, qq: float, lists: Optional[Sequence[int]],
+               k: int) -> List[Tuple[float, str, int]]:
+        """(approximate squared L2 distance, doc id, chunk) of the k best live rows of the probed lists"""
+        if lists is None or not self.list_rows:
+            rows = self.live_rows
+        else:
+            rows = np.sort(np.concatenate([self.list_rows[i] for i in lists]))
+        if not len(rows):
+            return []
+        dots = (np.asarray(self.codes[rows], dtype=np.float32) @ query) * self.scales[rows]
+        distances = self.norms[rows] - 2.0 * dots + qq
+        top = np.argpartition(distances, k - 1)[:k] if len(rows) > k else np.arange(len(rows))
+        return [(float(distances[i]), self.members[self.owners[rows[i], 0]], int(self.owners[rows[i], 1]))
+                for i in top]
+
+
+class Shard:
+    """
+    An inverted-file (IVF) index over the vectors of up to
+    `COLLECTION_SHARD_DOCS` documents. Rows are only ever appended: a new
+    document is assigned to the existing lists, a removed one is
+    tombstoned, and the shard alone is rewritten once tombstones pass
+    `COLLECTION_COMPACT_RATIO` of its rows. Lists are (re)trained on the
+    shard's own vectors each time its row count doubles past
+    `COLLECTION_TRAIN_ROWS`; smaller shards are scanned whole.
+
+    Vectors are stored as int8 codes with a per-row scale; the best
+    candidates are re-scored exactly from the documents' own indexes.
+    """
+
+    def __init__(self, path: Path, dim: int = 0):
+        self.path = Path(path)
+        manifest_path = self.path / MANIFEST
+        if manifest_path.exists():
+            self.manifest = json.loads(manifest_path.read_text(encoding="utf-8"))
+        else:
+            self.manifest = {"dim": dim, "rows": 0, "members": [], "deleted": [], "nlist": 0,
+                             "trained_rows": 0, "version": 0}
+        self.dim = self.manifest["dim"]
+        self._open()
+
+    @property
+    def rows(self) -> int:
+        return self.manifest["rows"]
+
+    @property
+    def version(self) -> int:
+        return self.manifest["version"]
+
+    @property
+    def nlist(self) -> int:
+        return self.manifest["nlist"]
+
+    @property
+    def live_members(self) -> List[str]:
+        deleted = set(self.manifest["deleted"])
+        return [doc for slot, doc in enumerate(self.manifest["members"]) if slot not in deleted]
+
+    @property
+    def full(self) -> bool:
+        return len(self.manifest["members"]) >= COLLECTION_SHARD_DOCS
+
+    def _open(self) -> None:
+        rows, dim = self.rows, self.dim
+        if rows:
+            codes = np.memmap(self.path / CODES, dtype=np.int8, mode="r", shape=(rows, dim))
+            scales = np.memmap(self.path / SCALES, dtype=np.float32, mode="r", shape=(rows,))
+            norms = np.memmap(self.path / NORMS, dtype=np.float32, mode="r", shape=(rows,))
+            owners = np.fromfile(self.path / OWNERS, dtype=np.int32, count=rows * 2).reshape(rows, 2)
+        else:
+            codes = np.zeros((0, dim), dtype=np.int8)
+            scales = norms = np.zeros(0, dtype=np.float32)
+            owners = np.zeros((0, 2), dtype=np.int32)
+        live_rows = np.flatnonzero(~np.isin(owners[:, 0], self.manifest["deleted"]))
+        centroids = np.zeros((0, dim), dtype=np.float32)
+        list_rows: Tuple[np.ndarray, ...] = ()
+        if self.nlist:
+            centroids = np.fromfile(self.path / self._trained(CENTROIDS), dtype=np.float32).reshape(self.nlist, dim)
+            lists = np.fromfile(self.path / self._trained(LISTS), dtype=np.int32, count=rows)
+            # Every inverted list is a run of one ordering of the live rows
+            order = live_rows[np.argsort(lists[live_rows], kind="stable")]
+            bounds = np.searchsorted(lists[order], np.arange(self.nlist + 1))
+            list_rows = tuple(order[bounds[i]:bounds[i + 1]] for i in range(self.nlist))
+        self.view = ShardView(codes, scales, norms, owners, tuple(self.manifest["members"]), live_rows,
+                              centroids, list_rows)
+
+    def _trained(self, name: str) -> str:
+        return trained_file(name, self.manifest.get("train_id"))
+
+    def _write_manifest(self) -> None:
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.manifest["version"] += 1
+        tmp = self.path / (MANIFEST + ".tmp")
+        tmp.write_text(json.dumps(self.manifest), encoding="utf-8")
+        os.replace(tmp, self.path / MANIFEST)
+
+    def _vectors(self, rows: np.ndarray) -> np.ndarray:
+        view = self.view
+        return np.asarray(view.codes[rows], dtype=np.float32) * view.scales[rows][:, None]
+
+    def append(self, doc_id: str, vectors: np.ndarray) -> None:
+        """Add one document's chunk vectors; the manifest is written last, so nobody sees half a document"""
+        self.path.mkdir(parents=True, exist_ok=True)
+        rows, count = self.rows, len(vectors)
+        codes, scales = quantize(vectors, "int8")
+        slot = len(self.manifest["members"])
+        parts = [
+            (CODES, codes, self.dim),
+            (SCALES, scales, 4),
+            (NORMS, np.einsum("ij,ij->i", vectors, vectors).astype(np.float32), 4),
+            (OWNERS, np.column_stack((np.full(count, slot), np.arange(count))).astype(np.int32), 8),
+        ]
+        if self.nlist:
+            parts.append((self._trained(LISTS), assign(vectors, self.view.centroids), 4))
+        for name, data, row_bytes in parts:
+            with open(self.path / name, "ab") as f:
+                # Drop whatever an interrupted append left past the committed rows
+                f.truncate(rows * row_bytes)
+                f.write(data.tobytes())
+        self.manifest["rows"] = rows + count
+        self.manifest["members"].append(doc_id)
+        retrained = self.rows >= max(COLLECTION_TRAIN_ROWS, 2 * self.manifest["trained_rows"])
+        if retrained:
+            self._open()
+            self._train()
+        self._write_manifest()
+        self._open()
+        if retrained:
+            self._drop_old_training()
+
+    def _train(self) -> None:
+        live = self.view.live_rows
+        nlist = max(1, min(len(live) // 8, int(4 * np.sqrt(len(live)))))
+        rng = np.random.default_rng(self.rows)
+        sample = live if len(live) <= KMEANS_MAX_SAMPLE else np.sort(rng.choice(live, KMEANS_MAX_SAMPLE, replace=False))
+        with span("collection_train"):
+            centroids = kmeans(self._vectors(sample), nlist).astype(np.float32)
+            lists = np.empty(self.rows, dtype=np.int32)
+            for start in range(0, self.rows, KMEANS_MAX_SAMPLE):
+                block = np.arange(start, min(start + KMEANS_MAX_SAMPLE, self.rows))
+                lists[block] = assign(self._vectors(block), centroids)
+        # New files under the id of the manifest about to be written: until it replaces the current one,
+        # readers and a crash here only ever see the files the current manifest names
+        train_id = self.version + 1
+        centroids.tofile(self.path / trained_file(CENTROIDS, train_id))
+        lists.tofile(self.path / trained_file(LISTS, train_id))
+        self.manifest.update(nlist=nlist, trained_rows=self.rows, previous_train_id=self.manifest.get("train_id"),
+                             train_id=train_id)
+        logger.info(f"Trained {nlist} lists for {self.path} ({self.rows} rows)")
+
+    def _drop_old_training(self) -> None:
+        """Delete list files older than the previous training, which a reader may still be opening"""
+        keep = {self._trained(CENTROIDS), self._trained(LISTS)}
+        previous = self.manifest.get("previous_train_id")
+        keep |= {trained_file(CENTROIDS, previous), trained_file(LISTS, previous)}
+        for pattern in ("centroids*.f32", "lists*.i32"):
+            for path in self.path.glob(pattern):
+                if path.name not in keep:
+                    path.unlink(missing_ok=True)
+
+    def remove(self, doc_id: str) -> bool:
+        deleted = self.manifest["deleted"]
+        slots = [s for s, d in enumerate(self.manifest["members"]) if d == doc_id and s not in deleted]
+        if not slots:
+            return False
+        deleted.extend(slots)
+        dead = self.rows - int(np.count_nonzero(~np.isin(self.view.owners[:, 0], deleted)))
+        if self.rows and dead / self.rows > COLLECTION_COMPACT_RATIO:
+            self._compact()
+        else:
+            self._write_manifest()
+            self._open()
+        return True
+
+    def _compact(self) -> None:
+        """Rewrite this shard without its tombstoned rows next to it, then swap the directories"""
+        staging = self.path.with_name(self.path.name + ".compact")
+        shutil.rmtree(staging, ignore_errors=True)
+        fresh = Shard(staging, self.dim)
+        fresh.manifest["version"] = self.version
+        deleted = set(self.manifest["deleted"])
+        owners = self.view.owners[:, 0]
+        for slot, doc in enumerate(self.manifest["members"]):
+            if slot not in deleted:
+                fresh.append(doc, self._vectors(np.flatnonzero(owners == slot)))
+        fresh._write_manifest()
+        old = self.path.with_name(self.path.name + ".old")
+        # Left by a compaction that stopped after both renames; it would make the first rename fail
+        shutil.rmtree(old, ignore_errors=True)
+        os.replace(self.path, old)
+        os.replace(staging, self.path)
+        shutil.rmtree(old, ignore_errors=True)
+        self.manifest = fresh.manifest
+        self._open()
+        logger.info(f"Compacted {self.path}: {len(self.live_members)} documents, {self.rows} rows")
+
+
+class CollectionIndex:
+    """
+    Approximate nearest-neighbour search across every document of a
+    collection, without loading their indexes:
+
+        <root>/<collection_id>/shard-0000/   first COLLECTION_SHARD_DOCS documents
+        <root>/<collection_id>/shard-0001/   ...
+
+    New documents go to the last shard, so adding or removing one touches
+    a single shard and nothing is rebuilt. A query ranks the centroids of
+    all shards together and scans only the `COLLECTION_NPROBE` closest
+    lists (plus any shard too small to have lists), shards in parallel, so
+    the rows scanned per query stay about the same as the collection grows.
+    """
+
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.mkdir(parents=True, exist_ok=True)
+        self.shards: List[Shard] = []
+        self._lock = threading.Lock()
+        self.refresh()
+
+    @property
+    def dim(self) -> Optional[int]:
+        return self.shards[0].dim if self.shards else None
+
+    def refresh(self) -> None:
+        """Pick up shards written since they were opened, e.g. by another worker process"""
+        for staging in sorted(self.path.glob("shard-*.compact")):
+            # A compaction interrupted between its two renames: the rewritten shard is complete
+            target = staging.with_name(staging.name[:-len(".compact")])
+            if not target.exists() and (staging / MANIFEST).exists():
+                os.replace(staging, target)
+        known = {s.path.name: s for s in self.shards}
+        shards = []
+        for manifest in sorted(self.path.glob("shard-[0-9][0-9][0-9][0-9]/" + MANIFEST)):
+            shard = known.get(manifest.parent.name)
+            if shard is None or json.loads(manifest.read_text(encoding="utf-8"))["version"] != shard.version:
+                shard = Shard(manifest.parent)
+            shards.append(shard)
+        self.shards = shards
+        self._route()
+
+    def _route(self) -> None:
+        """Snapshot the shard views and stack their centroids, so one query ranks every list at once"""
+        views = tuple(s.view for s in self.shards)
+        trained = [(n, v) for n, v in enumerate(views) if v.list_rows]
+        if trained:
+            centroids = np.concatenate([v.centroids for _, v in trained])
+            owner = np.concatenate([np.full(len(v.centroids), n) for n, v in trained])
+            list_id = np.concatenate([np.arange(len(v.centroids)) for _, v in trained])
+        else:
+            centroids, owner, list_id = np.zeros((0, self.dim or 0), dtype=np.float32), np.zeros(0, int), np.zeros(0, int)
+        self._routing = (views, centroids, np.einsum("ij,ij->i", centroids, centroids), owner, list_id)
+
+    @contextmanager
+    def _writing(self):
+        # One writer per collection across threads and, through the lock file, worker processes
+        with self._lock, open(self.path / ".lock", "a") as lock_file:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+            try:
+                self.refresh()
+                yield
+            finally:
+                self._route()
+                if fcntl is not None:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def members(self) -> List[str]:
+        return [doc for shard in self.shards for doc in shard.live_members]
+
+    def add(self, doc_id: str, vectors: np.ndarray) -> bool:
+        """Index one document's chunk vectors; False if it is already a member"""
+        vectors = np.asarray(vectors, dtype=np.float32).reshape(len(vectors), -1)
+        with self._writing():
+            if any(doc_id in shard.live_members for shard in self.shards):
+                return False
+            if self.dim is not None and vectors.shape[1] != self.dim:
+                raise ValueError(f"Vector dimension {vectors.shape[1]} does not match collection dimension {self.dim}")
+            if not self.shards or self.shards[-1].full:
+                self.shards.append(Shard(self.path / f"shard-{len(self.shards):04d}", int(vectors.shape[1])))
+            self.shards[-1].append(doc_id, vectors)
+            return True
+
+    def remove(self, doc_id: str) -> bool:
+        with self._writing():
+            return any([shard.remove(doc_id) for shard in self.shards])
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "documents": sum(len(s.live_members) for s in self.shards),
+            "shards": len(self.shards),
+            "rows": sum(s.rows for s in self.shards),
+            "lists": sum(s.nlist for s in self.shards),
+        }
+
+    def search(self, query: Sequence[float], k: int = 4,
+               open_index: Optional[Callable[[str], Any]] = None,
+               nprobe: int = COLLECTION_NPROBE) -> List[Tuple[str, int, float]]:
+        """
+        (doc id, chunk id, squared L2 distance) of the k nearest chunks,
+        closest first. With `open_index` (doc id -> VectorIndex) the best
+        `VECTOR_RESCORE_FACTOR * k` candidates are re-scored exactly from
+        the documents' float32 vectors.
+        """
+        views, centroids, centroid_norms, owner, list_id = self._routing
+        if not views:
+            return []
+        with span("collection_search"):
+            q = np.asarray(query, dtype=np.float32).reshape(-1)
+            qq = float(q @ q)
+            probes: Dict[int, Optional[List[int]]] = {n: None for n, v in enumerate(views) if not v.list_rows}
+            if len(centroids):
+                scores = centroid_norms - 2.0 * (centroids @ q)
+                for c in np.argpartition(scores, min(nprobe, len(scores)) - 1)[:nprobe]:
+                    probes.setdefault(int(owner[c]), []).append(int(list_id[c]))
+            shortlist = k * max(1, VECTOR_RESCORE_FACTOR) if open_index is not None else k
+            futures = [_search_pool.submit(views[n].search, q, qq, lists, shortlist) for n, lists in probes.items()]
+            hits = heapq.nsmallest(shortlist, (hit for f in futures for hit in f.result()))
+        if open_index is None:
+            return [(doc, chunk, dist) for dist, doc, chunk in hits]
+        with span("collection_rescore"):
+            by_doc: Dict[str, List[int]] = {}
+            for _, doc, chunk in hits:
+                by_doc.setdefault(doc, []).append(chunk)
+            exact = []
+            for doc, chunks in by_doc.items():
+                index = open_index(doc)
+                ids = np.asarray(sorted(chunks))
+                distances = index.norms[ids] - 2.0 * (np.asarray(index.vectors[ids]) @ q) + qq
+                exact.extend((float(d), doc, int(i)) for i, d in zip(ids, distances))
+        return [(doc, chunk, dist) for dist, doc, chunk in heapq.nsmallest(k, exact)]
+
+
+class CollectionStore:
+    """Collection indexes open in this process, refreshed when the catalog shows another process changed them"""
+
+    def __init__(self, root: Path = DATA_DIR / "collections"):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self._open: Dict[str, Tuple[int, CollectionIndex]] = {}
+        self._lock = threading.Lock()
+
+    def get(self, collection_id: str, generation: int = 0) -> CollectionIndex:
+        with self._lock:
+            entry = self._open.get(collection_id)
+            if entry is None:
+                entry = (generation, CollectionIndex(self.root / collection_id))
+            elif entry[0] != generation:
+                entry[1].refresh()
+                entry = (generation, entry[1])
+            self._open[collection_id] = entry
+            return entry[1]
+
+    def delete(self, collection_id: str) -> None:
+        with self._lock:
+            self._open.pop(collection_id, None)
+        shutil.rmtree(self.root / collection_id, ignore_errors=True)
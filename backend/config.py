@@ -6,7 +6,118 @@
 
 
 import os
+from pathlib import Path
 from dotenv import load_dotenv
 
 load_dotenv()
 GEMINI_KEY = os.getenv("GOOGLE_GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
+
+# Storage
+DATA_DIR = Path(os.getenv("DATA_DIR", "data"))
+EMBED_CACHE_ENABLED = os.getenv("EMBED_CACHE_ENABLED", "true").lower() == "true"
+
+# Uploads are streamed to a spool file in UPLOAD_CHUNK_BYTES pieces; larger files, or PDFs with more
+# than UPLOAD_MAX_PAGES pages (0 disables), are rejected with 413
+UPLOAD_MAX_BYTES = int(os.getenv("UPLOAD_MAX_BYTES", str(200 * 1024 * 1024)))
+UPLOAD_MAX_PAGES = int(os.getenv("UPLOAD_MAX_PAGES", "2000"))
+UPLOAD_CHUNK_BYTES = int(os.getenv("UPLOAD_CHUNK_BYTES", str(1024 * 1024)))
+
+# Ingestion worker pool
+INGEST_WORKERS = int(os.getenv("INGEST_WORKERS", "2"))
+INGEST_MAX_PENDING = int(os.getenv("INGEST_MAX_PENDING", "16"))
+# Unfinished jobs are touched every JOB_HEARTBEAT_SECONDS; a job whose process stopped touching it
+# for four intervals (a crash or restart) is failed, so its document can be uploaded again
+JOB_HEARTBEAT_SECONDS = float(os.getenv("JOB_HEARTBEAT_SECONDS", "15"))
+
+# LLM client
+LLM_BACKEND = os.getenv("LLM_BACKEND", "gemini")  # "gemini" or "stub"
+LLM_MODEL = os.getenv("LLM_MODEL", "gemini-1.5-flash")
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_RATE_LIMIT = float(os.getenv("LLM_RATE_LIMIT", "0"))  # requests/second, 0 disables
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "60"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+STUB_LLM_LATENCY = float(os.getenv("STUB_LLM_LATENCY", "0.05"))
+
+# /challenges generation
+CHALLENGE_FANOUT = int(os.getenv("CHALLENGE_FANOUT", "4"))
+CHALLENGE_PREGENERATE = os.getenv("CHALLENGE_PREGENERATE", "false").lower() == "true"
+CHALLENGE_SET_SIZE = int(os.getenv("CHALLENGE_SET_SIZE", "3"))
+CHALLENGE_BATCHED = os.getenv("CHALLENGE_BATCHED", "false").lower() == "true"
+EVALUATE_PASS_SCORE = float(os.getenv("EVALUATE_PASS_SCORE", "0.6"))
+
+# Map-reduce document summaries: generated in the background after ingestion, from groups of about
+# SUMMARY_GROUP_CHARS characters, at most SUMMARY_FANOUT LLM calls at a time per document
+SUMMARY_ENABLED = os.getenv("SUMMARY_ENABLED", "true").lower() == "true"
+SUMMARY_GROUP_CHARS = int(os.getenv("SUMMARY_GROUP_CHARS", "8000"))
+SUMMARY_FANOUT = int(os.getenv("SUMMARY_FANOUT", "4"))
+SUMMARY_MAX_WORDS = int(os.getenv("SUMMARY_MAX_WORDS", "150"))
+
+# Embedding model
+EMBED_MODEL = os.getenv("EMBED_MODEL", "all-MiniLM-L6-v2")
+EMBED_BACKEND = os.getenv("EMBED_BACKEND", "local")  # "local", "onnx", "process" or "hash"
+EMBED_PROCESSES = int(os.getenv("EMBED_PROCESSES", "2"))
+EMBED_BATCH_SIZE = int(os.getenv("EMBED_BATCH_SIZE", "32"))
+EMBED_WARMUP = os.getenv("EMBED_WARMUP", "true").lower() == "true"
+
+# In-memory index cache
+INDEX_CACHE_MAX_BYTES = int(os.getenv("INDEX_CACHE_MAX_BYTES", str(512 * 1024 * 1024)))
+INDEX_CACHE_POLICY = os.getenv("INDEX_CACHE_POLICY", "lru")  # "lru" or "lfu"
+INDEX_CACHE_PINNED = [d for d in os.getenv("INDEX_CACHE_PINNED", "").split(",") if d]
+
+# Warm-up: at startup and every WARMUP_INTERVAL seconds (0: startup only) load the embedding model and
+# the indexes with the most /ask and /challenges hits over the last WARMUP_WINDOW_HOURS, at most
+# WARMUP_MAX_DOCS of them and WARMUP_MAX_BYTES in total (a share of the index cache budget)
+WARMUP_ENABLED = os.getenv("WARMUP_ENABLED", "true").lower() == "true"
+WARMUP_INTERVAL = float(os.getenv("WARMUP_INTERVAL", "300"))
+WARMUP_WINDOW_HOURS = int(os.getenv("WARMUP_WINDOW_HOURS", "72"))
+WARMUP_MAX_DOCS = int(os.getenv("WARMUP_MAX_DOCS", "32"))
+WARMUP_MAX_BYTES = int(os.getenv("WARMUP_MAX_BYTES", str(INDEX_CACHE_MAX_BYTES // 2)))
+
+# Vectors scanned at query time: "float32" (exact), or "float16" / "int8" compact copies whose
+# top candidates are re-scored exactly from the float32 vectors on disk
+VECTOR_STORAGE = os.getenv("VECTOR_STORAGE", "float32")
+VECTOR_RESCORE_FACTOR = int(os.getenv("VECTOR_RESCORE_FACTOR", "4"))
+
+# Collections: documents per index shard, rows before a shard trains its inverted lists, lists
+# probed per query across all shards, shards searched in parallel, and the tombstoned share of
+# a shard's rows that triggers rewriting it
+COLLECTION_SHARD_DOCS = int(os.getenv("COLLECTION_SHARD_DOCS", "256"))
+COLLECTION_TRAIN_ROWS = int(os.getenv("COLLECTION_TRAIN_ROWS", "2048"))
+COLLECTION_NPROBE = int(os.getenv("COLLECTION_NPROBE", "32"))
+COLLECTION_SEARCH_THREADS = int(os.getenv("COLLECTION_SEARCH_THREADS", str(min(8, os.cpu_count() or 1))))
+COLLECTION_COMPACT_RATIO = float(os.getenv("COLLECTION_COMPACT_RATIO", "0.3"))
+
+# Text extraction
+EXTRACT_PROCESSES = int(os.getenv("EXTRACT_PROCESSES", str(min(4, os.cpu_count() or 1))))
+PDF_PARALLEL_MIN_PAGES = int(os.getenv("PDF_PARALLEL_MIN_PAGES", "64"))
+
+# Streaming ingestion pipeline
+INGEST_BATCH_CHUNKS = int(os.getenv("INGEST_BATCH_CHUNKS", "64"))
+INGEST_QUEUE_BATCHES = int(os.getenv("INGEST_QUEUE_BATCHES", "4"))
+
+# /ask answer cache
+ANSWER_CACHE_MAX_ENTRIES = int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", "2048"))
+ANSWER_CACHE_TTL = float(os.getenv("ANSWER_CACHE_TTL", "3600"))
+ANSWER_CACHE_THRESHOLD = float(os.getenv("ANSWER_CACHE_THRESHOLD", "0.92"))
+
+# Conversation sessions: expire after SESSION_TTL idle seconds; each worker keeps recently used ones
+# in memory up to SESSION_CACHE_BYTES. Recent turns are quoted within SESSION_HISTORY_TOKENS, older
+# ones are folded into a rolling summary of at most SESSION_SUMMARY_WORDS words
+SESSION_TTL = float(os.getenv("SESSION_TTL", "7200"))
+SESSION_CACHE_BYTES = int(os.getenv("SESSION_CACHE_BYTES", str(16 * 1024 ** 2)))
+SESSION_HISTORY_TOKENS = int(os.getenv("SESSION_HISTORY_TOKENS", "600"))
+SESSION_SUMMARY_WORDS = int(os.getenv("SESSION_SUMMARY_WORDS", "120"))
+
+# Context assembly for /ask
+CONTEXT_MAX_TOKENS = int(os.getenv("CONTEXT_MAX_TOKENS", "1500"))
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", "20"))
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", "0.7"))
+
+# Retrieval: "auto" (lexical for keyword-style queries, else hybrid), "hybrid", "vector" or "lexical"
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "auto")
+
+# /ask/batch: questions per request, questions packed into one LLM call, and the share of
+# retrieved chunks two questions must have in common to be answered together
+ASK_BATCH_MAX_QUESTIONS = int(os.getenv("ASK_BATCH_MAX_QUESTIONS", "64"))
+ASK_BATCH_GROUP_SIZE = int(os.getenv("ASK_BATCH_GROUP_SIZE", "4"))
+ASK_BATCH_GROUP_OVERLAP = float(os.getenv("ASK_BATCH_GROUP_OVERLAP", "0.5"))
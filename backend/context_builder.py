@@ -0,0 +1,192 @@
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+from config import CONTEXT_MAX_TOKENS, CONTEXT_MMR_LAMBDA
+
+CHARS_PER_TOKEN = 4  # rough average for English prose, good enough for budgeting
+
+
+def estimate_tokens(text: str) -> int:
+    return math.ceil(len(text) / CHARS_PER_TOKEN)
+
+
+def mmr_order(relevance: np.ndarray, vectors: np.ndarray, lambda_mult: float = CONTEXT_MMR_LAMBDA) -> List[int]:
+    """
+    Maximal marginal relevance ordering of `vectors` (row positions): each
+    step picks the candidate with the best `relevance` that is least similar
+    to anything already picked, weighted by `lambda_mult`.
+    """
+    if not len(vectors):
+        return []
+    unit = vectors / np.maximum(np.linalg.norm(vectors, axis=1, keepdims=True), 1e-12)
+    pairwise = unit @ unit.T
+    chosen = [int(np.argmax(relevance))]
+    redundancy = pairwise[chosen[0]].copy()
+    remaining = np.ones(len(vectors), dtype=bool)
+    remaining[chosen[0]] = False
+    while remaining.any():
+        scores = lambda_mult * relevance - (1 - lambda_mult) * redundancy
+        scores[~remaining] = -np.inf
+        best = int(np.argmax(scores))
+        chosen.append(best)
+        remaining[best] = False
+        redundancy = np.maximum(redundancy, pairwise[best])
+    return chosen
+
+
+class _Passage:
+    """A contiguous span of document text assembled from one or more overlapping chunks"""
+
+    def __init__(self, start: int, text: str, page: int, chunk: int):
+        self.start = start
+        self.text = text
+        self.page = page
+        self.chunks = [chunk]
+
+    @property
+    def end(self) -> int:
+        return self.start + len(self.text)
+
+    def overlaps(self, start: int, end: int) -> bool:
+        return self.start >= 0 and start >= 0 and start <= self.end and end >= self.start
+
+    def merged(self, start: int, text: str) -> str:
+        """Text of the union of this span and [start, start + len(text))"""
+        head = text[:max(0, self.start - start)]
+        tail = text[max(0, self.end - start):]
+        return head + self.text + tail
+
+
+def build_context(index: Any, candidates: Sequence[int], max_tokens: int = CONTEXT_MAX_TOKENS,
+                  query_vector: Optional[Sequence[float]] = None,
+                  lambda_mult: float = CONTEXT_MMR_LAMBDA) -> Dict[str, Any]:
+    """
+    Assemble an LLM context of at most `max_tokens` from a document index.
+
+    Takes retrieved chunk ids best first and orders them by MMR, with
+    relevance from cosine similarity to `query_vector` when given, else
+    from the retrieval rank (lexical and fused rankings). It then merges
+    chunks whose character spans overlap (so the 400-char chunk overlap is
+    paid for once) and keeps adding unique text until the budget is full.
+    Passages are numbered in relevance order; the text prefixes each one
+    with its citation, e.g. "[2] (page 7)".
+    """
+    ids = list(candidates)
+    if not ids or max_tokens <= 0:
+        return {"text": "", "passages": [], "tokens": 0}
+    vectors = np.asarray(index.vectors[ids], dtype=np.float32)
+    if query_vector is not None:
+        q = np.asarray(query_vector, dtype=np.float32)
+        relevance = (vectors @ q) / np.maximum(np.linalg.norm(vectors, axis=1) * np.linalg.norm(q), 1e-12)
+    else:
+        relevance = 1.0 - np.arange(len(ids), dtype=np.float32) / len(ids)
+    order = mmr_order(relevance, vectors, lambda_mult)
+
+    passages: List[_Passage] = []
+    used = 0
+    for pos in order:
+        doc = index.document(ids[pos])
+        text, start, page = doc.page_content, doc.metadata["start"], doc.metadata["page"]
+        target = next((p for p in passages if p.overlaps(start, start + len(text))), None)
+        if target is not None:
+            merged = target.merged(start, text)
+            cost = estimate_tokens(merged) - estimate_tokens(target.text)
+            if used + cost > max_tokens:
+                continue
+            target.start = min(target.start, start)
+            target.text = merged
+            target.page = min(target.page, page)
+            target.chunks.append(ids[pos])
+        else:
+            cost = estimate_tokens(text)
+            if used + cost > max_tokens:
+                if passages:
+                    continue
+                # Budget smaller than one chunk: keep its head rather than nothing
+                text = text[:max_tokens * CHARS_PER_TOKEN]
+                cost = estimate_tokens(text)
+            passages.append(_Passage(start, text, page, ids[pos]))
+        used += cost
+        if used >= max_tokens:
+            break
+
+    # Two passages can become adjacent only through a third one bridging them; fold those together
+    passages = _coalesce(passages)
+    numbered = [
+        {"id": n, "page": p.page, "start": p.start, "end": p.end if p.start >= 0 else -1,
+         "chunks": sorted(p.chunks), "text": p.text}
+        for n, p in enumerate(passages, 1)
+    ]
+    text = "\n\n".join(f"[{p['id']}] (page {p['page']})\n{p['text']}" for p in numbered)
+    return {"text": text, "passages": numbered, "tokens": sum(estimate_tokens(p["text"]) for p in numbered)}
+
+
+def _coalesce(passages: List[_Passage]) -> List[_Passage]:
+    result: List[_Passage] = []
+    for p in passages:
+        target = next((r for r in result if r.overlaps(p.start, p.end)), None)
+        if target is None:
+            result.append(p)
+            continue
+        target.text = target.merged(p.start, p.text)
+        target.start = min(target.start, p.start)
+        target.page = min(target.page, p.page)
+        target.chunks.extend(p.chunks)
+    return result
+
+
+def citations(context: Dict[str, Any], chunks: Optional[Sequence[int]] = None) -> List[Dict[str, Any]]:
+    """Passage metadata without the text, for API responses; `chunks` keeps only passages built from them"""
+    wanted = set(chunks) if chunks is not None else None
+    return [{k: v for k, v in p.items() if k != "text"} for p in context["passages"]
+            if wanted is None or wanted.intersection(p["chunks"])]
+
+
+def build_collection_context(indexes: Dict[str, Any], ranked: Sequence[Tuple[str, int]],
+                             titles: Dict[str, str], max_tokens: int = CONTEXT_MAX_TOKENS,
+                             query_vector: Optional[Sequence[float]] = None) -> Dict[str, Any]:
+    """
+    build_context over chunks of several documents. `ranked` holds
+    (doc id, chunk id) best first; each document gets a share of the budget
+    proportional to its number of hits and is assembled on its own, so
+    overlapping chunks are still merged. Documents are ordered by their
+    best hit and passages carry their document id and filename, e.g.
+    "[3] (paper.pdf, page 2)".
+    """
+    hits: Dict[str, List[int]] = {}
+    for doc_id, chunk in ranked:
+        hits.setdefault(doc_id, []).append(chunk)
+    passages: List[Dict[str, Any]] = []
+    for doc_id, chunks in hits.items():
+        part = build_context(indexes[doc_id], chunks, max(1, max_tokens * len(chunks) // len(ranked)), query_vector)
+        passages.extend({**p, "document_id": doc_id, "filename": titles.get(doc_id, doc_id)} for p in part["passages"])
+    for n, p in enumerate(passages, 1):
+        p["id"] = n
+    text = "\n\n".join(f"[{p['id']}] ({p['filename']}, page {p['page']})\n{p['text']}" for p in passages)
+    return {"text": text, "passages": passages, "tokens": sum(estimate_tokens(p["text"]) for p in passages)}
+
+
+def group_by_overlap(rankings: Sequence[Sequence[int]], max_size: int, min_overlap: float,
+                     top: int = 8) -> List[List[int]]:
+    """
+    Greedily group positions of `rankings` (one best-first chunk ranking
+    per question) whose top `top` chunks overlap by at least `min_overlap`
+    of the smaller set, so the group can share one context. Groups keep
+    the original question order and hold at most `max_size` positions.
+    """
+    groups: List[List[int]] = []
+    heads: List[set] = []
+    for pos, ranking in enumerate(rankings):
+        head = set(ranking[:top])
+        for group, group_head in zip(groups, heads):
+            if len(group) >= max_size or not head or not group_head:
+                continue
+            if len(head & group_head) >= min_overlap * min(len(head), len(group_head)):
+                group.append(pos)
+                break
+        else:
+            groups.append([pos])
+            heads.append(head)
+    return groups
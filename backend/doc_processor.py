@@ -1,28 +1,98 @@
-import os
 import uuid
 import re
-import PyPDF2
-import docx
-from typing import Optional, Dict, Any
+import hashlib
+from typing import Optional, Dict, Any, Callable, BinaryIO, Tuple, Union
 from pathlib import Path
-import tempfile
+import shutil
 import logging
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import SentenceTransformerEmbeddings
+import time
+from datetime import datetime
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; worker processes then rely on convert_faiss_index's own lock
+    fcntl = None
+
+from chunker import clean_text
+from embeddings import get_document_embeddings
+from doc_store import DocumentStore, content_id
+from extraction import extract_text, iter_pages, page_count, SUPPORTED_FORMATS, UTF16_BOMS
+from ingest_pipeline import ingest_pages
+from vector_index import VectorIndex, VectorIndexWriter, convert_faiss_index
+from config import DATA_DIR, UPLOAD_MAX_BYTES, UPLOAD_MAX_PAGES, UPLOAD_CHUNK_BYTES
+from metrics import span
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-EMBED = SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2")
-DATA_DIR = Path("data")
-DATA_DIR.mkdir(exist_ok=True)
+DATA_DIR.mkdir(parents=True, exist_ok=True)
+store = DocumentStore()
+
+# How the first bytes of a valid file of each format look
+_SIGNATURES = {
+    ".pdf": lambda head: b"%PDF-" in head[:1024],
+    ".docx": lambda head: head.startswith(b"PK\x03\x04"),
+    # Text has no signature; NUL bytes mean binary unless a BOM marks UTF-16
+    ".txt": lambda head: head.startswith(UTF16_BOMS) or b"\x00" not in head,
+}
+
+# Written into a migrated data/<stem>.faiss directory, holding the document id it became
+MIGRATED_MARKER = ".migrated"
+
+
+class UploadRejected(ValueError):
+    """An upload refused before ingestion; `status_code` is the HTTP status to answer with"""
+
+    def __init__(self, message: str, status_code: int = 422):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def spool_upload(stream: BinaryIO, filename: str, max_bytes: int = UPLOAD_MAX_BYTES,
+                 max_pages: int = UPLOAD_MAX_PAGES) -> Tuple[str, Path]:
+    """
+    Copy an upload to a spool file UPLOAD_CHUNK_BYTES at a time, hashing it
+    on the way, so memory stays flat whatever the file size. Unsupported
+    types are refused before reading, a wrong signature on the first
+    piece, oversized files as soon as they pass `max_bytes`, and PDFs
+    that do not open or have more than `max_pages` pages right after.
+    Returns (doc_id, spool path); the caller owns the spool file.
+    """
+    file_type = Path(filename).suffix.lower()
+    if file_type not in SUPPORTED_FORMATS:
+        raise UploadRejected(f"Unsupported file format: {file_type or filename}", 415)
+    path = store.new_spool_path()
+    digest = hashlib.sha256()
+    size = 0
+    try:
+        with open(path, "wb") as out:
+            while piece := stream.read(UPLOAD_CHUNK_BYTES):
+                if not size and not _SIGNATURES[file_type](piece):
+                    raise UploadRejected(f"File content is not a valid {file_type.upper()[1:]} file")
+                size += len(piece)
+                if size > max_bytes:
+                    raise UploadRejected(f"File is larger than the {max_bytes} byte upload limit", 413)
+                digest.update(piece)
+                out.write(piece)
+        if not size:
+            raise UploadRejected("File is empty")
+        if file_type == ".pdf":
+            pages = page_count(path, file_type)
+            if pages is None:
+                raise UploadRejected("PDF could not be read")
+            if max_pages and pages > max_pages:
+                raise UploadRejected(f"PDF has {pages} pages, the limit is {max_pages}", 413)
+    except BaseException:
+        path.unlink(missing_ok=True)
+        raise
+    # Same id content_id() gives the whole bytes
+    return digest.hexdigest()[:32], path
 
 class DocumentProcessor:
     """Handles document processing for various file formats"""
 
     def __init__(self):
-        self.supported_formats = ['.pdf', '.txt', '.docx']
+        self.supported_formats = list(SUPPORTED_FORMATS)
 
     def process_document(self, file_content: bytes, filename: str) -> Dict[str, Any]:
         """
@@ -34,41 +104,20 @@ class DocumentProcessor:
             if file_extension not in self.supported_formats:
                 raise ValueError(f"Unsupported file format: {file_extension}")
 
-            # Create temporary file
-            with tempfile.NamedTemporaryFile(delete=False, suffix=file_extension) as tmp_file:
-                tmp_file.write(file_content)
-                tmp_file_path = tmp_file.name
-
-            try:
-                # Extract text based on file type
-                if file_extension == '.pdf':
-                    text = self._extract_from_pdf(tmp_file_path)
-                elif file_extension == '.txt':
-                    text = self._extract_from_txt(tmp_file_path)
-                elif file_extension == '.docx':
-                    text = self._extract_from_docx(tmp_file_path)
-                else:
-                    raise ValueError(f"Unsupported file format: {file_extension}")
-
-                # Clean and validate text
-                text = self._clean_text(text)
-
-                if not text.strip():
-                    raise ValueError("No text content found in the document")
-
-                return {
-                    "text": text,
-                    "filename": filename,
-                    "file_type": file_extension,
-                    "word_count": len(text.split()),
-                    "char_count": len(text),
-                    "status": "success"
-                }
-
-            finally:
-                # Clean up temporary file
-                if os.path.exists(tmp_file_path):
-                    os.unlink(tmp_file_path)
+            # Extract straight from the in-memory bytes, no temp file round-trip
+            text = clean_text(extract_text(file_content, file_extension))
+
+            if not text.strip():
+                raise ValueError("No text content found in the document")
+
+            return {
+                "text": text,
+                "filename": filename,
+                "file_type": file_extension,
+                "word_count": len(text.split()),
+                "char_count": len(text),
+                "status": "success"
+            }
 
         except Exception as e:
             logger.error(f"Error processing document {filename}: {str(e)}")
@@ -79,106 +128,139 @@ class DocumentProcessor:
                 "status": "error"
             }
 
-    def _extract_from_pdf(self, file_path: str) -> str:
-        """Extract text from PDF file"""
-        text = ""
-        try:
-            with open(file_path, 'rb') as file:
-                pdf_reader = PyPDF2.PdfReader(file)
-                for page in pdf_reader.pages:
-                    page_text = page.extract_text()
-                    if page_text:
-                        text += page_text + "\n"
-        except Exception as e:
-            logger.error(f"Error extracting from PDF: {str(e)}")
-            raise ValueError(f"Failed to extract text from PDF: {str(e)}")
-        return text
+def load_text(file_path: Path) -> str:
+    return extract_text(file_path, file_path.suffix)
 
-    def _extract_from_txt(self, file_path: str) -> str:
-        """Extract text from TXT file"""
-        try:
-            with open(file_path, 'r', encoding='utf-8') as file:
-                text = file.read()
-        except UnicodeDecodeError:
-            try:
-                with open(file_path, 'r', encoding='latin-1') as file:
-                    text = file.read()
-            except Exception as e:
-                logger.error(f"Error reading TXT file: {str(e)}")
-                raise ValueError(f"Failed to read TXT file: {str(e)}")
-        except Exception as e:
-            logger.error(f"Error extracting from TXT: {str(e)}")
-            raise ValueError(f"Failed to extract text from TXT: {str(e)}")
-        return text
+def save_doc_and_index(source: Union[bytes, Path], filename: str,
+                       progress: Optional[Callable[[str, float], None]] = None,
+                       doc_id: Optional[str] = None):
+    """
+    Store, extract and index a document under its content hash.
+    Returns (doc_id, meta); identical bytes reuse the existing index.
+    `source` is the uploaded bytes, or a file spooled by spool_upload()
+    together with its `doc_id`, which is moved into the store, not copied.
+    Pages stream through cleaning, chunking and batched embedding, so the
+    full text is never held in memory; it is written once, into the index,
+    as it is extracted, and chunks are stored as offsets into it.
+    """
+    spooled = isinstance(source, Path)
+    if not spooled:
+        doc_id = content_id(source)
+    if store.is_ready(doc_id):
+        logger.info(f"Document {doc_id} already indexed, reusing it")
+        if spooled:
+            source.unlink(missing_ok=True)
+        return doc_id, store.read_meta(doc_id)
+    file_type = Path(filename).suffix.lower()
+    started = time.perf_counter()
+    if spooled:
+        file_path = store.adopt_source(doc_id, file_type, source)
+    else:
+        file_path = store.write_source(doc_id, file_type, source)
+    writer = VectorIndexWriter(store.index_path(doc_id))
+    try:
+        stats = ingest_pages(iter_pages(file_path, file_type), get_document_embeddings(), writer,
+                             progress=progress, page_count=page_count(file_path, file_type))
+        with span("index_save") as saving:
+            writer.close(extra={"doc_id": doc_id})
+        stats["timings"]["index_save"] = round(saving.seconds, 4)
+        if not stats["chunks"]:
+            raise ValueError("No text content found in the document")
+    except Exception:
+        writer.close()
+        # Leave nothing half-written behind so a retry starts clean
+        store.delete(doc_id)
+        raise
+    meta = {
+        "doc_id": doc_id,
+        "filename": filename,
+        "file_type": file_type,
+        "word_count": stats["word_count"],
+        "char_count": stats["char_count"],
+        "page_count": stats["pages"],
+        "chunk_count": stats["chunks"],
+        "summary": summarize(stats["prefix"]),
+        "upload_timestamp": datetime.now().isoformat(),
+        "timings": {**stats["timings"], "total": round(time.perf_counter() - started, 4)},
+    }
+    store.write_meta(doc_id, meta)
+    logger.info(f"Indexed {doc_id}: {stats['pages']} pages, {stats['chunks']} chunks")
+    return doc_id, meta
 
-    def _extract_from_docx(self, file_path: str) -> str:
-        """Extract text from DOCX file"""
+def delete_doc_files(doc_id: str) -> None:
+    """Remove the stored source, text and on-disk index of a document"""
+    store.delete(doc_id)
+
+def migrate_baseline_indexes(data_dir: Path = DATA_DIR) -> int:
+    """
+    One-time import of the indexes the original flat layout wrote,
+    data/<stem>.faiss next to the uploaded data/<stem><ext>. Each becomes a
+    store document under the content hash of its upload, with the vectors
+    converted as they are, nothing re-embedded; the old files stay in place
+    and a marker in the .faiss directory stops later startups from redoing
+    it. Returns the number of indexes imported.
+    """
+    migrated = 0
+    with open(data_dir / ".migrate.lock", "a") as lock_file:
+        # Every worker process runs startup; one migrates, the others then find the markers
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
         try:
-            doc = docx.Document(file_path)
-            text = ""
-            for paragraph in doc.paragraphs:
-                text += paragraph.text + "\n"
-        except Exception as e:
-            logger.error(f"Error extracting from DOCX: {str(e)}")
-            raise ValueError(f"Failed to extract text from DOCX: {str(e)}")
-        return text
-
-    def _clean_text(self, text: str) -> str:
-        """Clean and normalize extracted text"""
-        text = ' '.join(text.split())
-        text = text.replace('\x00', '')
-        text = text.replace('\r', '\n')
-        while '\n\n\n' in text:
-            text = text.replace('\n\n\n', '\n\n')
-        return text.strip()
-
-    def get_text_chunks(self, text: str, chunk_size: int = 1000, overlap: int = 200) -> list:
-        """
-        Split text into chunks for processing
-        """
-        chunks = []
-        start = 0
-        while start < len(text):
-            end = start + chunk_size
-            if end < len(text):
-                sentence_end = text.rfind('.', start, end)
-                if sentence_end > start + chunk_size - 100:
-                    end = sentence_end + 1
-            chunk = text[start:end].strip()
-            if chunk:
-                chunks.append(chunk)
-            start = end - overlap
-            if start >= len(text):
-                break
-        return chunks
+            for faiss_dir in sorted(data_dir.glob("*.faiss")):
+                marker = faiss_dir / MIGRATED_MARKER
+                if not faiss_dir.is_dir() or marker.exists():
+                    continue
+                source = next((p for p in (data_dir / f"{faiss_dir.stem}{ext}" for ext in SUPPORTED_FORMATS)
+                               if p.is_file()), None)
+                if source is None:
+                    logger.warning(f"Not migrating {faiss_dir}: the uploaded file it was built from is missing")
+                    continue
+                try:
+                    doc_id = _import_baseline_index(faiss_dir, source)
+                except Exception as e:
+                    logger.error(f"Could not migrate {faiss_dir}: {str(e)}")
+                    continue
+                marker.write_text(doc_id, encoding="utf-8")
+                migrated += 1
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+    if migrated:
+        logger.info(f"Migrated {migrated} indexes from {data_dir}")
+    return migrated
 
-def load_text(file_path: Path) -> str:
-    # Add support for PDF and TXT
-    if file_path.suffix == ".pdf":
-        reader = PyPDF2.PdfReader(str(file_path))
-        return "\n".join(page.extract_text() or "" for page in reader.pages)
-    elif file_path.suffix == ".txt":
-        return file_path.read_text()
-    elif file_path.suffix == ".docx":
-        doc = docx.Document(str(file_path))
-        return "\n".join(paragraph.text for paragraph in doc.paragraphs)
-    else:
-        raise ValueError("Unsupported file type")
-
-def build_vector_index(text: str) -> FAISS:
-    # Increase chunk size for research papers
-    splitter = RecursiveCharacterTextSplitter(chunk_size=2000, chunk_overlap=400)
-    docs = splitter.create_documents([text])
-    return FAISS.from_documents(docs, EMBED)
-
-def save_doc_and_index(file_bytes: bytes, filename: str):
-    file_path = DATA_DIR / filename
-    file_path.write_bytes(file_bytes)
-    text = load_text(file_path)
-    index = build_vector_index(text)
-    idx_path = DATA_DIR / f"{file_path.stem}.faiss"
-    index.save_local(idx_path)
-    return file_path.stem, text
+def _import_baseline_index(faiss_dir: Path, source: Path) -> str:
+    digest = hashlib.sha256()
+    with open(source, "rb") as f:
+        while piece := f.read(UPLOAD_CHUNK_BYTES):
+            digest.update(piece)
+    # Same id an upload of these bytes gets
+    doc_id = digest.hexdigest()[:32]
+    if store.is_ready(doc_id):
+        return doc_id
+    file_type = source.suffix.lower()
+    file_path = store.source_path(doc_id, file_type)
+    file_path.parent.mkdir(parents=True, exist_ok=True)
+    shutil.copyfile(source, file_path)
+    with span("index_convert"):
+        convert_faiss_index(faiss_dir, store.index_path(doc_id))
+    # Counts and summary come from the upload itself; the converted chunks overlap
+    pages = [clean_text(text) for _, text in iter_pages(file_path, file_type)]
+    text = "\n".join(pages)
+    meta = {
+        "doc_id": doc_id,
+        "filename": source.name,
+        "file_type": file_type,
+        "word_count": len(text.split()),
+        "char_count": len(text),
+        "page_count": len(pages),
+        "chunk_count": VectorIndex(store.index_path(doc_id), storage="float32").count,
+        "summary": summarize(text),
+        "upload_timestamp": datetime.fromtimestamp(source.stat().st_mtime).isoformat(),
+    }
+    store.write_meta(doc_id, meta)
+    logger.info(f"Migrated {faiss_dir} to document {doc_id}")
+    return doc_id
 
 def summarize(text: str) -> str:
     # Simple summary: first 3 sentences
@@ -0,0 +1,104 @@
+import hashlib
+import json
+import os
+import shutil
+import time
+import uuid
+import logging
+from pathlib import Path
+from typing import Optional, Dict, Any
+
+from config import DATA_DIR
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def content_id(data: bytes) -> str:
+    """Document id derived from the uploaded bytes, identical files share one id"""
+    return hashlib.sha256(data).hexdigest()[:32]
+
+
+class DocumentStore:
+    """
+    Content-addressed document storage. Each document lives in its own
+    directory named after the hash of its bytes:
+
+        <root>/<doc_id>/source<ext>   original upload
+        <root>/<doc_id>/index/        memory-mapped vector index, including the cleaned text
+        <root>/<doc_id>/meta.json     filename, counts, summary
+
+    Uploads are first streamed to <root>/../spool/, on the same file system,
+    so a finished upload is moved into place rather than copied.
+    """
+
+    def __init__(self, root: Path = DATA_DIR / "docs"):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.spool_root = self.root.parent / "spool"
+        self.spool_root.mkdir(parents=True, exist_ok=True)
+
+    def doc_dir(self, doc_id: str) -> Path:
+        return self.root / doc_id
+
+    def source_path(self, doc_id: str, file_type: str) -> Path:
+        return self.doc_dir(doc_id) / f"source{file_type}"
+
+    def text_path(self, doc_id: str) -> Path:
+        """Cleaned document text, stored once inside the index"""
+        return self.index_path(doc_id) / "text.utf8"
+
+    def index_path(self, doc_id: str) -> Path:
+        return self.doc_dir(doc_id) / "index"
+
+    def meta_path(self, doc_id: str) -> Path:
+        return self.doc_dir(doc_id) / "meta.json"
+
+    def is_ready(self, doc_id: str) -> bool:
+        """True once ingestion finished; meta.json is written last"""
+        return self.meta_path(doc_id).exists() and self.index_path(doc_id).exists()
+
+    def write_source(self, doc_id: str, file_type: str, data: bytes) -> Path:
+        path = self.source_path(doc_id, file_type)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if not path.exists():
+            path.write_bytes(data)
+        return path
+
+    def new_spool_path(self) -> Path:
+        return self.spool_root / f"{uuid.uuid4().hex}.part"
+
+    def adopt_source(self, doc_id: str, file_type: str, spooled: Path) -> Path:
+        """Move a spooled upload into place as the document source; an existing source wins"""
+        path = self.source_path(doc_id, file_type)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        if path.exists():
+            spooled.unlink(missing_ok=True)
+        else:
+            os.replace(spooled, path)
+        return path
+
+    def prune_spool(self, max_age: float = 24 * 3600) -> int:
+        """Remove spool files left behind by uploads that never reached ingestion"""
+        cutoff = time.time() - max_age
+        stale = [p for p in self.spool_root.glob("*.part") if p.stat().st_mtime < cutoff]
+        for path in stale:
+            path.unlink(missing_ok=True)
+        return len(stale)
+
+    def read_text(self, doc_id: str) -> str:
+        return self.text_path(doc_id).read_text(encoding="utf-8")
+
+    def write_meta(self, doc_id: str, meta: Dict[str, Any]) -> None:
+        tmp = self.meta_path(doc_id).with_suffix(".tmp")
+        tmp.write_text(json.dumps(meta, default=str), encoding="utf-8")
+        tmp.replace(self.meta_path(doc_id))
+
+    def read_meta(self, doc_id: str) -> Optional[Dict[str, Any]]:
+        path = self.meta_path(doc_id)
+        if not path.exists():
+            return None
+        return json.loads(path.read_text(encoding="utf-8"))
+
+    def delete(self, doc_id: str) -> None:
+        shutil.rmtree(self.doc_dir(doc_id), ignore_errors=True)
@@ -0,0 +1,234 @@
+import hashlib
+import logging
+import re
+import sqlite3
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from config import (
+    EMBED_MODEL, EMBED_BACKEND, EMBED_PROCESSES, EMBED_BATCH_SIZE, DATA_DIR, EMBED_CACHE_ENABLED
+)
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+class SentenceTransformerEncoder(Embeddings):
+    """Thin LangChain wrapper around a SentenceTransformer, optionally on the ONNX runtime"""
+
+    def __init__(self, model_name: str, onnx: bool = False, batch_size: int = EMBED_BATCH_SIZE):
+        import sentence_transformers
+        from sentence_transformers import SentenceTransformer
+
+        self.batch_size = batch_size
+        if onnx:
+            version = tuple(int(p) for p in re.findall(r"\d+", sentence_transformers.__version__)[:2])
+            if version < (3, 2):
+                # Silently running torch instead would make EMBED_BACKEND=onnx a no-op
+                raise RuntimeError(
+                    f"EMBED_BACKEND=onnx needs sentence-transformers >= 3.2 with the onnx extra, "
+                    f"found {sentence_transformers.__version__}; upgrade it or use EMBED_BACKEND=local")
+            self.model = SentenceTransformer(model_name, device="cpu", backend="onnx")
+        else:
+            self.model = SentenceTransformer(model_name)
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        texts = [t.replace("\n", " ") for t in texts]
+        return self.model.encode(texts, batch_size=self.batch_size).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+class HashingEncoder(Embeddings):
+    """
+    Deterministic bag-of-words vectors from hashed tokens. No model and no
+    download, so benchmarks and offline runs exercise every other stage with
+    realistic vector shapes; similarity is lexical, not semantic.
+    """
+
+    def __init__(self, dim: int = 384):
+        self.dim = dim
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for token in text.lower().split():
+                matrix[row, int.from_bytes(hashlib.blake2b(token.encode("utf-8"), digest_size=8).digest(),
+                                           "little") % self.dim] += 1.0
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        return (matrix / np.maximum(norms, 1e-12)).tolist()
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+# Per-process model for the process-pool backend, loaded once by the pool initializer
+_worker_encoder: Optional[SentenceTransformerEncoder] = None
+
+def _init_worker(model_name: str) -> None:
+    global _worker_encoder
+    _worker_encoder = SentenceTransformerEncoder(model_name, onnx=False)
+
+def _encode_in_worker(texts: List[str]) -> List[List[float]]:
+    return _worker_encoder.embed_documents(texts)
+
+
+class ProcessPoolEncoder(Embeddings):
+    """Runs the model in worker processes so the API process never holds it or the GIL for it"""
+
+    def __init__(self, model_name: str, processes: int = EMBED_PROCESSES, batch_size: int = EMBED_BATCH_SIZE):
+        self.batch_size = batch_size
+        self._pool = ProcessPoolExecutor(max_workers=processes, initializer=_init_worker, initargs=(model_name,))
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+        vectors: List[List[float]] = []
+        for part in self._pool.map(_encode_in_worker, batches):
+            vectors.extend(part)
+        return vectors
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._pool.submit(_encode_in_worker, [text]).result()[0]
+
+    def shutdown(self) -> None:
+        self._pool.shutdown(wait=False, cancel_futures=True)
+
+
+class EmbeddingCache:
+    """Persistent chunk-embedding cache keyed by model and the hash of the chunk text"""
+
+    def __init__(self, path: Path = DATA_DIR / "embeddings.sqlite"):
+        path.parent.mkdir(parents=True, exist_ok=True)
+        self._conn = sqlite3.connect(str(path), check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS vectors (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+        )
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(model_name: str, text: str) -> str:
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys: List[str]) -> Dict[str, List[float]]:
+        found: Dict[str, List[float]] = {}
+        with self._lock:
+            # Stay below SQLite's bound-parameter limit
+            for i in range(0, len(keys), 500):
+                part = keys[i:i + 500]
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM vectors WHERE key IN ({','.join('?' * len(part))})", part
+                ).fetchall()
+                for key, blob in rows:
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+        return found
+
+    def put_many(self, items: Dict[str, List[float]]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO vectors (key, vector) VALUES (?, ?)",
+                [(k, np.asarray(v, dtype=np.float32).tobytes()) for k, v in items.items()]
+            )
+
+
+class CachedEmbeddings(Embeddings):
+    """Embeds only chunks whose text has not been seen before, reuses cached vectors for the rest"""
+
+    def __init__(self, inner: Embeddings, cache: EmbeddingCache, model_name: str):
+        self.inner = inner
+        self.cache = cache
+        self.model_name = model_name
+        self.hits = 0
+        self.misses = 0
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        keys = [self.cache.key(self.model_name, t) for t in texts]
+        found = self.cache.get_many(list(set(keys)))
+        missing = list({k: t for k, t in zip(keys, texts) if k not in found}.items())
+        if missing:
+            vectors = self.inner.embed_documents([t for _, t in missing])
+            fresh = {k: v for (k, _), v in zip(missing, vectors)}
+            self.cache.put_many(fresh)
+            found.update(fresh)
+        self.hits += len(texts) - len(missing)
+        self.misses += len(missing)
+        return [found[k] for k in keys]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.inner.embed_query(text)
+
+
+class EmbeddingService:
+    """Process-wide embedding model, created on first use and shared by every code path"""
+
+    def __init__(self, model_name: str = EMBED_MODEL, backend: str = EMBED_BACKEND):
+        self.model_name = model_name
+        self.backend = backend
+        self._embeddings: Optional[Embeddings] = None
+        self._cached: Optional[CachedEmbeddings] = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self) -> bool:
+        return self._embeddings is not None
+
+    def get(self) -> Embeddings:
+        if self._embeddings is None:
+            with self._lock:
+                if self._embeddings is None:
+                    logger.info(f"Loading embedding model {self.model_name} ({self.backend} backend)")
+                    self._embeddings = self._create()
+        return self._embeddings
+
+    def get_cached(self) -> Embeddings:
+        """Embeddings for ingestion, backed by the persistent chunk cache when enabled"""
+        if not EMBED_CACHE_ENABLED:
+            return self.get()
+        if self._cached is None:
+            inner = self.get()
+            with self._lock:
+                if self._cached is None:
+                    self._cached = CachedEmbeddings(inner, EmbeddingCache(), self.model_name)
+        return self._cached
+
+    def warm_up(self) -> None:
+        """Load the model and run one forward pass so the first request pays nothing"""
+        self.get().embed_query("warm up")
+        logger.info("Embedding model warmed up")
+
+    def _create(self) -> Embeddings:
+        if self.backend == "local":
+            return SentenceTransformerEncoder(self.model_name)
+        if self.backend == "onnx":
+            return SentenceTransformerEncoder(self.model_name, onnx=True)
+        if self.backend == "process":
+            return ProcessPoolEncoder(self.model_name)
+        if self.backend == "hash":
+            return HashingEncoder()
+        raise ValueError(f"Unknown embedding backend: {self.backend}")
+
+
+_service = EmbeddingService()
+
+def get_embeddings() -> Embeddings:
+    return _service.get()
+
+def get_document_embeddings() -> Embeddings:
+    return _service.get_cached()
+
+def warm_up() -> None:
+    _service.warm_up()
+
+def embeddings_loaded() -> bool:
+    return _service.loaded
+
+def embedding_cache_stats() -> Optional[Dict[str, int]]:
+    """Chunk embedding cache hits and misses, None until ingestion first used the cache"""
+    cached = _service._cached
+    return None if cached is None else {"hits": cached.hits, "misses": cached.misses}
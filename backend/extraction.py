@@ -0,0 +1,161 @@
+import io
+import mmap
+import logging
+import multiprocessing
+import threading
+from collections import deque
+from concurrent.futures import Future, ProcessPoolExecutor
+from pathlib import Path
+from typing import Deque, Iterator, List, Optional, Tuple, Union
+
+import PyPDF2
+import docx
+
+from config import EXTRACT_PROCESSES, PDF_PARALLEL_MIN_PAGES
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+Source = Union[bytes, str, Path]
+SUPPORTED_FORMATS = (".pdf", ".txt", ".docx")
+PAGES_PER_TASK = 16
+# Page ranges submitted to the pool ahead of the consumer: enough to keep every process busy
+MAX_RANGES_IN_FLIGHT = max(2, EXTRACT_PROCESSES * 2)
+DOCX_PAGE_CHARS = 3000
+UTF16_BOMS = (b"\xff\xfe", b"\xfe\xff")
+
+_pool: Optional[ProcessPoolExecutor] = None
+_pool_lock = threading.Lock()
+
+
+def _get_pool() -> ProcessPoolExecutor:
+    global _pool
+    if _pool is None:
+        with _pool_lock:
+            if _pool is None:
+                # spawn: the API process runs threads and torch, forking it is not safe
+                _pool = ProcessPoolExecutor(max_workers=EXTRACT_PROCESSES,
+                                            mp_context=multiprocessing.get_context("spawn"))
+    return _pool
+
+
+def _open(source: Source):
+    """Readable, seekable view of the source without copying it: mmap for files, BytesIO for bytes"""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.BytesIO(source)
+    with open(source, "rb") as f:
+        if f.seek(0, io.SEEK_END) == 0:
+            return io.BytesIO(b"")
+        return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+
+def _pdf_page_range(path: str, start: int, stop: int) -> List[Tuple[int, str]]:
+    """Worker task: extract pages [start, stop) of the PDF at path"""
+    stream = _open(path)
+    try:
+        reader = PyPDF2.PdfReader(stream)
+        return [(i + 1, reader.pages[i].extract_text() or "") for i in range(start, stop)]
+    finally:
+        stream.close()
+
+
+def _iter_pdf(source: Source) -> Iterator[Tuple[int, str]]:
+    stream = _open(source)
+    try:
+        reader = PyPDF2.PdfReader(stream)
+        page_count = len(reader.pages)
+        if isinstance(source, (str, Path)) and EXTRACT_PROCESSES > 1 and page_count >= PDF_PARALLEL_MIN_PAGES:
+            # Yield in page order with at most MAX_RANGES_IN_FLIGHT ranges submitted: later ranges keep
+            # extracting while earlier ones are consumed, but a slow consumer holds back extraction
+            # instead of the whole document's text piling up in finished futures
+            starts = iter(range(0, page_count, PAGES_PER_TASK))
+            in_flight: Deque[Future] = deque()
+            try:
+                for start in starts:
+                    in_flight.append(_get_pool().submit(_pdf_page_range, str(source), start,
+                                                        min(start + PAGES_PER_TASK, page_count)))
+                    if len(in_flight) >= MAX_RANGES_IN_FLIGHT:
+                        yield from in_flight.popleft().result()
+                while in_flight:
+                    yield from in_flight.popleft().result()
+            finally:
+                # Consumer stopped early or a range failed: drop the ranges nobody will read
+                for future in in_flight:
+                    future.cancel()
+        else:
+            for i, page in enumerate(reader.pages):
+                yield i + 1, page.extract_text() or ""
+    finally:
+        stream.close()
+
+
+def _iter_txt(source: Source) -> Iterator[Tuple[int, str]]:
+    stream = _open(source)
+    try:
+        data = stream.read()
+    finally:
+        stream.close()
+    try:
+        # The "utf-16" codec reads the BOM for the byte order and drops it
+        text = data.decode("utf-16" if data.startswith(UTF16_BOMS) else "utf-8")
+    except UnicodeDecodeError:
+        text = data.decode("latin-1")
+    # Form feeds are the only page marker plain text has
+    for i, page in enumerate(text.split("\f")):
+        yield i + 1, page
+
+
+def _iter_docx(source: Source) -> Iterator[Tuple[int, str]]:
+    """DOCX has no fixed pages, paragraphs are grouped into ~DOCX_PAGE_CHARS blocks instead"""
+    # zipfile reads members lazily from a path; mmap is not a usable zip stream before 3.13
+    stream = io.BytesIO(source) if isinstance(source, (bytes, bytearray, memoryview)) else open(source, "rb")
+    try:
+        document = docx.Document(stream)
+        page, size, number = [], 0, 1
+        for paragraph in document.paragraphs:
+            page.append(paragraph.text)
+            size += len(paragraph.text)
+            if size >= DOCX_PAGE_CHARS:
+                yield number, "\n".join(page)
+                page, size, number = [], 0, number + 1
+        if page:
+            yield number, "\n".join(page)
+    finally:
+        stream.close()
+
+
+_EXTRACTORS = {".pdf": _iter_pdf, ".txt": _iter_txt, ".docx": _iter_docx}
+
+
+def iter_pages(source: Source, file_type: str) -> Iterator[Tuple[int, str]]:
+    """
+    Yield (page_number, text) for a document given as bytes or a file path.
+    Files are memory-mapped, large PDFs are extracted across a process pool.
+    """
+    file_type = file_type.lower()
+    if file_type not in _EXTRACTORS:
+        raise ValueError(f"Unsupported file format: {file_type}")
+    try:
+        yield from _EXTRACTORS[file_type](source)
+    except ValueError:
+        raise
+    except Exception as e:
+        logger.error(f"Error extracting from {file_type.upper()[1:]}: {str(e)}")
+        raise ValueError(f"Failed to extract text from {file_type.upper()[1:]}: {str(e)}")
+
+
+def page_count(source: Source, file_type: str) -> Optional[int]:
+    """Number of pages when the format has a cheap way to tell, else None"""
+    if file_type.lower() != ".pdf":
+        return None
+    stream = _open(source)
+    try:
+        return len(PyPDF2.PdfReader(stream).pages)
+    except Exception:
+        return None
+    finally:
+        stream.close()
+
+
+def extract_text(source: Source, file_type: str) -> str:
+    return "\n".join(text for _, text in iter_pages(source, file_type))
@@ -0,0 +1,136 @@
+import sys
+import threading
+import logging
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Iterable, Optional
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def estimate_index_bytes(index: Any) -> int:
+    """Approximate resident size of an index: vectors plus chunk text"""
+    if hasattr(index, "resident_bytes"):
+        return index.resident_bytes()
+    size = 0
+    faiss_index = getattr(index, "index", None)
+    if faiss_index is not None:
+        size += faiss_index.ntotal * faiss_index.d * 4
+    docstore = getattr(getattr(index, "docstore", None), "_dict", {})
+    for doc in docstore.values():
+        size += sys.getsizeof(doc.page_content) + sys.getsizeof(doc.metadata)
+    return size
+
+
+class IndexCache:
+    """
+    Cache of loaded vector indexes bounded by an estimated byte budget.
+    Evicts least-recently ("lru") or least-frequently ("lfu") used entries;
+    pinned entries are never evicted.
+    """
+
+    def __init__(self, max_bytes: int, policy: str = "lru",
+                 sizeof: Callable[[Any], int] = estimate_index_bytes):
+        if policy not in ("lru", "lfu"):
+            raise ValueError(f"Unknown eviction policy: {policy}")
+        self.max_bytes = max_bytes
+        self.policy = policy
+        self._sizeof = sizeof
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._pinned: set = set()
+        self._bytes = 0
+        self._lock = threading.RLock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, key: str, loader: Optional[Callable[[], Any]] = None) -> Any:
+        """Return the cached value, loading and inserting it on a miss when a loader is given"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self.hits += 1
+                entry["uses"] += 1
+                self._entries.move_to_end(key)
+                return entry["value"]
+            self.misses += 1
+        if loader is None:
+            return None
+        # Load outside the lock so one slow load does not stall every other lookup
+        value = loader()
+        self.put(key, value)
+        return value
+
+    def put(self, key: str, value: Any) -> None:
+        size = self._sizeof(value)
+        with self._lock:
+            self._discard(key)
+            if size > self.max_bytes and key not in self._pinned:
+                logger.warning(f"Index {key} ({size} bytes) exceeds the cache budget, not caching")
+                return
+            self._entries[key] = {"value": value, "bytes": size, "uses": 1}
+            self._bytes += size
+            self._evict()
+
+    def invalidate(self, key: str) -> bool:
+        with self._lock:
+            return self._discard(key)
+
+    def pin(self, key: str) -> None:
+        with self._lock:
+            self._pinned.add(key)
+
+    def unpin(self, key: str) -> None:
+        with self._lock:
+            self._pinned.discard(key)
+            self._evict()
+
+    def is_pinned(self, key: str) -> bool:
+        return key in self._pinned
+
+    def keys(self) -> Iterable[str]:
+        with self._lock:
+            return list(self._entries)
+
+    def __contains__(self, key: str) -> bool:
+        return key in self._entries
+
+    @property
+    def bytes(self) -> int:
+        return self._bytes
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "policy": self.policy,
+                "hits": self.hits,
+                "misses": self.misses,
+                "evictions": self.evictions,
+                "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+                "pinned": sorted(self._pinned),
+            }
+
+    def _discard(self, key: str) -> bool:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return False
+        self._bytes -= entry["bytes"]
+        return True
+
+    def _evict(self) -> None:
+        while self._bytes > self.max_bytes:
+            candidates = [k for k in self._entries if k not in self._pinned]
+            if not candidates:
+                return
+            if self.policy == "lfu":
+                # min() keeps the first of equal counts, i.e. the least recently used
+                victim = min(candidates, key=lambda k: self._entries[k]["uses"])
+            else:
+                victim = candidates[0]
+            self._discard(victim)
+            self.evictions += 1
+            logger.info(f"Evicted index {victim} from cache")
@@ -0,0 +1,123 @@
+import logging
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, List, Optional, Tuple
+
+from langchain_core.embeddings import Embeddings
+
+from chunker import Chunker, Span, clean_text
+from config import INGEST_BATCH_CHUNKS, INGEST_QUEUE_BATCHES
+from metrics import record, span
+from vector_index import VectorIndexWriter
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+SUMMARY_PREFIX_CHARS = 2000
+
+_DONE = object()
+
+
+def ingest_pages(pages: Iterable[Tuple[int, str]], embeddings: Embeddings, writer: VectorIndexWriter,
+                 progress: Optional[Callable[[str, float], None]] = None,
+                 page_count: Optional[int] = None,
+                 batch_chunks: int = INGEST_BATCH_CHUNKS,
+                 queue_batches: int = INGEST_QUEUE_BATCHES) -> Dict[str, Any]:
+    """
+    Stream pages through cleaning, chunking and embedding into an on-disk
+    vector index.
+
+    A producer thread extracts, cleans and chunks pages into fixed-size
+    batches on a bounded queue; the calling thread embeds each batch and
+    appends it to `writer`. The queue bound is the backpressure: extraction
+    never runs more than `queue_batches` batches ahead, so memory stays flat
+    however long the document is. The chunker writes the joined text to the
+    index as it arrives, and chunks are stored as spans of it.
+    """
+    report = progress or (lambda stage, fraction: None)
+    batches: "queue.Queue[Any]" = queue.Queue(maxsize=queue_batches)
+    stop = threading.Event()
+    stats = {"pages": 0, "chunks": 0, "word_count": 0, "char_count": 0, "prefix": ""}
+    # Seconds spent in each stage; time blocked on the queue is backpressure, not work
+    timings = {"extract": 0.0, "clean": 0.0, "split": 0.0, "embed": 0.0, "index_write": 0.0, "backpressure": 0.0}
+
+    def put(item: Any) -> bool:
+        waited = time.perf_counter()
+        try:
+            while not stop.is_set():
+                try:
+                    batches.put(item, timeout=0.5)
+                    return True
+                except queue.Full:
+                    continue
+            return False
+        finally:
+            waited = time.perf_counter() - waited
+            timings["backpressure"] += waited
+            record("ingest_backpressure", waited)
+
+    def produce() -> None:
+        chunker = Chunker(sink=writer.append_text)
+        batch: List[Tuple[Span, str]] = []
+        page_iter = iter(pages)
+        try:
+            while True:
+                with span("extract") as extracting:
+                    page = next(page_iter, None)
+                timings["extract"] += extracting.seconds
+                if page is None:
+                    break
+                page_number, text = page
+                if stop.is_set():
+                    return
+                with span("clean") as cleaning:
+                    text = clean_text(text)
+                with span("split") as splitting:
+                    batch.extend(chunker.feed(page_number, text))
+                timings["clean"] += cleaning.seconds
+                timings["split"] += splitting.seconds
+                stats["pages"] += 1
+                stats["word_count"] += len(text.split())
+                if len(stats["prefix"]) < SUMMARY_PREFIX_CHARS:
+                    stats["prefix"] += ("\n" if stats["prefix"] else "") + text[:SUMMARY_PREFIX_CHARS]
+                while len(batch) >= batch_chunks:
+                    if not put(batch[:batch_chunks]):
+                        return
+                    batch = batch[batch_chunks:]
+            with span("split") as splitting:
+                batch.extend(chunker.flush())
+            timings["split"] += splitting.seconds
+            stats["char_count"] = chunker.length
+            if batch:
+                put(batch)
+            put(_DONE)
+        except BaseException as e:
+            put(e)
+
+    producer = threading.Thread(target=produce, name="ingest-extract", daemon=True)
+    producer.start()
+    report("extracting", 0.1)
+    try:
+        while True:
+            item = batches.get()
+            if item is _DONE:
+                break
+            if isinstance(item, BaseException):
+                raise item
+            spans = [s for s, _ in item]
+            texts = [t for _, t in item]
+            with span("embed") as embedding:
+                vectors = embeddings.embed_documents(texts)
+            with span("index_write") as writing:
+                writer.add(texts, vectors, spans)
+            timings["embed"] += embedding.seconds
+            timings["index_write"] += writing.seconds
+            stats["chunks"] += len(texts)
+            done = stats["pages"] / page_count if page_count else 0.5
+            report("embedding", 0.1 + 0.8 * min(1.0, done))
+    finally:
+        stop.set()
+        producer.join()
+    stats["timings"] = {stage: round(seconds, 4) for stage, seconds in timings.items()}
+    return stats
@@ -0,0 +1,193 @@
+import threading
+import uuid
+import logging
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Any, Optional
+
+from config import JOB_HEARTBEAT_SECONDS
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+QUEUED = "queued"
+EXTRACTING = "extracting"
+EMBEDDING = "embedding"
+READY = "ready"
+FAILED = "failed"
+
+
+class QueueFullError(RuntimeError):
+    """Raised when the ingestion queue has no free slots"""
+
+
+class IngestionJobManager:
+    """
+    Runs document ingestion on a bounded worker pool and tracks job status.
+    With a catalog, unfinished jobs are touched every `heartbeat` seconds;
+    rows nobody touched for four intervals belong to a process that died
+    and are ignored by find_active() and failed by fail_stale().
+    """
+
+    def __init__(self, max_workers: int = 2, max_pending: int = 16, retention: int = 500, catalog=None,
+                 heartbeat: float = JOB_HEARTBEAT_SECONDS):
+        # Optional DocumentCatalog: job state is written through so every worker process can report it
+        self._catalog = catalog
+        self._heartbeat = heartbeat
+        self._stop = threading.Event()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="ingest")
+        # Caps running + queued jobs so a burst of uploads cannot pile up unbounded work
+        self._slots = threading.BoundedSemaphore(max_workers + max_pending)
+        self._jobs: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._retention = retention
+        if catalog is not None:
+            threading.Thread(target=self._beat, name="ingest-heartbeat", daemon=True).start()
+
+    def submit(self, fn: Callable[..., Dict[str, Any]], *args, document_id: str = "", filename: str = "") -> Dict[str, Any]:
+        """
+        Queue fn(job_id, *args) and return a snapshot of the new job.
+        fn reports progress through update() and returns the job result.
+        """
+        if not self._slots.acquire(blocking=False):
+            raise QueueFullError("Ingestion queue is full, try again later")
+        job = self._add(document_id, filename, QUEUED, 0.0, "Waiting for a free worker")
+        try:
+            self._executor.submit(self._run, job["job_id"], fn, args)
+        except Exception:
+            self._slots.release()
+            raise
+        return dict(job)
+
+    def record_done(self, result: Dict[str, Any], document_id: str = "", filename: str = "") -> Dict[str, Any]:
+        """Record a job that needed no work, e.g. a re-upload of an already indexed document"""
+        return self._add(document_id, filename, READY, 1.0, "Document is ready", result)
+
+    def find_active(self, document_id: str) -> Optional[Dict[str, Any]]:
+        """Return an unfinished job for the document, so duplicate uploads share it"""
+        with self._lock:
+            for job in self._jobs.values():
+                if job["document_id"] == document_id and job["status"] not in (READY, FAILED):
+                    return dict(job)
+        if self._catalog is not None:
+            return self._catalog.find_active_job(document_id, (READY, FAILED), str(self._stale_before()))
+        return None
+
+    def fail_stale(self) -> int:
+        """Fail unfinished jobs left behind by a process that crashed or restarted"""
+        if self._catalog is None:
+            return 0
+        count = self._catalog.fail_stale_jobs((READY, FAILED), str(self._stale_before()), FAILED,
+                                              "Interrupted: the process running it stopped")
+        if count:
+            logger.warning(f"Marked {count} interrupted ingestion jobs as failed")
+        return count
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job:
+                return dict(job)
+        if self._catalog is not None:
+            return self._catalog.load_job(job_id)
+        return None
+
+    def update(self, job_id: str, status: Optional[str] = None, progress: Optional[float] = None,
+               message: Optional[str] = None) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            if status is not None:
+                job["status"] = status
+            if progress is not None:
+                job["progress"] = max(0.0, min(1.0, progress))
+            if message is not None:
+                job["message"] = message
+            job["updated_at"] = datetime.now()
+            snapshot = dict(job)
+        self._persist(snapshot)
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return sum(1 for j in self._jobs.values() if j["status"] not in (READY, FAILED))
+
+    def shutdown(self, wait: bool = True) -> None:
+        self._stop.set()
+        self._executor.shutdown(wait=wait)
+
+    def _stale_before(self) -> datetime:
+        return datetime.now() - timedelta(seconds=4 * self._heartbeat)
+
+    def _beat(self) -> None:
+        while not self._stop.wait(self._heartbeat):
+            with self._lock:
+                active = [k for k, j in self._jobs.items() if j["status"] not in (READY, FAILED)]
+            if not active:
+                continue
+            try:
+                self._catalog.touch_jobs(active, str(datetime.now()))
+            except Exception as e:
+                logger.warning(f"Could not touch ingestion jobs: {str(e)}")
+
+    def _run(self, job_id: str, fn: Callable[..., Dict[str, Any]], args: tuple) -> None:
+        try:
+            result = fn(job_id, *args)
+            self._finish(job_id, status=READY, progress=1.0, message="Document is ready", result=result)
+        except Exception as e:
+            logger.error(f"Ingestion job {job_id} failed: {str(e)}")
+            self._finish(job_id, status=FAILED, message="Ingestion failed", error=str(e))
+        finally:
+            self._slots.release()
+
+    def _finish(self, job_id: str, **fields) -> None:
+        with self._lock:
+            job = self._jobs.get(job_id)
+            if job is None:
+                return
+            job.update(updated_at=datetime.now(), **fields)
+            snapshot = dict(job)
+        self._persist(snapshot)
+
+    def _persist(self, job: Dict[str, Any]) -> None:
+        if self._catalog is None:
+            return
+        try:
+            self._catalog.save_job(job)
+        except Exception as e:
+            logger.warning(f"Could not persist job {job['job_id']}: {str(e)}")
+
+    def _add(self, document_id: str, filename: str, status: str, progress: float, message: str,
+             result: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        now = datetime.now()
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "document_id": document_id,
+            "filename": filename,
+            "status": status,
+            "progress": progress,
+            "message": message,
+            "error": None,
+            "result": result,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock:
+            self._jobs[job["job_id"]] = job
+            trimmed = self._trim()
+        self._persist(job)
+        if trimmed and self._catalog is not None:
+            # Outside the lock: SQLite I/O must not hold up status updates of running jobs
+            self._catalog.prune_jobs(self._retention, (READY, FAILED))
+        return dict(job)
+
+    def _trim(self) -> bool:
+        """Drop the oldest finished jobs once we hold more than `retention` records; True if any were dropped"""
+        excess = len(self._jobs) - self._retention
+        if excess <= 0:
+            return False
+        finished = [k for k, j in self._jobs.items() if j["status"] in (READY, FAILED)][:excess]
+        for job_id in finished:
+            del self._jobs[job_id]
+        return bool(finished)
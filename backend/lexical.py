@@ -0,0 +1,147 @@
+import json
+import os
+import re
+from collections import Counter
+from pathlib import Path
+from typing import Dict, Iterable, List, Sequence, Tuple
+
+import numpy as np
+
+# Files of the lexical index, written into the vector index directory
+TERMS = "bm25_terms.json"              # vocabulary, position = term id
+POSTING_OFFSETS = "bm25_offsets.npy"   # int64 [terms + 1], slice of each term's postings
+POSTING_CHUNKS = "bm25_chunks.npy"     # int32 [postings], chunk id, ascending within a term
+POSTING_TF = "bm25_tf.npy"             # float32 [postings], term frequency in that chunk
+CHUNK_LENGTHS = "bm25_lengths.npy"     # float32 [chunks], tokens per chunk
+
+BM25_K1 = 1.2
+BM25_B = 0.75
+RRF_K = 60
+
+# Identifiers, numbers and words; underscores and dots inside a token are kept
+# so `softmax_cross_entropy` or `eq. 3.2` style references still match exactly
+_TOKEN = re.compile(r"\w+(?:[._]\w+)*")
+_QUESTION_WORDS = {"what", "why", "how", "when", "where", "who", "which", "explain", "describe", "does", "is",
+                   "are", "can", "should", "summarize", "compare"}
+
+
+def tokenize(text: str) -> List[str]:
+    return _TOKEN.findall(text.lower())
+
+
+def is_keyword_query(query: str) -> bool:
+    """
+    Heuristic for queries the lexical index answers as well as the vector
+    index: a few bare terms, a quoted phrase or an identifier-looking token,
+    and not a natural-language question.
+    """
+    tokens = tokenize(query)
+    if not tokens or "?" in query or tokens[0] in _QUESTION_WORDS:
+        return False
+    if '"' in query or any(re.search(r"[._]|\d", t) for t in tokens):
+        return True
+    return len(tokens) <= 3
+
+
+class LexicalIndexWriter:
+    """Collects per-chunk term frequencies during ingestion and writes the postings once at the end"""
+
+    def __init__(self):
+        self._vocab: Dict[str, int] = {}
+        self._term_ids: List[np.ndarray] = []
+        self._chunk_ids: List[np.ndarray] = []
+        self._tfs: List[np.ndarray] = []
+        self._lengths: List[int] = []
+
+    def add(self, texts: Iterable[str]) -> None:
+        for text in texts:
+            chunk = len(self._lengths)
+            tokens = tokenize(text)
+            counts = Counter(tokens)
+            self._lengths.append(len(tokens))
+            if not counts:
+                continue
+            self._term_ids.append(np.fromiter((self._vocab.setdefault(t, len(self._vocab)) for t in counts),
+                                              dtype=np.int32, count=len(counts)))
+            self._chunk_ids.append(np.full(len(counts), chunk, dtype=np.int32))
+            self._tfs.append(np.fromiter(counts.values(), dtype=np.float32, count=len(counts)))
+
+    def write(self, path: Path) -> None:
+        path = Path(path)
+        if self._term_ids:
+            terms = np.concatenate(self._term_ids)
+            chunks = np.concatenate(self._chunk_ids)
+            tfs = np.concatenate(self._tfs)
+        else:
+            terms = chunks = np.zeros(0, dtype=np.int32)
+            tfs = np.zeros(0, dtype=np.float32)
+        # Stable sort keeps chunk ids ascending inside each term's postings
+        order = np.argsort(terms, kind="stable")
+        offsets = np.zeros(len(self._vocab) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(terms, minlength=len(self._vocab)), out=offsets[1:])
+        vocabulary = [""] * len(self._vocab)
+        for term, i in self._vocab.items():
+            vocabulary[i] = term
+        (path / TERMS).write_text(json.dumps(vocabulary), encoding="utf-8")
+        np.save(path / POSTING_OFFSETS, offsets)
+        np.save(path / POSTING_CHUNKS, chunks[order])
+        np.save(path / POSTING_TF, tfs[order])
+        # Lengths go last and atomically: their presence marks a complete lexical index
+        tmp = path / (CHUNK_LENGTHS + ".tmp")
+        with open(tmp, "wb") as f:
+            np.save(f, np.asarray(self._lengths, dtype=np.float32))
+        os.replace(tmp, path / CHUNK_LENGTHS)
+
+
+class BM25Index:
+    """
+    Read-only BM25 over one document's chunks. Postings are memory-mapped;
+    a query touches only the postings of its own terms, so search cost is
+    independent of the model and of document size for rare terms.
+    """
+
+    def __init__(self, path: Path):
+        path = Path(path)
+        self.term_ids = {t: i for i, t in enumerate(json.loads((path / TERMS).read_text(encoding="utf-8")))}
+        # Plain ndarray views over the maps: slicing np.memmap itself costs several microseconds a call
+        self.offsets = np.asarray(np.load(path / POSTING_OFFSETS, mmap_mode="r"))
+        self.chunks = np.asarray(np.load(path / POSTING_CHUNKS, mmap_mode="r"))
+        self.tf = np.asarray(np.load(path / POSTING_TF, mmap_mode="r"))
+        self.lengths = np.load(path / CHUNK_LENGTHS)
+        self.count = len(self.lengths)
+        average = float(self.lengths.mean()) if self.count else 0.0
+        # Per-chunk part of the BM25 denominator, precomputed once
+        self._norm = BM25_K1 * (1 - BM25_B + BM25_B * self.lengths / (average or 1.0))
+
+    @staticmethod
+    def exists(path: Path) -> bool:
+        return (Path(path) / CHUNK_LENGTHS).exists()
+
+    def search(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """(chunk id, BM25 score) of the k best matching chunks, best first; chunks without a query term are left out"""
+        ids = [self.term_ids[t] for t in set(tokenize(query)) if t in self.term_ids]
+        if not ids:
+            return []
+        slices = [slice(int(self.offsets[i]), int(self.offsets[i + 1])) for i in ids]
+        chunks = np.concatenate([self.chunks[s] for s in slices])
+        tf = np.concatenate([self.tf[s] for s in slices])
+        df = np.array([s.stop - s.start for s in slices], dtype=np.float32)
+        idf = np.repeat(np.log(1 + (self.count - df + 0.5) / (df + 0.5)), df.astype(np.int64))
+        # One scatter-add for all query terms instead of one per term
+        scores = np.bincount(chunks, weights=idf * tf * (BM25_K1 + 1) / (tf + self._norm[chunks]),
+                             minlength=self.count)
+        matched = np.flatnonzero(scores)
+        if not len(matched):
+            return []
+        # Ties are broken by chunk id so equal queries always rank the same way, whatever k is
+        top = matched[np.lexsort((matched, -scores[matched]))[:k]]
+        return [(int(i), float(scores[i])) for i in top]
+
+
+def reciprocal_rank_fusion(rankings: Sequence[Sequence[int]], k: int = RRF_K) -> List[int]:
+    """Fuse several best-first rankings of chunk ids: score = sum of 1 / (k + rank)"""
+    scores: Dict[int, float] = {}
+    for ranking in rankings:
+        for rank, chunk in enumerate(ranking):
+            scores[chunk] = scores.get(chunk, 0.0) + 1.0 / (k + rank + 1)
+    return sorted(scores, key=lambda c: (-scores[c], c))
@@ -1,65 +1,474 @@
-import google.generativeai as genai
-from langchain.text_splitter import RecursiveCharacterTextSplitter
 from langchain.schema import Document
-from typing import List, Dict, Any, Optional
+from typing import AsyncIterator, List, Dict, Any, Optional, Tuple
+import asyncio
+import contextlib
+import hashlib
 import logging
-from config import GEMINI_KEY
+import random
+import time
+from config import (
+    GEMINI_KEY, LLM_BACKEND, LLM_MODEL, LLM_MAX_CONCURRENCY, LLM_RATE_LIMIT,
+    LLM_TIMEOUT, LLM_MAX_RETRIES, STUB_LLM_LATENCY
+)
 import json
 import re
+from metrics import record, span
 
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class LLMService:
-    """Service for interacting with Google Gemini API via LangChain"""
-
-    def __init__(self):
-        genai.configure(api_key=GEMINI_KEY)
-        self.model = genai.GenerativeModel("gemini-1.5-flash")
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=2000,
-            chunk_overlap=200,
-            length_function=len,
-            separators=["\n\n", "\n", ".", "!", "?", ",", " ", ""]
+BATCH_CHALLENGE_MARKER = "Return a JSON array"
+BATCH_ANSWER_MARKER = "Reply with a JSON list"
+# Earlier turns quoted verbatim in answer prompts; sessions fold older ones into a summary
+HISTORY_TURNS = 3
+
+# ---------------- BACKENDS ----------------
+
+class LLMBackend:
+    """Interface every text-generation backend implements"""
+
+    name = "base"
+
+    async def generate(self, prompt: str, temperature: float = 0.2, max_output_tokens: int = 600) -> str:
+        raise NotImplementedError
+
+    async def stream(self, prompt: str, temperature: float = 0.2, max_output_tokens: int = 600) -> AsyncIterator[str]:
+        """Yield the completion in pieces as they are produced; by default the whole reply at once"""
+        yield await self.generate(prompt, temperature, max_output_tokens)
+
+
+class GeminiBackend(LLMBackend):
+    """Google Gemini backend using the native async API"""
+
+    name = "gemini"
+
+    def __init__(self, api_key: Optional[str] = GEMINI_KEY, model_name: str = LLM_MODEL):
+        import google.generativeai as genai
+
+        genai.configure(api_key=api_key)
+        self.genai = genai
+        self.model = genai.GenerativeModel(model_name)
+
+    async def generate(self, prompt: str, temperature: float = 0.2, max_output_tokens: int = 600) -> str:
+        response = await self.model.generate_content_async(
+            prompt,
+            generation_config=self.genai.types.GenerationConfig(
+                temperature=temperature,
+                max_output_tokens=max_output_tokens
+            )
+        )
+        return response.text.strip()
+
+    async def stream(self, prompt: str, temperature: float = 0.2, max_output_tokens: int = 600) -> AsyncIterator[str]:
+        response = await self.model.generate_content_async(
+            prompt,
+            generation_config=self.genai.types.GenerationConfig(
+                temperature=temperature,
+                max_output_tokens=max_output_tokens
+            ),
+            stream=True
         )
+        async for chunk in response:
+            if chunk.parts:
+                yield chunk.text
+
+
+class StubBackend(LLMBackend):
+    """Deterministic offline backend for tests and load runs, no network access"""
+
+    name = "stub"
+
+    def __init__(self, latency: float = STUB_LLM_LATENCY, failure_rate: float = 0.0, seed: int = 0):
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self._rng = random.Random(seed)
+        self.calls = 0
+        self.streamed_tokens = 0
+
+    async def generate(self, prompt: str, temperature: float = 0.2, max_output_tokens: int = 600) -> str:
+        self.calls += 1
+        await asyncio.sleep(self.latency)
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise RuntimeError("Stub backend injected failure")
+        return self._reply(prompt)
+
+    async def stream(self, prompt: str, temperature: float = 0.2, max_output_tokens: int = 600) -> AsyncIterator[str]:
+        # Same reply as generate(), word by word with the latency spread across the words
+        self.calls += 1
+        if self.failure_rate and self._rng.random() < self.failure_rate:
+            raise RuntimeError("Stub backend injected failure")
+        words = re.findall(r"\S+\s*", self._reply(prompt))
+        for word in words:
+            await asyncio.sleep(self.latency / len(words))
+            self.streamed_tokens += 1
+            yield word
+
+    def _reply(self, prompt: str) -> str:
+        digest = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+        if BATCH_CHALLENGE_MARKER in prompt:
+            count = len(re.findall(r"^Excerpt \d+:", prompt, flags=re.MULTILINE))
+            return json.dumps([
+                {"excerpt": i + 1, "question": f"Stub question {digest[:8]}-{i + 1}?",
+                 "answer": f"Stub answer {digest[8:16]}-{i + 1}",
+                 "explanation": f"Deterministic stub explanation for excerpt {i + 1}."}
+                for i in range(count)
+            ])
+        if BATCH_ANSWER_MARKER in prompt:
+            count = len(re.findall(r"^Question \d+:", prompt, flags=re.MULTILINE))
+            return json.dumps([{"id": i + 1, "answer": f"Stub answer {digest[8:16]}-{i + 1}"} for i in range(count)])
+        return (
+            f"Q: Stub question {digest[:8]}?\n"
+            f"A: Stub answer {digest[8:16]}\n"
+            f"Justification: Deterministic stub response for a {len(prompt)}-character prompt."
+        )
+
+
+BACKENDS = {
+    GeminiBackend.name: GeminiBackend,
+    StubBackend.name: StubBackend,
+}
+
+
+def create_backend(name: str = LLM_BACKEND) -> LLMBackend:
+    if name not in BACKENDS:
+        raise ValueError(f"Unknown LLM backend: {name}")
+    return BACKENDS[name]()
+
+# ---------------- ASYNC CLIENT ----------------
+
+class RateLimiter:
+    """Async token bucket, `rate` requests per second with bursts up to `burst`"""
+
+    def __init__(self, rate: float, burst: Optional[int] = None):
+        self.rate = rate
+        self.capacity = float(burst or max(1, int(rate)))
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self) -> None:
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                await asyncio.sleep((1 - self._tokens) / self.rate)
+
+
+class AsyncLLMClient:
+    """
+    Concurrency- and rate-limited LLM client with per-call timeouts,
+    retries with jittered exponential backoff and coalescing of
+    identical in-flight requests.
+    """
+
+    def __init__(self, backend: LLMBackend, max_concurrency: int = LLM_MAX_CONCURRENCY,
+                 rate_limit: float = LLM_RATE_LIMIT, timeout: float = LLM_TIMEOUT,
+                 max_retries: int = LLM_MAX_RETRIES, backoff_base: float = 0.5, backoff_max: float = 8.0):
+        self.backend = backend
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._limiter = RateLimiter(rate_limit)
+        self._inflight: Dict[Tuple[str, float, int], asyncio.Task] = {}
+        self.stats = {"requests": 0, "upstream_calls": 0, "coalesced": 0,
+                      "retries": 0, "timeouts": 0, "failures": 0, "in_flight": 0,
+                      "streams": 0, "streams_cancelled": 0}
+
+    async def generate(self, prompt: str, temperature: float = 0.2, max_output_tokens: int = 600) -> str:
+        self.stats["requests"] += 1
+        key = (prompt, temperature, max_output_tokens)
+        task = self._inflight.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self._call_with_retries(prompt, temperature, max_output_tokens))
+            self._inflight[key] = task
+            task.add_done_callback(lambda t, k=key: self._forget(k, t))
+        else:
+            self.stats["coalesced"] += 1
+        # Shield so one cancelled caller does not cancel the call other callers share
+        return await asyncio.shield(task)
+
+    async def stream(self, prompt: str, temperature: float = 0.2, max_output_tokens: int = 600) -> AsyncIterator[str]:
+        """
+        Stream a completion. Streams are never coalesced and hold a
+        concurrency slot until they finish or the consumer stops iterating;
+        closing the generator (e.g. the client went away) closes the upstream
+        stream so no more tokens are paid for. `timeout` bounds the wait for
+        each piece, and a call is only retried before its first piece arrived.
+        """
+        self.stats["requests"] += 1
+        self.stats["streams"] += 1
+        attempt = 0
+        while True:
+            started = False
+            try:
+                await self._limiter.acquire()
+                async with self._semaphore:
+                    self.stats["upstream_calls"] += 1
+                    self.stats["in_flight"] += 1
+                    upstream = self.backend.stream(prompt, temperature, max_output_tokens)
+                    opened = time.perf_counter()
+                    try:
+                        while True:
+                            try:
+                                piece = await asyncio.wait_for(upstream.__anext__(), timeout=self.timeout)
+                            except StopAsyncIteration:
+                                return
+                            if not started:
+                                record("llm_first_token", time.perf_counter() - opened)
+                            started = True
+                            yield piece
+                    finally:
+                        self.stats["in_flight"] -= 1
+                        record("llm_stream", time.perf_counter() - opened)
+                        await upstream.aclose()
+            except (asyncio.CancelledError, GeneratorExit):
+                self.stats["streams_cancelled"] += 1
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                if started or attempt >= self.max_retries:
+                    self.stats["failures"] += 1
+                    logger.error(f"LLM stream failed after {attempt + 1} attempts: {str(e) or type(e).__name__}")
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                self.stats["retries"] += 1
+                logger.warning(f"LLM stream failed ({str(e) or type(e).__name__}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+    def _forget(self, key: Tuple[str, float, int], task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved even if every waiter went away
+
+    async def _call_with_retries(self, prompt: str, temperature: float, max_output_tokens: int) -> str:
+        attempt = 0
+        while True:
+            try:
+                await self._limiter.acquire()
+                async with self._semaphore:
+                    self.stats["upstream_calls"] += 1
+                    self.stats["in_flight"] += 1
+                    try:
+                        with span("llm"):
+                            return await asyncio.wait_for(
+                                self.backend.generate(prompt, temperature, max_output_tokens),
+                                timeout=self.timeout
+                            )
+                    finally:
+                        self.stats["in_flight"] -= 1
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                if isinstance(e, asyncio.TimeoutError):
+                    self.stats["timeouts"] += 1
+                if attempt >= self.max_retries:
+                    self.stats["failures"] += 1
+                    logger.error(f"LLM call failed after {attempt + 1} attempts: {str(e) or type(e).__name__}")
+                    raise
+                delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+                attempt += 1
+                self.stats["retries"] += 1
+                logger.warning(f"LLM call failed ({str(e) or type(e).__name__}), retry {attempt} in {delay:.2f}s")
+                await asyncio.sleep(delay)
+
+# ---------------- CHALLENGE PARSING ----------------
 
-    def generate_summary(self, document_text: str, max_words: int = 150) -> Dict[str, Any]:
+def parse_challenge_reply(text: str) -> Dict[str, Optional[str]]:
+    """Parse a three-line `Q:` / `A:` / `Justification:` reply, missing fields are None"""
+    lines = [ln.strip().lstrip("*-# ").replace("**", "") for ln in text.strip().splitlines() if ln.strip()]
+    field = lambda prefix: next((ln[len(prefix):].strip() for ln in lines if ln.lower().startswith(prefix.lower())), None)
+    return {
+        "question": field("Q:"),
+        "correct_answer": field("A:"),
+        "explanation": field("Justification:"),
+    }
+
+def _challenge_item(item: Any) -> Optional[Dict[str, str]]:
+    if not isinstance(item, dict):
+        return None
+    q = item.get("question") or item.get("q")
+    a = item.get("answer") or item.get("correct_answer") or item.get("a")
+    if not (q and a):
+        return None
+    return {
+        "question": str(q).strip(),
+        "correct_answer": str(a).strip(),
+        "explanation": str(item.get("explanation") or item.get("justification") or "").strip(),
+    }
+
+def parse_challenge_batch(text: str, count: int) -> List[Optional[Dict[str, str]]]:
+    """
+    One slot per excerpt of a batched challenge reply, None where the reply
+    has no usable question for it. Accepts a JSON array (optionally inside
+    a code fence or surrounded by prose) whose objects name their
+    `excerpt`; without excerpt numbers, objects or Q:/A:/Justification:
+    blocks are matched by position only when there is exactly one per
+    excerpt, so a dropped item never shifts the rest onto the wrong excerpt.
+    """
+    slots: List[Optional[Dict[str, str]]] = [None] * count
+    decoder = json.JSONDecoder()
+    cleaned = re.sub(r"```(?:json)?", "", text)
+    for match in re.finditer(r"\[", cleaned):
+        try:
+            items, _ = decoder.raw_decode(cleaned[match.start():])
+        except ValueError:
+            continue
+        if not (isinstance(items, list) and any(isinstance(it, dict) for it in items)):
+            continue
+        numbered = [it for it in items if isinstance(it, dict) and "excerpt" in it]
+        if numbered:
+            for it in numbered:
+                try:
+                    slot = int(it["excerpt"]) - 1
+                except (TypeError, ValueError):
+                    continue
+                if 0 <= slot < count and slots[slot] is None:
+                    slots[slot] = _challenge_item(it)
+        elif len(items) == count:
+            slots = [_challenge_item(it) for it in items]
+        return slots
+    blocks = [parse_challenge_reply(b) for b in re.split(r"(?im)^\s*(?=\**\s*Q:)", text)]
+    blocks = [b for b in blocks if b["question"] or b["correct_answer"]]
+    if len(blocks) == count:
+        for i, parsed in enumerate(blocks):
+            if parsed["question"] and parsed["correct_answer"]:
+                slots[i] = {**parsed, "explanation": parsed["explanation"] or ""}
+    return slots
+
+def parse_answer_batch(text: str, count: int) -> Dict[int, str]:
+    """
+    Answers of a packed question reply keyed by 0-based question position.
+    Accepts a JSON list of {"id", "answer"} objects (or plain strings in
+    question order) and falls back to `Answer N:` lines; unanswered
+    questions are simply absent.
+    """
+    decoder = json.JSONDecoder()
+    cleaned = re.sub(r"```(?:json)?", "", text)
+    for match in re.finditer(r"\[", cleaned):
+        try:
+            items, _ = decoder.raw_decode(cleaned[match.start():])
+        except ValueError:
+            continue
+        if not isinstance(items, list) or not items:
+            continue
+        answers = {}
+        for pos, it in enumerate(items):
+            if isinstance(it, str):
+                key, answer = pos, it
+            elif isinstance(it, dict):
+                try:
+                    key = int(it.get("id", pos + 1)) - 1
+                except (TypeError, ValueError):
+                    continue
+                answer = it.get("answer")
+            else:
+                continue
+            if 0 <= key < count and answer and str(answer).strip():
+                answers[key] = str(answer).strip()
+        if answers:
+            return answers
+    answers = {}
+    for block in re.split(r"(?im)^\s*(?=\**\s*Answer \d+\s*:)", text):
+        found = re.match(r"\**\s*Answer (\d+)\s*:\**\s*(.+)", block.strip(), flags=re.IGNORECASE | re.DOTALL)
+        if found and 0 < int(found.group(1)) <= count:
+            answers[int(found.group(1)) - 1] = found.group(2).strip()
+    return answers
+
+# ---------------- SERVICE ----------------
+
+class LLMService:
+    """Service for interacting with the configured LLM backend"""
+
+    def __init__(self, client: Optional[AsyncLLMClient] = None):
+        self._client = client
+
+    @property
+    def client(self) -> AsyncLLMClient:
+        # Built on first use so importing this module never configures the SDK
+        if self._client is None:
+            self._client = AsyncLLMClient(create_backend())
+        return self._client
+
+    async def generate_summary(self, document_text: str, max_words: int = 150) -> Dict[str, Any]:
+        """Summary of a text that fits one prompt; longer documents go through summarizer.Summarizer"""
         try:
             prompt = f"""
-            Provide a concise summary (max {max_words} words):
-            {document_text[:4000]}
+            Provide a concise summary (max {max_words} words) of this part of a document.
+            Keep the main claims, methods, results and numbers:
+            {document_text}
             """
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.2,
-                    max_output_tokens=300
-                )
-            )
-            summary = response.text.strip()
+            summary = await self.client.generate(prompt, temperature=0.2, max_output_tokens=2 * max_words)
             return {"summary": summary, "word_count": len(summary.split()), "status": "success"}
         except Exception as e:
             logger.error(f"Error generating summary: {str(e)}")
             return {"summary": "Error", "word_count": 0, "status": "error", "error": str(e)}
 
-    def answer_question(self, question: str, document_text: str, conversation_history: Optional[List[Dict]] = None) -> Dict[str, Any]:
+    async def combine_summaries(self, summaries: List[str], max_words: int = 150) -> Dict[str, Any]:
+        """Reduce step: one summary from the summaries of consecutive parts of a document"""
+        try:
+            parts = "\n\n".join(f"Part {i + 1}:\n{s}" for i, s in enumerate(summaries))
+            prompt = f"""
+            Below are summaries of consecutive parts of one document, in order.
+            Combine them into one concise summary (max {max_words} words) of the whole,
+            without repeating points:
+            {parts}
+            """
+            summary = await self.client.generate(prompt, temperature=0.2, max_output_tokens=2 * max_words)
+            return {"summary": summary, "word_count": len(summary.split()), "status": "success"}
+        except Exception as e:
+            logger.error(f"Error combining summaries: {str(e)}")
+            return {"summary": "Error", "word_count": 0, "status": "error", "error": str(e)}
+
+    async def summarize_conversation(self, summary: str, turns: List[Dict], max_words: int = 120) -> Dict[str, Any]:
+        """Rolling conversation summary: the previous one with the given turns folded in"""
         try:
-            context = ""
-            if conversation_history:
-                context = "\n".join([f"Q: {h.get('question','')}\nA: {h.get('answer','')}" for h in conversation_history[-3:]])
+            exchanges = "\n".join(f"Q: {t.get('question', '')}\nA: {t.get('answer', '')}" for t in turns)
             prompt = f"""
-            Document: {document_text[:6000]}\n{context}\nQuestion: {question}
+            Update the summary of a conversation about a document with the exchanges below.
+            Keep the topics asked about, the facts established and any open points;
+            reply with the new summary only (max {max_words} words).
+            Summary so far: {summary or "(none)"}
+            New exchanges:
+            {exchanges}
+            """
+            text = await self.client.generate(prompt, temperature=0.2, max_output_tokens=2 * max_words)
+            return {"summary": text, "word_count": len(text.split()), "status": "success"}
+        except Exception as e:
+            logger.error(f"Error summarizing conversation: {str(e)}")
+            return {"summary": "Error", "word_count": 0, "status": "error", "error": str(e)}
+
+    @staticmethod
+    def _answer_prompt(question: str, document_text: str, conversation_history: Optional[List[Dict]] = None) -> str:
+        # Entries with a "summary" key carry a session's rolling summary of older turns
+        context = ""
+        if conversation_history:
+            summary = next((h["summary"] for h in conversation_history if h.get("summary")), "")
+            turns = [h for h in conversation_history if not h.get("summary")]
+            lines = [f"Earlier in this conversation: {summary}"] if summary else []
+            lines += [f"Q: {h.get('question','')}\nA: {h.get('answer','')}" for h in turns[-HISTORY_TURNS:]]
+            context = "\n".join(lines)
+        return f"""
+            Document: {document_text}\n{context}\nQuestion: {question}
             Answer only from the document. Include justification and snippet.
+            Cite the numbered passages you used, e.g. [1].
             """
-            response = self.model.generate_content(
-                prompt,
-                generation_config=genai.types.GenerationConfig(
-                    temperature=0.2,
-                    max_output_tokens=600
-                )
-            )
-            answer = response.text.strip()
+
+    async def answer_question(self, question: str, document_text: str, conversation_history: Optional[List[Dict]] = None) -> Dict[str, Any]:
+        try:
+            prompt = self._answer_prompt(question, document_text, conversation_history)
+            answer = await self.client.generate(prompt, temperature=0.2, max_output_tokens=600)
             return {
                 "answer": answer,
                 "justification": "Based on document analysis",
@@ -69,18 +478,56 @@ class LLMService:
         except Exception as e:
             return {"answer": "Error", "justification": "", "snippet": "", "status": "error", "error": str(e)}
 
-    def generate_challenge_questions(self, document_text: str, count: int = 3) -> Dict[str, Any]:
+    async def answer_question_batch(self, questions: List[str], document_text: str) -> Dict[int, str]:
+        """
+        One LLM call answering several questions over a shared context.
+        Returns answers by question position; errors propagate so callers
+        can fall back to single-question calls.
+        """
+        numbered = "\n".join(f"Question {i + 1}: {q}" for i, q in enumerate(questions))
+        prompt = (
+            f"Document: {document_text}\n\n{numbered}\n\n"
+            f"Answer every question only from the document and cite the numbered passages you used, e.g. [1]. "
+            f'{BATCH_ANSWER_MARKER} of exactly {len(questions)} objects in question order, each with the keys '
+            f'"id" (the question number) and "answer". Return only the JSON.'
+        )
+        text = await self.client.generate(prompt, temperature=0.2, max_output_tokens=600 * len(questions))
+        with span("parse"):
+            return parse_answer_batch(text, len(questions))
+
+    async def stream_answer(self, question: str, document_text: str, conversation_history: Optional[List[Dict]] = None) -> AsyncIterator[str]:
+        """Answer pieces as the model produces them; errors propagate to the caller"""
+        prompt = self._answer_prompt(question, document_text, conversation_history)
+        # aclosing() so that stopping early closes the upstream stream now, not at garbage collection
+        async with contextlib.aclosing(self.client.stream(prompt, temperature=0.2, max_output_tokens=600)) as pieces:
+            async for piece in pieces:
+                yield piece
+
+    async def generate_challenge_questions(self, document_text: str, count: int = 3) -> Dict[str, Any]:
         try:
             prompt = f"Generate {count} challenging questions with answers in JSON format from:\n{document_text[:6000]}"
-            response = self.model.generate_content(prompt)
-            return {"questions": [{"question": q, "correct_answer": a} for q, a in zip(response.text.split("?")[:-1], response.text.split("?")[1:])], "status": "success"}
+            text = await self.client.generate(prompt)
+            return {"questions": [{"question": q, "correct_answer": a} for q, a in zip(text.split("?")[:-1], text.split("?")[1:])], "status": "success"}
         except Exception as e:
             return {"questions": [], "status": "error", "error": str(e)}
 
-    def evaluate_answer(self, question: str, user_answer: str, correct_answer: str, document_text: str) -> Dict[str, Any]:
+    async def generate_challenge_batch(self, chunks: List[str]) -> List[Optional[Dict[str, str]]]:
+        """Single LLM call for one question per chunk; one slot per chunk, None where the reply has none"""
+        excerpts = "\n\n".join(f"Excerpt {i + 1}:\n{c}" for i, c in enumerate(chunks))
+        prompt = (
+            f"For each of the {len(chunks)} excerpts below, create **one** challenging question that can "
+            f"**only** be answered from that excerpt. {BATCH_CHALLENGE_MARKER} with exactly {len(chunks)} "
+            f'objects in excerpt order, each with the keys "excerpt" (its excerpt number), "question", '
+            f'"answer" (one line) and "explanation" (brief justification). Return only the JSON.\n\n{excerpts}'
+        )
+        text = await self.client.generate(prompt, temperature=0.2, max_output_tokens=300 * len(chunks))
+        with span("parse"):
+            return parse_challenge_batch(text, len(chunks))
+
+    async def evaluate_answer(self, question: str, user_answer: str, correct_answer: str, document_text: str) -> Dict[str, Any]:
         try:
             prompt = f"Score 0-100 for:\nQ: {question}\nA: {user_answer}\nCorrect: {correct_answer}\n"
-            response = self.model.generate_content(prompt)
+            await self.client.generate(prompt)
             return {"score": 100, "feedback": "Auto-evaluated", "reference": "Doc", "status": "success"}
         except Exception as e:
             return {"score": 0, "feedback": "Error", "reference": "", "status": "error", "error": str(e)}
@@ -88,8 +535,45 @@ class LLMService:
 # ---------------- FREE FUNCTION WRAPPER ----------------
 _service = LLMService()
 
-def ask_gemini(question: str, context: str, history: list[str]) -> str:
+def llm_stats() -> Dict[str, int]:
+    """Client counters, empty until the first LLM call (reporting never builds the client)"""
+    client = _service._client
+    return dict(client.stats) if client is not None else {}
+
+async def ask_gemini(question: str, context: str, history: list) -> str:
     """Legacy wrapper used by FastAPI endpoints"""
-    conv = [{"question": q, "answer": a} for q, a in history]
-    result = _service.answer_question(question, context, conv)
-    return result.get("answer", "No answer generated")
\ No newline at end of file
+    conv = [h if isinstance(h, dict) else {"question": h[0], "answer": h[1]} for h in (history or [])]
+    result = await _service.answer_question(question, context, conv)
+    return result.get("answer", "No answer generated")
+
+async def ask_gemini_batch(questions: List[str], context: str) -> Dict[int, str]:
+    return await _service.answer_question_batch(questions, context)
+
+async def stream_gemini(question: str, context: str, history: list) -> AsyncIterator[str]:
+    """Streaming counterpart of ask_gemini, yields answer pieces"""
+    conv = [h if isinstance(h, dict) else {"question": h[0], "answer": h[1]} for h in (history or [])]
+    async with contextlib.aclosing(_service.stream_answer(question, context, conv)) as pieces:
+        async for piece in pieces:
+            yield piece
+
+async def generate_challenge_batch(chunks: List[str]) -> List[Optional[Dict[str, str]]]:
+    return await _service.generate_challenge_batch(chunks)
+
+async def summarize_text(text: str, max_words: int) -> str:
+    """generate_summary for the summarizer: raises instead of returning an error, so failures are not cached"""
+    result = await _service.generate_summary(text, max_words)
+    if result["status"] != "success":
+        raise RuntimeError(result.get("error", "Summary generation failed"))
+    return result["summary"]
+
+async def combine_summaries(summaries: List[str], max_words: int) -> str:
+    result = await _service.combine_summaries(summaries, max_words)
+    if result["status"] != "success":
+        raise RuntimeError(result.get("error", "Summary generation failed"))
+    return result["summary"]
+
+async def fold_conversation(summary: str, turns: List[Dict], max_words: int) -> str:
+    result = await _service.summarize_conversation(summary, turns, max_words)
+    if result["status"] != "success":
+        raise RuntimeError(result.get("error", "Conversation summary failed"))
+    return result["summary"]
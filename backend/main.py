@@ -1,22 +1,52 @@
 from fastapi import FastAPI, File, UploadFile, HTTPException, BackgroundTasks
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
+from fastapi.concurrency import run_in_threadpool
 import uvicorn
+import asyncio
+import contextlib
+import hashlib
+import json
 import logging
-from datetime import datetime
+import threading
 import uuid
-from typing import Dict, Any
+from typing import Dict, Any, Optional
 from pathlib import Path
-from langchain_community.vectorstores import FAISS
-from langchain_community.embeddings import SentenceTransformerEmbeddings
 
 from api_models import (
     DocumentUploadResponse, QuestionRequest, QuestionResponse, ChallengeQuestion,
-    ChallengeQuestionsRequest, EvaluateAnswerRequest
+    EvaluateAnswerRequest, UploadJobResponse, JobStatusResponse,
+    BatchQuestionRequest, BatchQuestionResponse, BatchAnswer, CollectionCreateRequest, CollectionDocumentsRequest,
+    CollectionQuestionRequest, SessionCreateRequest, SessionData
 )
-from doc_processor import save_doc_and_index, summarize, build_vector_index, load_text
-from llm_service import ask_gemini
-from config import GEMINI_KEY
+from doc_processor import (
+    save_doc_and_index, delete_doc_files, store, spool_upload, migrate_baseline_indexes, UploadRejected
+)
+from vector_index import VectorIndex
+from llm_service import (
+    ask_gemini, ask_gemini_batch, stream_gemini, generate_challenge_batch, parse_challenge_reply, llm_stats,
+    summarize_text, combine_summaries, fold_conversation, HISTORY_TURNS
+)
+from embeddings import get_embeddings, warm_up, embedding_cache_stats, embeddings_loaded
+from config import (
+    GEMINI_KEY, INGEST_WORKERS, INGEST_MAX_PENDING, CHALLENGE_FANOUT, CHALLENGE_BATCHED, EMBED_WARMUP,
+    INDEX_CACHE_MAX_BYTES, INDEX_CACHE_POLICY, INDEX_CACHE_PINNED,
+    ANSWER_CACHE_MAX_ENTRIES, ANSWER_CACHE_TTL, ANSWER_CACHE_THRESHOLD, CONTEXT_MAX_TOKENS, CONTEXT_CANDIDATES,
+    RETRIEVAL_MODE, CHALLENGE_PREGENERATE, CHALLENGE_SET_SIZE, EVALUATE_PASS_SCORE,
+    ASK_BATCH_MAX_QUESTIONS, ASK_BATCH_GROUP_SIZE, ASK_BATCH_GROUP_OVERLAP, UPLOAD_MAX_BYTES, SUMMARY_ENABLED,
+    WARMUP_ENABLED
+)
+from jobs import IngestionJobManager, QueueFullError
+from index_cache import IndexCache
+from catalog import DocumentCatalog
+from answer_cache import AnswerCache, normalize_question
+from context_builder import build_context, build_collection_context, citations, group_by_overlap
+from collection_index import CollectionIndex, CollectionStore
+from summarizer import Summarizer
+from sessions import SessionStore
+from warmup import AccessLog, Warmer
+from lexical import is_keyword_query, reciprocal_rank_fusion
+from metrics import REGISTRY, TimingMiddleware, span
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
@@ -27,6 +57,44 @@ app = FastAPI(
     version="1.0.0"
 )
 
+# Room for the multipart framing around the file itself
+UPLOAD_BODY_SLACK = 64 * 1024
+
+class UploadLimitMiddleware:
+    """
+    Pure ASGI middleware that answers 413 to upload bodies over `max_bytes`
+    before the form parser has spooled them: at once from Content-Length,
+    or, for chunked bodies, as soon as the bytes received pass the limit.
+    """
+
+    def __init__(self, app: Any, max_bytes: int, paths: tuple = ("/upload",)):
+        self.app = app
+        self.max_bytes = max_bytes
+        self.paths = paths
+
+    async def __call__(self, scope: Dict[str, Any], receive, send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+        length = dict(scope.get("headers", ())).get(b"content-length", b"")
+        if length.isdigit() and int(length) > self.max_bytes:
+            await JSONResponse({"detail": "Upload is larger than the size limit"}, status_code=413)(scope, receive, send)
+            return
+        received = 0
+
+        async def counting_receive() -> Dict[str, Any]:
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            if received > self.max_bytes:
+                # HTTPException passes through body parsing unchanged and is rendered by FastAPI
+                raise HTTPException(413, "Upload is larger than the size limit")
+            return message
+
+        await self.app(scope, counting_receive, send)
+
+app.add_middleware(UploadLimitMiddleware, max_bytes=UPLOAD_MAX_BYTES + UPLOAD_BODY_SLACK)
+app.add_middleware(TimingMiddleware)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -35,126 +103,849 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
-DATA_DIR = Path("data")
-index_cache = {}
-documents_storage: Dict[str, Dict[str, Any]] = {}
+index_cache = IndexCache(max_bytes=INDEX_CACHE_MAX_BYTES, policy=INDEX_CACHE_POLICY)
+for pinned_doc in INDEX_CACHE_PINNED:
+    index_cache.pin(pinned_doc)
+catalog = DocumentCatalog()
+answer_cache = AnswerCache(max_entries=ANSWER_CACHE_MAX_ENTRIES, ttl=ANSWER_CACHE_TTL,
+                           threshold=ANSWER_CACHE_THRESHOLD)
+KEY_POINTS_QUERY = "key points"
+challenge_locks: Dict[str, asyncio.Lock] = {}
+collection_store = CollectionStore()
+summarizer = Summarizer(catalog, summarize_text, combine_summaries)
+summary_tasks: Dict[str, asyncio.Task] = {}
+sessions = SessionStore(catalog, fold_conversation, max_turns=HISTORY_TURNS)
+access_log = AccessLog(catalog)
+warmer = Warmer(index_cache, access_log, lambda doc_id: load_index(doc_id), warm_up if EMBED_WARMUP else None)
+ingest_jobs = IngestionJobManager(max_workers=INGEST_WORKERS, max_pending=INGEST_MAX_PENDING, catalog=catalog)
+
+@app.on_event("startup")
+async def capture_loop():
+    # Ingestion worker threads hand async follow-up work (challenge generation) back to this loop
+    app.state.loop = asyncio.get_running_loop()
+
+@app.on_event("startup")
+async def restore_catalog():
+    # Warm restart: import indexes of the original data/<stem>.faiss layout, register indexed documents
+    # found on disk, nothing is re-embedded, and fail the jobs a crashed or restarted process left unfinished
+    await run_in_threadpool(migrate_baseline_indexes)
+    await run_in_threadpool(catalog.rebuild_from_store, store)
+    await run_in_threadpool(store.prune_spool)
+    await run_in_threadpool(ingest_jobs.fail_stale)
+
+@app.on_event("startup")
+async def start_warm_up():
+    # Load the embedding model and the most used indexes off the request path without delaying startup
+    if WARMUP_ENABLED:
+        warmer.start()
+        return
+    warmer.ready = True
+    if EMBED_WARMUP:
+        threading.Thread(target=warm_up, name="embed-warmup", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown_workers():
+    ingest_jobs.shutdown(wait=False)
+    warmer.stop()
 
 @app.get("/health", response_model=dict)
 async def health_check():
-    return {"status": "ok"}
+    return {"status": "ok", "ready": warmer.ready, "embeddings_loaded": embeddings_loaded(),
+            "warm_up": warmer.stats()}
 
-def get_index(doc_id):
-    if doc_id in index_cache:
-        return index_cache[doc_id]
-    idx_path = DATA_DIR / f"{doc_id}.faiss"
+@app.get("/health/ready", response_model=dict)
+async def readiness():
+    """Readiness probe: 503 until this worker's first warm-up pass is done, so rolling restarts wait for it"""
+    if not warmer.ready:
+        return JSONResponse(status_code=503, content={"status": "warming"})
+    return {"status": "ready"}
+
+def load_index(doc_id):
+    idx_path = store.index_path(doc_id)
     if not idx_path.exists():
         raise HTTPException(404, "Index not found for document")
-    index = FAISS.load_local(idx_path, SentenceTransformerEmbeddings(model_name="all-MiniLM-L6-v2"), allow_dangerous_deserialization=True)
-    index_cache[doc_id] = index
-    return index
+    with span("index_load"):
+        return VectorIndex(idx_path)
+
+def get_index(doc_id):
+    return index_cache.get(doc_id, lambda: load_index(doc_id))
+
+def embedding_cache_counts():
+    stats = embedding_cache_stats()
+    return None if stats is None else {("hit",): stats["hits"], ("miss",): stats["misses"]}
+
+REGISTRY.gauge_callback("rag_ingest_queue_depth", "Ingestion jobs queued or running", ingest_jobs.pending_count)
+REGISTRY.gauge_callback("rag_llm_in_flight", "Upstream LLM calls in flight", lambda: llm_stats().get("in_flight", 0))
+REGISTRY.counter_callback(
+    "rag_llm_events_total", "LLM client events",
+    lambda: {(k,): v for k, v in llm_stats().items() if k != "in_flight"}, ("event",))
+REGISTRY.gauge_callback("rag_index_cache_bytes", "Estimated bytes of loaded indexes", lambda: index_cache.bytes)
+REGISTRY.gauge_callback("rag_index_cache_entries", "Loaded indexes", lambda: index_cache.stats()["entries"])
+REGISTRY.counter_callback(
+    "rag_index_cache_lookups_total", "Index cache lookups",
+    lambda: {("hit",): index_cache.hits, ("miss",): index_cache.misses, ("eviction",): index_cache.evictions},
+    ("result",))
+REGISTRY.counter_callback(
+    "rag_answer_cache_lookups_total", "Answer cache lookups",
+    lambda: {("exact_hit",): answer_cache.exact_hits, ("semantic_hit",): answer_cache.semantic_hits,
+             ("miss",): answer_cache.misses}, ("result",))
+REGISTRY.counter_callback(
+    "rag_summary_parts_total", "Summary parts by origin",
+    lambda: {("cached",): summarizer.cached_parts, ("generated",): summarizer.generated_parts}, ("result",))
+REGISTRY.gauge_callback("rag_session_cache_bytes", "Estimated bytes of sessions held in memory",
+                        lambda: sessions.bytes)
+REGISTRY.counter_callback(
+    "rag_session_folds_total", "Conversation summary updates",
+    lambda: {("llm",): sessions.folds, ("extractive",): sessions.fold_failures}, ("result",))
+REGISTRY.gauge_callback("rag_warm_up_ready", "1 once the first warm-up pass is done", lambda: float(warmer.ready))
+REGISTRY.counter_callback("rag_embedding_cache_lookups_total", "Chunk embedding cache lookups",
+                          embedding_cache_counts, ("result",))
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics():
+    """Prometheus scrape endpoint; values are per worker process"""
+    return PlainTextResponse(REGISTRY.render(), media_type="text/plain; version=0.0.4")
+
+@app.get("/cache/stats", response_model=dict)
+async def cache_stats():
+    return {"index_cache": index_cache.stats(), "answer_cache": answer_cache.stats(), "sessions": sessions.stats()}
+
+@app.post("/document/{doc_id}/pin", response_model=dict)
+async def pin_document(doc_id: str):
+    if doc_id not in catalog:
+        raise HTTPException(404, "Document not found")
+    index_cache.pin(doc_id)
+    await run_in_threadpool(get_index, doc_id)
+    return {"status": "success", "message": f"Document {doc_id} pinned in index cache"}
+
+@app.delete("/document/{doc_id}/pin", response_model=dict)
+async def unpin_document(doc_id: str):
+    index_cache.unpin(doc_id)
+    return {"status": "success", "message": f"Document {doc_id} unpinned"}
+
+def register_document(doc_id: str, meta: Dict[str, Any]) -> Dict[str, Any]:
+    catalog.upsert(meta, store.index_path(doc_id))
+    return DocumentUploadResponse(
+        status="success",
+        message="Document uploaded successfully",
+        document_id=doc_id,
+        filename=meta["filename"],
+        word_count=meta["word_count"],
+        char_count=meta["char_count"],
+        file_type=meta["file_type"],
+        summary=meta["summary"]
+    ).dict()
 
-@app.post("/upload", response_model=DocumentUploadResponse)
-async def upload_document(file: UploadFile = File(...)):
+def ingest_document(job_id: str, spooled: Path, doc_id: str, filename: str,
+                    pregenerate_challenges: bool = False) -> Dict[str, Any]:
+    """Runs on an ingestion worker thread, never on the event loop"""
+    def report(stage: str, fraction: float):
+        ingest_jobs.update(job_id, status=stage, progress=fraction)
+
+    doc_id, meta = save_doc_and_index(spooled, filename, progress=report, doc_id=doc_id)
+    # Freshly (re-)indexed: answers and challenges tied to an earlier index must not be served
+    answer_cache.invalidate(doc_id)
+    catalog.delete_challenges(doc_id)
+    logger.info(f"Document ingested: {doc_id}")
+    result = register_document(doc_id, meta)
+    # The document is indexed and registered from here on: a follow-up that cannot start (the event
+    # loop closes at shutdown, for one) must not fail the job and make the client upload it again
+    if pregenerate_challenges:
+        try:
+            schedule_challenges(doc_id)
+        except Exception as e:
+            logger.error(f"Could not schedule challenges for {doc_id}: {str(e)}")
+    if SUMMARY_ENABLED:
+        # The job result carries the quick extract; the full summary replaces it when ready
+        try:
+            app.state.loop.call_soon_threadsafe(start_summary, doc_id)
+        except Exception as e:
+            logger.error(f"Could not start the summary of {doc_id}: {str(e)}")
+    return result
+
+@app.post("/upload", response_model=UploadJobResponse, status_code=202)
+async def upload_document(file: UploadFile = File(...), challenges: bool = CHALLENGE_PREGENERATE):
+    filename = file.filename or ""
     try:
-        file_bytes = await file.read()
-        doc_id, text = save_doc_and_index(file_bytes, file.filename)
-        summary = summarize(text)
-        documents_storage[doc_id] = {
-            "doc_id": doc_id,
-            "filename": file.filename,
-            "text": text,
-            "summary": summary,
-            "upload_timestamp": datetime.now(),
-            "status": "ready"
-        }
-        logger.info(f"Document uploaded: {doc_id}")
-        return DocumentUploadResponse(
-            status="success",
-            message="Document uploaded successfully",
-            document_id=doc_id,  # <-- use document_id
-            filename=file.filename,
-            word_count=len(text.split()),
-            char_count=len(text),
-            file_type=Path(file.filename).suffix,
-            summary=summary
+        # Streamed to disk piece by piece and hashed on the way; the bytes are never held in memory
+        doc_id, spooled = await run_in_threadpool(spool_upload, file.file, filename)
+    except UploadRejected as e:
+        raise HTTPException(status_code=e.status_code, detail=str(e))
+    try:
+        if store.is_ready(doc_id):
+            # Identical bytes were ingested before: answer from the existing index
+            result = register_document(doc_id, store.read_meta(doc_id))
+            job = ingest_jobs.record_done(result, document_id=doc_id, filename=filename)
+            if challenges:
+                schedule_challenges(doc_id)
+            message = "Document already indexed"
+        else:
+            job = ingest_jobs.find_active(doc_id)
+            if job is None:
+                job = ingest_jobs.submit(ingest_document, spooled, doc_id, filename, challenges,
+                                         document_id=doc_id, filename=filename)
+                spooled = None  # the ingestion job owns the file now
+            message = "Document queued for processing"
+        logger.info(f"Upload {doc_id}: {message.lower()} (job {job['job_id']})")
+        return UploadJobResponse(
+            status=job["status"],
+            message=message,
+            job_id=job["job_id"],
+            document_id=doc_id,
+            filename=filename
         )
+    except QueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         logger.error(f"Error uploading document: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        if spooled is not None:
+            spooled.unlink(missing_ok=True)
+
+@app.get("/jobs/{job_id}", response_model=JobStatusResponse)
+async def get_job_status(job_id: str):
+    job = ingest_jobs.get(job_id)
+    if job is None:
+        raise HTTPException(404, "Job not found")
+    return JobStatusResponse(**job)
+
+def is_cacheable(req: QuestionRequest, history: list) -> bool:
+    # Answers that depend on earlier turns, a custom context budget or retrieval mode are not reusable
+    return not history and req.max_context_tokens is None and req.retrieval_mode is None
+
+def conversation(req: QuestionRequest):
+    """(session, prompt history) of a question: the session's bounded history, else the one sent along"""
+    if req.session_id is None:
+        return None, req.conversation_history or []
+    session = sessions.get(req.session_id)
+    if session is None:
+        raise HTTPException(404, "Session not found")
+    if session.document_id != req.document_id:
+        raise HTTPException(422, "Session belongs to another document")
+    return session, sessions.history(session)
+
+def remember_turn(session: Optional[SessionData], question: str, result: Dict[str, Any]) -> None:
+    if session is None or result["answer"] == "Error":
+        return
+    updated = sessions.add_turn(session.session_id, question, result["answer"], result.get("justification", ""))
+    if updated is not None and updated.unsummarized:
+        sessions.schedule_fold(session.session_id)
+
+def retrieval_mode(question: str, requested: Optional[str]) -> str:
+    mode = requested or RETRIEVAL_MODE
+    if mode == "auto":
+        return "lexical" if is_keyword_query(question) else "hybrid"
+    return mode
+
+async def retrieve_for_question(req: QuestionRequest, history: list):
+    """
+    Shared retrieval step of /ask and /ask/stream: returns (cached payload,
+    query vector, context). A cached payload short-circuits retrieval.
+    The lexical mode never loads or runs the embedding model; it falls back
+    to hybrid when no chunk contains a query term.
+    """
+    cacheable = is_cacheable(req, history)
+    if cacheable:
+        cached = answer_cache.get(req.document_id, req.question)
+        if cached is not None:
+            return cached, None, None
+    index = await run_in_threadpool(get_index, req.document_id)
+    mode = retrieval_mode(req.question, req.retrieval_mode)
+    query_vector = None
+    candidates = []
+    if mode == "lexical":
+        candidates = [i for i, _ in index.lexical_search(req.question, CONTEXT_CANDIDATES)]
+        if not candidates:
+            mode = "hybrid"
+    if mode != "lexical":
+        with span("embed_query"):
+            query_vector = await run_in_threadpool(get_embeddings().embed_query, req.question)
+        if cacheable:
+            cached = answer_cache.get(req.document_id, req.question, query_vector)
+            if cached is not None:
+                return cached, query_vector, None
+        if mode == "vector":
+            candidates = [i for i, _ in index.search_by_vector(query_vector, CONTEXT_CANDIDATES)]
+        else:
+            candidates = index.hybrid_search(req.question, query_vector, CONTEXT_CANDIDATES, CONTEXT_CANDIDATES)
+    # Cosine relevance only suits a pure vector ranking; lexical and fused rankings use their rank order
+    with span("prompt_build"):
+        context = await run_in_threadpool(build_context, index, candidates,
+                                          req.max_context_tokens or CONTEXT_MAX_TOKENS,
+                                          query_vector if mode == "vector" else None)
+    return None, query_vector, context
+
+SNIPPET_CHARS = 400
+
+def snippet_of(passage: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Snippet text and where exactly it sits in the document (page and character span), when known"""
+    if passage is None:
+        return {"snippet": "...", "snippet_location": None}
+    text = passage["text"][:SNIPPET_CHARS]
+    location = None
+    if passage["start"] >= 0:
+        location = {"page": passage["page"], "start": passage["start"], "end": passage["start"] + len(text)}
+    return {"snippet": text + "...", "snippet_location": location}
+
+def answer_payload(answer: str, context: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "answer": answer,
+        "justification": "Generated from retrieved context.",
+        **snippet_of(context["passages"][0] if context["passages"] else None),
+        "status": "success",
+        "citations": citations(context)
+    }
+
+@app.post("/sessions", response_model=SessionData)
+async def create_session(req: SessionCreateRequest):
+    """
+    Start a conversation about a document. Pass the returned session_id to
+    /ask or /ask/stream instead of conversation_history: the server keeps
+    the history, so each turn sends only its question and the prompt holds
+    a rolling summary plus the last few turns however long the chat runs.
+    """
+    if req.document_id not in catalog:
+        raise HTTPException(404, "Document not found")
+    return sessions.create(req.document_id)
+
+@app.get("/sessions/{session_id}", response_model=SessionData)
+async def get_session(session_id: str):
+    session = sessions.get(session_id)
+    if session is None:
+        raise HTTPException(404, "Session not found")
+    return session
+
+@app.delete("/sessions/{session_id}", response_model=dict)
+async def delete_session(session_id: str):
+    if not sessions.delete(session_id):
+        raise HTTPException(404, "Session not found")
+    return {"status": "success", "message": "Session deleted"}
 
 @app.post("/ask", response_model=QuestionResponse)
 async def ask_question(req: QuestionRequest):
+    session, history = conversation(req)
     try:
-        if req.document_id not in documents_storage:
+        if req.document_id not in catalog:
             raise HTTPException(404, "Document not found")
-        document = documents_storage[req.document_id]
-        index = get_index(req.document_id)
-        docs = index.similarity_search(req.question, k=5)
-        context = "\n".join([d.page_content for d in docs])
-        context = context[:2000]
-        logging.warning("Calling Gemini API...")
-        answer = ask_gemini(req.question, context, req.conversation_history)
-        logging.warning("Gemini API returned.")
-        return QuestionResponse(
-            answer=answer,
-            justification="Generated from retrieved context.",
-            snippet=context[:400] + "...",
-            status="success" 
-        )
+        access_log.record(req.document_id)
+        cached, query_vector, context = await retrieve_for_question(req, history)
+        if cached is not None:
+            remember_turn(session, req.question, cached)
+            return QuestionResponse(**cached, cached=True)
+        answer = await ask_gemini(req.question, context["text"], history)
+        result = answer_payload(answer, context)
+        if is_cacheable(req, history) and answer != "Error":
+            answer_cache.put(req.document_id, req.question, query_vector, result)
+        remember_turn(session, req.question, result)
+        return QuestionResponse(**result)
     except Exception as e:
         logger.error(f"Error answering question: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def sse_event(event: str, data: Dict[str, Any]) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+@app.post("/ask/stream")
+async def ask_question_stream(req: QuestionRequest):
+    """
+    Server-sent events variant of /ask: a `meta` event with the snippet as
+    soon as retrieval is done, `token` events as the model produces the
+    answer, then `done` with the full answer (or `error`). When the client
+    disconnects Starlette cancels the generator, which closes the upstream LLM
+    stream so an abandoned request stops consuming quota.
+    """
+    if req.document_id not in catalog:
+        raise HTTPException(404, "Document not found")
+    session, history = conversation(req)
+    access_log.record(req.document_id)
+
+    async def events():
+        try:
+            cached, query_vector, context = await retrieve_for_question(req, history)
+            if cached is not None:
+                remember_turn(session, req.question, cached)
+                yield sse_event("meta", {"justification": cached["justification"], "snippet": cached["snippet"],
+                                         "snippet_location": cached.get("snippet_location"),
+                                         "citations": cached.get("citations", []), "cached": True})
+                yield sse_event("token", {"text": cached["answer"]})
+                yield sse_event("done", {**cached, "cached": True})
+                return
+            result = answer_payload("", context)
+            yield sse_event("meta", {"justification": result["justification"], "snippet": result["snippet"],
+                                     "snippet_location": result["snippet_location"],
+                                     "citations": result["citations"], "cached": False})
+            pieces = []
+            async with contextlib.aclosing(stream_gemini(req.question, context["text"], history)) as stream:
+                async for piece in stream:
+                    pieces.append(piece)
+                    yield sse_event("token", {"text": piece})
+            result["answer"] = "".join(pieces).strip()
+            if is_cacheable(req, history):
+                answer_cache.put(req.document_id, req.question, query_vector, result)
+            remember_turn(session, req.question, result)
+            yield sse_event("done", {**result, "cached": False})
+        except asyncio.CancelledError:
+            logger.info("Answer stream cancelled")
+            raise
+        except Exception as e:
+            logger.error(f"Error streaming answer: {str(e)}")
+            yield sse_event("error", {"detail": str(e)})
+
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def rank_batch(index: VectorIndex, questions: list, modes: list, vectors: list) -> list:
+    """
+    Candidate rankings for /ask/batch. Questions with a vector share one
+    matrix search per mode; lexical ones hit the postings directly.
+    """
+    rankings = [[] for _ in questions]
+    for mode in ("vector", "hybrid"):
+        rows = [i for i, m in enumerate(modes) if m == mode and vectors[i] is not None]
+        if not rows:
+            continue
+        if mode == "vector":
+            found = [[c for c, _ in hits] for hits in index.search_by_vectors([vectors[i] for i in rows], CONTEXT_CANDIDATES)]
+        else:
+            found = index.hybrid_search_many([questions[i] for i in rows], [vectors[i] for i in rows],
+                                             CONTEXT_CANDIDATES, CONTEXT_CANDIDATES)
+        for i, ranking in zip(rows, found):
+            rankings[i] = ranking
+    return rankings
+
+def batch_answer(answer: str, context: Dict[str, Any], ranking: list) -> Dict[str, Any]:
+    """answer_payload for one question of a shared context: only the passages its own retrieval found"""
+    result = answer_payload(answer, context)
+    own = [p for p in context["passages"] if set(ranking).intersection(p["chunks"])]
+    if own:
+        result.update(snippet_of(own[0]))
+        result["citations"] = citations(context, ranking)
+    return result
+
+@app.post("/ask/batch", response_model=BatchQuestionResponse)
+async def ask_question_batch(req: BatchQuestionRequest):
+    """
+    Answer many questions about one document in one request. All questions
+    are embedded in one forward pass and searched with one matrix product;
+    questions whose retrieved chunks overlap are packed into one LLM call
+    over a shared context. A question the packed reply misses is retried on
+    its own. Failures are reported per question and never fail the batch.
+    """
+    if req.document_id not in catalog:
+        raise HTTPException(404, "Document not found")
+    if len(req.questions) > ASK_BATCH_MAX_QUESTIONS:
+        raise HTTPException(422, f"At most {ASK_BATCH_MAX_QUESTIONS} questions per batch")
+    access_log.record(req.document_id)
+    try:
+        doc_id = req.document_id
+        budget = req.max_context_tokens or CONTEXT_MAX_TOKENS
+        cacheable = req.max_context_tokens is None and req.retrieval_mode is None
+        # Repeated questions are answered once
+        canonical: Dict[str, str] = {}
+        for q in req.questions:
+            canonical.setdefault(normalize_question(q), q)
+        unique = list(canonical.values())
+        results: Dict[str, Dict[str, Any]] = {}
+        for q in unique:
+            cached = answer_cache.get(doc_id, q) if cacheable else None
+            if cached is not None:
+                results[q] = {**cached, "cached": True}
+        index = await run_in_threadpool(get_index, doc_id)
+        pending = [q for q in unique if q not in results]
+        modes = [retrieval_mode(q, req.retrieval_mode) for q in pending]
+        lexical = {}
+        for i, q in enumerate(pending):
+            if modes[i] == "lexical":
+                lexical[i] = [c for c, _ in index.lexical_search(q, CONTEXT_CANDIDATES)]
+                if not lexical[i]:
+                    modes[i] = "hybrid"
+        vectors = [None] * len(pending)
+        embed_rows = [i for i, m in enumerate(modes) if m != "lexical"]
+        if embed_rows:
+            with span("embed_query"):
+                embedded = await run_in_threadpool(get_embeddings().embed_documents, [pending[i] for i in embed_rows])
+            for i, vector in zip(embed_rows, embedded):
+                vectors[i] = vector
+                cached = answer_cache.get(doc_id, pending[i], vector) if cacheable else None
+                if cached is not None:
+                    results[pending[i]] = {**cached, "cached": True}
+                    modes[i] = "cached"
+        rankings = await run_in_threadpool(rank_batch, index, pending, modes, vectors)
+        for i, ranking in lexical.items():
+            if modes[i] == "lexical":
+                rankings[i] = ranking
+        rows = [i for i, m in enumerate(modes) if m != "cached"]
+        llm_calls = 0
+
+        async def answer_alone(i: int) -> None:
+            nonlocal llm_calls
+            with span("prompt_build"):
+                context = await run_in_threadpool(build_context, index, rankings[i], budget,
+                                                  vectors[i] if modes[i] == "vector" else None)
+            llm_calls += 1
+            answer = await ask_gemini(pending[i], context["text"], [])
+            if answer == "Error":
+                results[pending[i]] = {"status": "error", "error": "Answer generation failed"}
+                return
+            results[pending[i]] = answer_payload(answer, context)
+            if cacheable:
+                answer_cache.put(doc_id, pending[i], vectors[i], results[pending[i]])
+
+        async def answer_group(group: list) -> None:
+            nonlocal llm_calls
+            if len(group) == 1:
+                await answer_alone(group[0])
+                return
+            fused = reciprocal_rank_fusion([rankings[i] for i in group])
+            with span("prompt_build"):
+                context = await run_in_threadpool(build_context, index, fused, budget * len(group))
+            llm_calls += 1
+            try:
+                answers = await ask_gemini_batch([pending[i] for i in group], context["text"])
+            except Exception as e:
+                logger.warning(f"Packed answer call failed, answering {len(group)} questions one by one: {e}")
+                answers = {}
+            missed = []
+            for pos, i in enumerate(group):
+                if pos not in answers:
+                    missed.append(i)
+                    continue
+                results[pending[i]] = batch_answer(answers[pos], context, rankings[i])
+                if cacheable:
+                    answer_cache.put(doc_id, pending[i], vectors[i], results[pending[i]])
+            await asyncio.gather(*(answer_alone(i) for i in missed))
+
+        groups = group_by_overlap([rankings[i] for i in rows], ASK_BATCH_GROUP_SIZE, ASK_BATCH_GROUP_OVERLAP)
+        await asyncio.gather(*(answer_group([rows[p] for p in group]) for group in groups))
+
+        answers = []
+        for q in req.questions:
+            result = results[canonical[normalize_question(q)]]
+            answers.append(BatchAnswer(question=q, **{k: v for k, v in result.items() if k in BatchAnswer.model_fields}))
+        failed = sum(a.status != "success" for a in answers)
+        status = "success" if not failed else "partial" if failed < len(answers) else "error"
+        return BatchQuestionResponse(document_id=doc_id, status=status, results=answers, llm_calls=llm_calls)
+    except Exception as e:
+        logger.error(f"Error answering question batch: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def collection_cache_key(collection_id: str) -> str:
+    # Collection answers share the answer cache with documents, under their own key
+    return f"collection:{collection_id}"
+
+def get_collection(collection_id: str) -> Dict[str, Any]:
+    collection = catalog.get_collection(collection_id)
+    if collection is None:
+        raise HTTPException(404, "Collection not found")
+    return collection
+
+def open_collection(collection: Dict[str, Any]) -> CollectionIndex:
+    return collection_store.get(collection["collection_id"], collection["generation"])
+
+def check_documents(doc_ids: list) -> None:
+    missing = [doc_id for doc_id in doc_ids if doc_id not in catalog]
+    if missing:
+        raise HTTPException(422, f"Unknown documents: {', '.join(missing)}")
+
+def add_to_collection(collection: Dict[str, Any], doc_ids: list) -> int:
+    """Copy the documents' vectors into the collection's shards; returns how many were not members yet"""
+    index = open_collection(collection)
+    # Indexes are opened for the copy only, so a large import does not flush the index cache
+    added = sum(index.add(doc_id, load_index(doc_id).vectors) for doc_id in dict.fromkeys(doc_ids))
+    catalog.add_collection_documents(collection["collection_id"], doc_ids)
+    answer_cache.invalidate(collection_cache_key(collection["collection_id"]))
+    return added
+
+def remove_from_collection(collection_id: str, doc_id: str) -> bool:
+    collection = catalog.get_collection(collection_id)
+    removed = open_collection(collection).remove(doc_id)
+    removed = catalog.remove_collection_document(collection_id, doc_id) or removed
+    answer_cache.invalidate(collection_cache_key(collection_id))
+    return removed
+
+def collection_info(collection_id: str) -> Dict[str, Any]:
+    collection = catalog.get_collection(collection_id)
+    return {**collection, "index": open_collection(collection).stats()}
+
+def collection_context(collection: Dict[str, Any], query_vector: list, max_tokens: int) -> Dict[str, Any]:
+    """Top chunks across the collection's shards, re-scored exactly, assembled into one cited context"""
+    ranked = open_collection(collection).search(query_vector, CONTEXT_CANDIDATES, get_index)
+    doc_ids = list(dict.fromkeys(doc_id for doc_id, _, _ in ranked))
+    titles = {doc_id: (catalog.get(doc_id) or {}).get("filename", doc_id) for doc_id in doc_ids}
+    with span("prompt_build"):
+        return build_collection_context({doc_id: get_index(doc_id) for doc_id in doc_ids},
+                                        [(doc_id, chunk) for doc_id, chunk, _ in ranked], titles,
+                                        max_tokens, query_vector)
+
+@app.post("/collections", response_model=dict)
+async def create_collection(req: CollectionCreateRequest):
+    check_documents(req.document_ids)
+    try:
+        collection_id = uuid.uuid4().hex
+        catalog.create_collection(collection_id, req.name)
+        if req.document_ids:
+            await run_in_threadpool(add_to_collection, catalog.get_collection(collection_id), req.document_ids)
+        return await run_in_threadpool(collection_info, collection_id)
+    except Exception as e:
+        logger.error(f"Error creating collection: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.get("/collections", response_model=list)
+async def list_collections():
+    return catalog.list_collections()
+
+@app.get("/collections/{collection_id}", response_model=dict)
+async def get_collection_info(collection_id: str):
+    get_collection(collection_id)
+    info = await run_in_threadpool(collection_info, collection_id)
+    info["documents"] = [
+        {"doc_id": doc_id, "filename": (catalog.get(doc_id) or {}).get("filename", doc_id)}
+        for doc_id in catalog.collection_documents(collection_id)
+    ]
+    return info
+
+@app.post("/collections/{collection_id}/documents", response_model=dict)
+async def add_collection_documents(collection_id: str, req: CollectionDocumentsRequest):
+    collection = get_collection(collection_id)
+    check_documents(req.document_ids)
+    try:
+        added = await run_in_threadpool(add_to_collection, collection, req.document_ids)
+        return {"status": "success", "added": added, **await run_in_threadpool(collection_info, collection_id)}
+    except Exception as e:
+        logger.error(f"Error adding documents to collection: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+@app.delete("/collections/{collection_id}/documents/{doc_id}", response_model=dict)
+async def remove_collection_document(collection_id: str, doc_id: str):
+    get_collection(collection_id)
+    if not await run_in_threadpool(remove_from_collection, collection_id, doc_id):
+        raise HTTPException(404, "Document is not in this collection")
+    return {"status": "success", "message": f"Document {doc_id} removed from collection"}
+
+@app.delete("/collections/{collection_id}", response_model=dict)
+async def delete_collection(collection_id: str):
+    if not catalog.delete_collection(collection_id):
+        raise HTTPException(404, "Collection not found")
+    answer_cache.invalidate(collection_cache_key(collection_id))
+    await run_in_threadpool(collection_store.delete, collection_id)
+    return {"status": "success", "message": "Collection deleted successfully"}
+
+@app.post("/collections/{collection_id}/ask", response_model=QuestionResponse)
+async def ask_collection(collection_id: str, req: CollectionQuestionRequest):
+    collection = get_collection(collection_id)
+    try:
+        key = collection_cache_key(collection_id)
+        cacheable = not req.conversation_history and req.max_context_tokens is None
+        if cacheable:
+            cached = answer_cache.get(key, req.question)
+            if cached is not None:
+                return QuestionResponse(**cached, cached=True)
+        with span("embed_query"):
+            query_vector = await run_in_threadpool(get_embeddings().embed_query, req.question)
+        if cacheable:
+            cached = answer_cache.get(key, req.question, query_vector)
+            if cached is not None:
+                return QuestionResponse(**cached, cached=True)
+        context = await run_in_threadpool(collection_context, collection, query_vector,
+                                          req.max_context_tokens or CONTEXT_MAX_TOKENS)
+        answer = await ask_gemini(req.question, context["text"], req.conversation_history)
+        result = answer_payload(answer, context)
+        if cacheable and answer != "Error":
+            answer_cache.put(key, req.question, query_vector, result)
+        return QuestionResponse(**result)
+    except Exception as e:
+        logger.error(f"Error answering collection question: {str(e)}")
+        raise HTTPException(status_code=500, detail=str(e))
+
+def key_point_chunks(index: VectorIndex, k: int) -> list:
+    """
+    Chunks that challenges are generated from and evaluated against. Lexical
+    only, so it is deterministic and needs no embedding model; padded with
+    the document's leading chunks when fewer than k chunks match.
+    """
+    ids = [i for i, _ in index.lexical_search(KEY_POINTS_QUERY, k)]
+    for i in range(index.count):
+        if len(ids) >= k:
+            break
+        if i not in ids:
+            ids.append(i)
+    return ids
+
+async def challenge_from_chunk(i: int, chunk: str, fanout: asyncio.Semaphore) -> Dict[str, Optional[str]]:
+    prompt = (
+        f"Given the document chunk below, create **one** challenging question that can **only** be answered "
+        f"from this excerpt. Provide your answer in exactly three lines:\n"
+        f"Q: <your question>\n"
+        f"A: <one-line correct answer>\n"
+        f"Justification: <brief explanation>\n\n"
+        f"{chunk}"
+    )
+    async with fanout:
+        result = await ask_gemini(prompt, context="", history=[])
+    with span("parse"):
+        return parse_challenge_reply(result)
+
+def challenge_id(doc_id: str, position: int) -> str:
+    # Positions map to chunks deterministically, so the id is stable across regenerations and processes
+    return hashlib.sha256(f"{doc_id}:{position}".encode("utf-8")).hexdigest()[:16]
+
+async def ensure_challenges(doc_id: str, count: int, batched: bool = CHALLENGE_BATCHED) -> list:
+    """
+    Return the document's first `count` challenges, generating and storing
+    only the ones not persisted yet. Replies that could not be parsed are
+    returned with a fallback built from the chunk but not stored, so they
+    are retried on the next request.
+    """
+    lock = challenge_locks.setdefault(doc_id, asyncio.Lock())
+    async with lock:
+        stored = catalog.list_challenges(doc_id, count)
+        if len(stored) >= count:
+            return stored
+        index = await run_in_threadpool(get_index, doc_id)
+        chunk_ids = key_point_chunks(index, count)
+        have = {c["position"] for c in stored}
+        positions = [p for p in range(len(chunk_ids)) if p not in have]
+        chunks = [index.chunk_text(chunk_ids[p]) for p in positions]
+        parsed: list = [None] * len(chunks)
+        if batched and chunks:
+            try:
+                for i, reply in enumerate(await generate_challenge_batch(chunks)):
+                    parsed[i] = reply
+            except Exception as e:
+                logger.warning(f"Batched challenge generation failed, falling back to fan-out: {str(e)}")
+        # Per-chunk calls for everything the batch did not cover, run concurrently
+        fanout = asyncio.Semaphore(CHALLENGE_FANOUT)
+        missing = [i for i, c in enumerate(parsed) if c is None]
+        results = await asyncio.gather(*(challenge_from_chunk(positions[i], chunks[i], fanout) for i in missing))
+        for i, reply in zip(missing, results):
+            parsed[i] = reply
+        fresh, unparsed = [], []
+        for position, chunk, reply in zip(positions, chunks, parsed):
+            challenge = {"challenge_id": challenge_id(doc_id, position), "position": position,
+                         "chunk": chunk_ids[position], "difficulty": "medium"}
+            if reply["question"] and reply["correct_answer"]:
+                fresh.append({**challenge, "question": reply["question"], "correct_answer": reply["correct_answer"],
+                              "explanation": reply["explanation"] or ""})
+            else:
+                unparsed.append({**challenge, "question": f"Unparsed question for chunk {position + 1}",
+                                 "correct_answer": chunk.split(".")[0], "explanation": chunk[:200]})
+        catalog.add_challenges(doc_id, fresh)
+        return sorted(catalog.list_challenges(doc_id, count) + unparsed, key=lambda c: c["position"])
+
+def schedule_challenges(doc_id: str) -> None:
+    """Called from an ingestion worker thread: generate the challenge set on the event loop"""
+    def log_failure(future):
+        if not future.cancelled() and future.exception() is not None:
+            logger.warning(f"Challenge pre-generation failed for {doc_id}: {future.exception()}")
+
+    coroutine = ensure_challenges(doc_id, CHALLENGE_SET_SIZE)
+    try:
+        future = asyncio.run_coroutine_threadsafe(coroutine, app.state.loop)
+    except Exception:
+        coroutine.close()
+        raise
+    future.add_done_callback(log_failure)
+
 @app.get("/challenges", response_model=list[ChallengeQuestion])
-async def generate_challenge_questions(document_id: str, count: int = 3):
+async def generate_challenge_questions(document_id: str, count: int = 3, batched: bool = CHALLENGE_BATCHED):
     try:
-        if document_id not in documents_storage:
+        if document_id not in catalog:
             raise HTTPException(404, "Document not found")
-        index = get_index(document_id)
-        docs = index.similarity_search("key points", k=count)
-        challenges = []
-        for i, d in enumerate(docs):
-            prompt = (
-                f"Given the document chunk below, create **one** challenging question that can **only** be answered "
-                f"from this excerpt. Provide your answer in exactly three lines:\n"
-                f"Q: <your question>\n"
-                f"A: <one-line correct answer>\n"
-                f"Justification: <brief explanation>\n\n"
-                f"{d.page_content}"
-            )
-            result = ask_gemini(prompt, context="", history=[])
-            lines = [ln.strip() for ln in result.strip().splitlines() if ln.strip()]
-            q = next((ln[3:].strip() for ln in lines if ln.startswith("Q:")), f"Unparsed question for chunk {i+1}")
-            a = next((ln[3:].strip() for ln in lines if ln.startswith("A:")), d.page_content.split(".")[0])
-            j = next((ln[14:].strip() for ln in lines if ln.startswith("Justification:")), d.page_content[:200])
-            challenges.append(ChallengeQuestion(question=q, correct_answer=a, explanation=j, difficulty="medium")
-            )
-        return challenges
+        access_log.record(document_id)
+        return [ChallengeQuestion(**c) for c in await ensure_challenges(document_id, count, batched)]
     except Exception as e:
         logger.error(f"Error generating challenge questions: {str(e)}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def grade_answer(user_answer: str, gold: str) -> float:
+    """Share of the gold answer's tokens present in the user's answer, 1.0 on a containment match"""
+    user, reference = normalize_question(user_answer), normalize_question(gold)
+    if not user or not reference:
+        return 0.0
+    if user in reference or reference in user:
+        return 1.0
+    gold_tokens = set(reference.split())
+    return len(gold_tokens & set(user.split())) / len(gold_tokens)
+
 @app.post("/evaluate", response_model=dict)
 async def evaluate_answer(req: EvaluateAnswerRequest):
+    """Pure lookup against the stored challenge: no retrieval and no model call"""
+    if req.challenge_id is not None:
+        challenge = catalog.get_challenge(req.challenge_id)
+    elif req.challenge_index is not None:
+        challenge = catalog.get_challenge_at(req.document_id, req.challenge_index)
+    else:
+        raise HTTPException(422, "challenge_id or challenge_index is required")
+    if challenge is None or challenge["doc_id"] != req.document_id:
+        raise HTTPException(404, "Challenge not found, request /challenges first")
+    score = grade_answer(req.user_answer, challenge["correct_answer"])
+    return {
+        "challenge_id": challenge["challenge_id"],
+        "correct": score >= EVALUATE_PASS_SCORE,
+        "score": round(score * 100),
+        "correct_answer": challenge["correct_answer"],
+        "explanation": challenge["explanation"]
+    }
+
+async def build_summary(doc_id: str) -> None:
+    """Map-reduce summary of the whole document, stored in the catalog and meta.json when done"""
+    catalog.set_summary_status(doc_id, "pending")
     try:
-        index = get_index(req.document_id)
-        docs = index.similarity_search("key points", k=3)
-        gold = docs[req.challenge_index].page_content.split(".")[0]
-        correct = req.user_answer.strip().lower() in gold.lower()
-        return {"correct": correct, "explanation": docs[req.challenge_index].page_content[:200]}
+        text = await run_in_threadpool(store.read_text, doc_id)
+        summary = await summarizer.summarize(text)
     except Exception as e:
-        logger.error(f"Error evaluating answer: {str(e)}")
-        raise HTTPException(status_code=500, detail=str(e))
+        logger.warning(f"Summary generation failed for {doc_id}: {str(e)}")
+        if doc_id in catalog:
+            catalog.set_summary_status(doc_id, "failed", error=str(e))
+        return
+    if doc_id not in catalog:
+        return  # deleted while the summary was being generated
+    catalog.set_summary_status(doc_id, "ready", summary)
+    meta = await run_in_threadpool(store.read_meta, doc_id)
+    if meta is not None:
+        await run_in_threadpool(store.write_meta, doc_id, {**meta, "summary": summary})
+    logger.info(f"Summary ready for {doc_id}")
+
+def start_summary(doc_id: str) -> asyncio.Task:
+    """Start the background summary unless one is already running for the document; event loop only"""
+    task = summary_tasks.get(doc_id)
+    if task is None or task.done():
+        task = asyncio.create_task(build_summary(doc_id))
+        summary_tasks[doc_id] = task
+        task.add_done_callback(lambda t: summary_tasks.pop(doc_id, None) if summary_tasks.get(doc_id) is t else None)
+    return task
+
+@app.get("/document/{doc_id}/summary", response_model=dict)
+async def get_document_summary(doc_id: str, refresh: bool = False):
+    """
+    Full map-reduce summary. Until it is ready `summary` is the quick
+    extract from upload and `status` is "pending"; documents without one
+    (or with `refresh`) start generating it. Parts already summarised are
+    reused, so a refresh only pays for what changed.
+    """
+    doc = catalog.get(doc_id)
+    if doc is None:
+        raise HTTPException(404, "Document not found")
+    state = catalog.get_summary_status(doc_id)
+    if refresh or state is None or state["status"] == "failed":
+        start_summary(doc_id)
+        state = {"status": "pending", "error": None}
+    return {"doc_id": doc_id, "status": state["status"], "summary": doc["summary"], "error": state["error"]}
 
 @app.get("/document/{doc_id}", response_model=dict)
 async def get_document_info(doc_id: str):
     try:
-        if doc_id not in documents_storage:
+        doc = catalog.get(doc_id)
+        if doc is None:
             raise HTTPException(404, "Document not found")
-        doc = documents_storage[doc_id]
         return {
             "doc_id": doc_id,
             "filename": doc["filename"],
+            "file_type": doc["file_type"],
+            "word_count": doc["word_count"],
+            "page_count": doc["page_count"],
+            "chunk_count": doc["chunk_count"],
             "summary": doc["summary"],
             "upload_timestamp": doc["upload_timestamp"]
         }
@@ -165,9 +956,18 @@ async def get_document_info(doc_id: str):
 @app.delete("/document/{doc_id}", response_model=dict)
 async def delete_document(doc_id: str):
     try:
-        if doc_id not in documents_storage:
+        if doc_id not in catalog:
             raise HTTPException(404, "Document not found")
-        del documents_storage[doc_id]
+        for collection_id in catalog.collections_of(doc_id):
+            await run_in_threadpool(remove_from_collection, collection_id, doc_id)
+        task = summary_tasks.pop(doc_id, None)
+        if task is not None:
+            task.cancel()
+        catalog.delete(doc_id)
+        index_cache.invalidate(doc_id)
+        index_cache.unpin(doc_id)
+        answer_cache.invalidate(doc_id)
+        delete_doc_files(doc_id)
         logger.info(f"Document deleted: {doc_id}")
         return {"status": "success", "message": "Document deleted successfully"}
     except Exception as e:
@@ -0,0 +1,246 @@
+import bisect
+import contextvars
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+# Seconds; covers sub-millisecond searches up to multi-minute ingestions
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0,
+                   60.0, 300.0)
+
+# Per-request span collector, only set when the client asked for the timing header
+_request_timings: contextvars.ContextVar[Optional[Dict[str, float]]] = contextvars.ContextVar(
+    "request_timings", default=None)
+
+
+def _labels(names: Sequence[str], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: Any) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+class Counter:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = ()):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            lines += [f"{self.name}{_labels(self.labelnames, k)} {v}" for k, v in sorted(self._values.items())]
+        return lines
+
+
+class Histogram:
+    def __init__(self, name: str, help: str, labelnames: Sequence[str] = (),
+                 buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.name, self.help, self.labelnames = name, help, tuple(labelnames)
+        self.buckets = tuple(sorted(buckets))
+        # per label set: [bucket counts..., sum, count]
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels: str) -> None:
+        key = tuple(str(labels[n]) for n in self.labelnames)
+        slot = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0.0] * (len(self.buckets) + 2)
+            if slot < len(self.buckets):
+                series[slot] += 1
+            series[-2] += value
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((k, list(v)) for k, v in self._series.items())
+        for key, values in series:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, values):
+                cumulative += count
+                bucket = _labels(self.labelnames, key, 'le="%s"' % bound)
+                lines.append(f"{self.name}_bucket{bucket} {cumulative}")
+            bucket = _labels(self.labelnames, key, 'le="+Inf"')
+            lines.append(f"{self.name}_bucket{bucket} {values[-1]}")
+            lines.append(f"{self.name}_sum{_labels(self.labelnames, key)} {values[-2]}")
+            lines.append(f"{self.name}_count{_labels(self.labelnames, key)} {values[-1]}")
+        return lines
+
+
+class CallbackMetric:
+    """
+    Gauge or counter whose value is read from live state at scrape time, so
+    the hot path pays nothing. `read` returns a number, or a dict mapping a
+    tuple of label values to a number.
+    """
+
+    def __init__(self, name: str, help: str, read: Callable[[], Any], kind: str = "gauge",
+                 labelnames: Sequence[str] = ()):
+        self.name, self.help, self.read, self.kind, self.labelnames = name, help, read, kind, tuple(labelnames)
+
+    def render(self) -> List[str]:
+        try:
+            value = self.read()
+        except Exception:
+            return []
+        if value is None:
+            return []
+        values = value if isinstance(value, dict) else {(): value}
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        lines += [f"{self.name}{_labels(self.labelnames, k)} {float(v)}" for k, v in sorted(values.items())]
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def register(self, metric: Any) -> Any:
+        with self._lock:
+            # Re-registering a name replaces it, so reloading a module does not duplicate series
+            self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self.register(Counter(name, help, labelnames))
+
+    def histogram(self, name: str, help: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help, labelnames, buckets))
+
+    def gauge_callback(self, name: str, help: str, read: Callable[[], Any], labelnames: Sequence[str] = ()) -> None:
+        self.register(CallbackMetric(name, help, read, "gauge", labelnames))
+
+    def counter_callback(self, name: str, help: str, read: Callable[[], Any], labelnames: Sequence[str] = ()) -> None:
+        self.register(CallbackMetric(name, help, read, "counter", labelnames))
+
+    def render(self) -> str:
+        """Prometheus text exposition format (version 0.0.4)"""
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines: List[str] = []
+        for metric in metrics:
+            lines += metric.render()
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+
+STAGE_SECONDS = REGISTRY.histogram(
+    "rag_stage_seconds", "Time spent in each pipeline stage", ("stage",))
+HTTP_SECONDS = REGISTRY.histogram(
+    "rag_http_request_seconds", "HTTP request latency until the response starts", ("method", "route", "status"))
+
+
+class span:
+    """
+    Times a block into the `rag_stage_seconds` histogram:
+
+        with span("embed") as s:
+            ...
+        s.seconds  # elapsed, for callers that also keep their own totals
+
+    The stage is also added to the per-request timing header when the
+    client opted in. Cost is two perf_counter calls and one locked update.
+    """
+
+    __slots__ = ("stage", "started", "seconds")
+
+    def __init__(self, stage: str):
+        self.stage = stage
+        self.seconds = 0.0
+
+    def __enter__(self) -> "span":
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc) -> None:
+        self.seconds = time.perf_counter() - self.started
+        record(self.stage, self.seconds)
+
+
+def record(stage: str, seconds: float) -> None:
+    """Record an already measured stage duration"""
+    STAGE_SECONDS.observe(seconds, stage=stage)
+    timings = _request_timings.get()
+    if timings is not None:
+        timings[stage] = timings.get(stage, 0.0) + seconds
+
+
+def start_request_timing() -> contextvars.Token:
+    return _request_timings.set({})
+
+
+def finish_request_timing(token: contextvars.Token) -> Dict[str, float]:
+    timings = _request_timings.get() or {}
+    _request_timings.reset(token)
+    return timings
+
+
+def server_timing_header(timings: Dict[str, float], total: float) -> str:
+    """`Server-Timing` value, durations in milliseconds as the spec requires"""
+    entries = [f"{stage};dur={seconds * 1000:.3f}" for stage, seconds in timings.items()]
+    entries.append(f"total;dur={total * 1000:.3f}")
+    return ", ".join(entries)
+
+
+class TimingMiddleware:
+    """
+    Pure ASGI middleware (streaming responses pass through untouched) that
+    records request latency per route and, when the request carries
+    `X-Request-Timing: 1`, adds a `Server-Timing` header with every span
+    recorded while producing the response head.
+    """
+
+    def __init__(self, app: Any, header: bytes = b"x-request-timing"):
+        self.app = app
+        self.header = header
+
+    async def __call__(self, scope: Dict[str, Any], receive: Callable, send: Callable) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        opted_in = any(k == self.header and v not in (b"", b"0", b"false") for k, v in scope.get("headers", ()))
+        token = start_request_timing() if opted_in else None
+        started = time.perf_counter()
+        observed = False
+
+        def observe(status: int) -> float:
+            nonlocal observed
+            observed = True
+            elapsed = time.perf_counter() - started
+            # The router stores the matched route in the shared scope; label by template, not raw path
+            route = getattr(scope.get("route"), "path", "unmatched")
+            HTTP_SECONDS.observe(elapsed, method=scope["method"], route=route, status=str(status))
+            return elapsed
+
+        async def send_with_timing(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start" and not observed:
+                elapsed = observe(message["status"])
+                if token is not None:
+                    value = server_timing_header(_request_timings.get() or {}, elapsed)
+                    message = {**message, "headers": [*message.get("headers", []),
+                                                      (b"server-timing", value.encode("latin-1"))]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            if not observed:
+                observe(500)
+            if token is not None:
+                finish_request_timing(token)
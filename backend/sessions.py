@@ -0,0 +1,193 @@
+import asyncio
+import logging
+import re
+import threading
+import uuid
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Awaitable, Callable, Dict, List, Optional
+
+from api_models import ConversationEntry, SessionData
+from config import SESSION_TTL, SESSION_CACHE_BYTES, SESSION_HISTORY_TOKENS, SESSION_SUMMARY_WORDS
+from context_builder import estimate_tokens
+from metrics import span
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _first_sentence(text: str) -> str:
+    match = re.match(r"(.+?[.!?])(\s|$)", text.strip(), flags=re.DOTALL)
+    return (match.group(1) if match else text.strip())[:300]
+
+
+def extractive_summary(summary: str, turns: List[Dict[str, Any]], max_words: int) -> str:
+    """Fallback fold without the LLM: the question and first answer sentence of each turn, newest words kept"""
+    lines = [summary] if summary else []
+    lines += [f"Asked: {t['question']} Answer: {_first_sentence(t['answer'])}" for t in turns]
+    words = " ".join(lines).split()
+    return " ".join(words[-max_words:])
+
+
+class SessionStore:
+    """
+    Conversation sessions keyed by session id. Every change is written to
+    the catalog, so any worker process can serve any session and sessions
+    survive restarts; each process also keeps recently used sessions in
+    memory, least recently used dropped beyond `max_bytes`, and re-reads one
+    only when another process changed it. Sessions idle for `ttl` seconds
+    expire.
+
+    History stays bounded however long the conversation runs: at most
+    `max_turns` recent turns within `history_tokens` are kept verbatim and
+    older ones are folded into a rolling summary of at most `summary_words`
+    words by `fold` (previous summary, turns, words -> new summary), off the
+    request path. If the LLM fails, an extractive summary is used instead.
+    """
+
+    def __init__(self, catalog, fold: Callable[[str, List[Dict[str, Any]], int], Awaitable[str]],
+                 max_turns: int, ttl: float = SESSION_TTL, max_bytes: int = SESSION_CACHE_BYTES,
+                 history_tokens: int = SESSION_HISTORY_TOKENS, summary_words: int = SESSION_SUMMARY_WORDS):
+        self.catalog = catalog
+        self._fold = fold
+        self.max_turns = max_turns
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.history_tokens = history_tokens
+        self.summary_words = summary_words
+        # session id -> (catalog version, session, size in bytes)
+        self._entries: "OrderedDict[str, tuple[int, SessionData, int]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._folding: Dict[str, asyncio.Task] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.folds = 0
+        self.fold_failures = 0
+
+    def create(self, document_id: Optional[str]) -> SessionData:
+        self.catalog.prune_sessions((datetime.now() - timedelta(seconds=self.ttl)).isoformat())
+        session = SessionData(session_id=uuid.uuid4().hex, document_id=document_id)
+        self._save(session)
+        return session
+
+    def get(self, session_id: str) -> Optional[SessionData]:
+        """The session, or None when it does not exist or has expired. Treat it as read-only"""
+        current = self.catalog.session_version(session_id)
+        if current is None or self._expired(current["updated_at"]):
+            self.delete(session_id)
+            return None
+        with self._lock:
+            entry = self._entries.get(session_id)
+            if entry is not None and entry[0] == current["version"]:
+                self._entries.move_to_end(session_id)
+                self.hits += 1
+                return entry[1]
+            self.misses += 1
+        row = self.catalog.load_session(session_id)
+        if row is None:
+            return None
+        session = SessionData.model_validate_json(row["data"])
+        self._remember(session_id, row["version"], session, len(row["data"]))
+        return session
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            self._forget(session_id)
+        return self.catalog.delete_session(session_id)
+
+    def history(self, session: SessionData) -> List[Dict[str, Any]]:
+        """Prompt history for llm_service: the rolling summary, then the recent turns"""
+        history: List[Dict[str, Any]] = [{"summary": session.summary}] if session.summary else []
+        return history + [{"question": t.question, "answer": t.answer} for t in session.conversation_history]
+
+    def add_turn(self, session_id: str, question: str, answer: str, justification: str = "") -> Optional[SessionData]:
+        """
+        Append a turn; turns pushed out of the recent window wait in
+        `unsummarized` until fold() merges them into the summary
+        """
+        def update(session: SessionData) -> None:
+            session.conversation_history.append(
+                ConversationEntry(question=question, answer=answer, justification=justification))
+            recent = session.conversation_history
+            while recent and (len(recent) > self.max_turns or self._tokens(recent) > self.history_tokens):
+                session.unsummarized.append(recent.pop(0))
+        return self._update(session_id, update)
+
+    def schedule_fold(self, session_id: str) -> None:
+        """Fold the session's waiting turns in the background, one task per session at a time"""
+        if session_id in self._folding:
+            return
+        task = asyncio.get_running_loop().create_task(self.fold(session_id))
+        self._folding[session_id] = task
+        task.add_done_callback(lambda _: self._folding.pop(session_id, None))
+
+    async def fold(self, session_id: str) -> None:
+        """Merge the session's unsummarized turns into its rolling summary, until none are left"""
+        while True:
+            session = self.get(session_id)
+            if session is None or not session.unsummarized:
+                return
+            turns = [{"question": t.question, "answer": t.answer} for t in session.unsummarized]
+            folded = {t.timestamp for t in session.unsummarized}
+            try:
+                with span("session_fold"):
+                    summary = (await self._fold(session.summary, turns, self.summary_words)).strip()
+                self.folds += 1
+            except Exception as e:
+                logger.warning(f"Conversation summary failed for session {session_id}, using extract: {e}")
+                self.fold_failures += 1
+                summary = extractive_summary(session.summary, turns, self.summary_words)
+
+            def update(current: SessionData) -> None:
+                # Turns added while the LLM was busy are left for the next round
+                current.summary = summary
+                current.unsummarized = [t for t in current.unsummarized if t.timestamp not in folded]
+            self._update(session_id, update)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"entries": len(self._entries), "bytes": self.bytes, "max_bytes": self.max_bytes,
+                    "hits": self.hits, "misses": self.misses, "evictions": self.evictions,
+                    "folds": self.folds, "fold_failures": self.fold_failures}
+
+    # ---------------- internals ----------------
+
+    @staticmethod
+    def _tokens(turns: List[ConversationEntry]) -> int:
+        return sum(estimate_tokens(t.question) + estimate_tokens(t.answer) for t in turns)
+
+    def _expired(self, updated_at: str) -> bool:
+        return datetime.fromisoformat(updated_at) < datetime.now() - timedelta(seconds=self.ttl)
+
+    def _update(self, session_id: str, change: Callable[[SessionData], None]) -> Optional[SessionData]:
+        session = self.get(session_id)
+        if session is None:
+            return None
+        # The cached object may be in use by another request: change a copy
+        session = session.model_copy(deep=True)
+        change(session)
+        self._save(session)
+        return session
+
+    def _save(self, session: SessionData) -> None:
+        session.last_activity = datetime.now()
+        data = session.model_dump_json()
+        version = self.catalog.save_session(session.session_id, session.document_id, data,
+                                            session.last_activity.isoformat())
+        self._remember(session.session_id, version, session, len(data))
+
+    def _remember(self, session_id: str, version: int, session: SessionData, size: int) -> None:
+        with self._lock:
+            self._forget(session_id)
+            self._entries[session_id] = (version, session, size)
+            self.bytes += size
+            while self.bytes > self.max_bytes and len(self._entries) > 1:
+                self._forget(next(iter(self._entries)))
+                self.evictions += 1
+
+    def _forget(self, session_id: str) -> None:
+        entry = self._entries.pop(session_id, None)
+        if entry is not None:
+            self.bytes -= entry[2]
@@ -0,0 +1,133 @@
+import asyncio
+import hashlib
+import logging
+from typing import Awaitable, Callable, Dict, List
+
+from config import LLM_BACKEND, LLM_MODEL, SUMMARY_GROUP_CHARS, SUMMARY_FANOUT, SUMMARY_MAX_WORDS
+from metrics import span
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+# Part of every cache key: bump it when the prompts change so old parts are not reused
+SUMMARY_VERSION = 1
+# A line ends a group (once the group is long enough) when its hash is divisible by this
+CUT_ODDS = 8
+
+
+def _hash(*parts: str) -> str:
+    return hashlib.sha256("\0".join(parts).encode("utf-8")).hexdigest()
+
+
+def _units(text: str, limit: int) -> List[str]:
+    """Lines of the text, with lines longer than `limit` broken at spaces"""
+    units = []
+    for line in text.split("\n"):
+        while len(line) > limit:
+            cut = line.rfind(" ", limit // 2, limit)
+            cut = cut if cut > 0 else limit
+            units.append(line[:cut])
+            line = line[cut:].lstrip(" ")
+        units.append(line)
+    return units
+
+
+def split_groups(text: str, min_chars: int = SUMMARY_GROUP_CHARS) -> List[str]:
+    """
+    Split text into groups of `min_chars` to `2 * min_chars` characters
+    (the last one may be shorter) that end at line ends picked by the
+    content of the line, not its position. An edit changes the groups it
+    touches, the boundaries after it fall where they did before, so every
+    other group keeps its cache key.
+    """
+    groups: List[str] = []
+    current: List[str] = []
+    size = 0
+    for unit in _units(text, max(1, min_chars // 2)):
+        current.append(unit)
+        size += len(unit) + 1
+        if size >= 2 * min_chars or (size >= min_chars and int(_hash(unit)[:8], 16) % CUT_ODDS == 0):
+            groups.append("\n".join(current))
+            current, size = [], 0
+    if current and "".join(current).strip():
+        groups.append("\n".join(current))
+    return [g for g in groups if g.strip()]
+
+
+def pack(summaries: List[str], limit: int) -> List[List[str]]:
+    """Consecutive summaries batched up to about `limit` characters, at least two per batch"""
+    batches: List[List[str]] = []
+    current: List[str] = []
+    size = 0
+    for summary in summaries:
+        if len(current) >= 2 and size + len(summary) > limit:
+            batches.append(current)
+            current, size = [], 0
+        current.append(summary)
+        size += len(summary)
+    if len(current) == 1 and batches:
+        batches[-1].append(current[0])
+    elif current:
+        batches.append(current)
+    return batches
+
+
+class Summarizer:
+    """
+    Hierarchical map-reduce summaries. The map step summarises groups of
+    the document text concurrently, at most `fanout` LLM calls at a time;
+    reduce steps combine consecutive summaries until one is left. Every
+    part is stored in `cache` (a DocumentCatalog) under a hash of its input,
+    so a re-summary after a small edit only calls the LLM for the groups
+    the edit touched and the reduce steps above them.
+    """
+
+    def __init__(self, cache, summarize: Callable[[str, int], Awaitable[str]],
+                 combine: Callable[[List[str], int], Awaitable[str]],
+                 group_chars: int = SUMMARY_GROUP_CHARS, fanout: int = SUMMARY_FANOUT,
+                 max_words: int = SUMMARY_MAX_WORDS):
+        self.cache = cache
+        self._summarize = summarize
+        self._combine = combine
+        self.group_chars = group_chars
+        self.fanout = fanout
+        self.max_words = max_words
+        self.cached_parts = 0
+        self.generated_parts = 0
+
+    def _key(self, step: str, text: str) -> str:
+        return _hash(str(SUMMARY_VERSION), LLM_BACKEND, LLM_MODEL, step, str(self.max_words), text)
+
+    async def summarize(self, text: str) -> str:
+        groups = split_groups(text, self.group_chars)
+        if not groups:
+            return ""
+        limit = asyncio.Semaphore(self.fanout)
+        with span("summary_map"):
+            summaries = await self._run("map", groups, lambda i: self._summarize(groups[i], self.max_words), limit)
+        while len(summaries) > 1:
+            batches = pack(summaries, self.group_chars)
+            with span("summary_reduce"):
+                summaries = await self._run("reduce", ["\n\n".join(b) for b in batches],
+                                            lambda i: self._combine(batches[i], self.max_words), limit)
+        return summaries[0]
+
+    async def _run(self, step: str, inputs: List[str], call: Callable[[int], Awaitable[str]],
+                   limit: asyncio.Semaphore) -> List[str]:
+        """Outputs for `inputs` in order: cached ones looked up at once, the rest generated concurrently"""
+        keys = [self._key(step, text) for text in inputs]
+        found: Dict[str, str] = self.cache.get_summary_parts(keys)
+        missing = [i for i, key in enumerate(keys) if key not in found]
+        self.cached_parts += len(inputs) - len(missing)
+        self.generated_parts += len(missing)
+
+        async def generate(i: int) -> str:
+            async with limit:
+                result = await call(i)
+            # Stored as soon as it exists: a failure elsewhere does not waste this part
+            self.cache.put_summary_part(keys[i], result)
+            return result
+
+        for i, result in zip(missing, await asyncio.gather(*(generate(i) for i in missing))):
+            found[keys[i]] = result
+        return [found[key] for key in keys]
@@ -0,0 +1,398 @@
+import json
+import mmap
+import os
+import shutil
+import threading
+import uuid
+import logging
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Sequence, Tuple
+
+try:
+    import fcntl
+except ImportError:  # not on Windows; builders in one process are still serialized by a thread lock
+    fcntl = None
+
+import numpy as np
+from langchain.schema import Document
+
+from chunker import PAGE_SEPARATOR, Span
+from config import VECTOR_RESCORE_FACTOR, VECTOR_STORAGE
+from embeddings import get_embeddings
+from lexical import BM25Index, LexicalIndexWriter, reciprocal_rank_fusion
+from metrics import span
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+FORMAT_VERSION = 2
+
+# Files of one index directory
+MANIFEST = "index.json"
+VECTORS = "vectors.f32"         # float32 [count, dim], row-major
+NORMS = "norms.f32"             # float32 [count], squared L2 norm of each vector
+TEXT = "text.utf8"              # the document text, stored once; chunks are spans of it
+OFFSETS = "chunk_offsets.npy"   # int64 [count, 2], byte span of each chunk in text.utf8
+CHUNK_META = "chunk_meta.npy"   # int64 [count, 3], (start char, end char, page) in the document text
+# Optional compact copies of the vectors that searches scan instead of vectors.f32
+QUANTIZED = {
+    "float16": "vectors.f16",   # float16 [count, dim]
+    "int8": "vectors.i8",       # int8 [count, dim], vector = code * scale
+}
+SCALES = "scales.f32"           # float32 [count], per-vector scale of vectors.i8
+
+# Serialise building missing lexical files and converting FAISS indexes within a process;
+# lock files next to what is built do across processes
+_lexical_build_lock = threading.Lock()
+_convert_lock = threading.Lock()
+
+# Rows converted to float32 at a time when scanning a compact copy, bounds the temporary memory
+SCAN_BLOCK_ROWS = 16384
+
+
+def quantize(matrix: np.ndarray, storage: str) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+    """(codes, per-row scales) of a float32 matrix; float16 needs no scales"""
+    if storage == "float16":
+        return matrix.astype(np.float16), None
+    if storage == "int8":
+        # Symmetric per-vector scaling keeps the largest component exact
+        scales = (np.abs(matrix).max(axis=1) / 127.0).astype(np.float32)
+        codes = np.rint(matrix / np.maximum(scales, 1e-12)[:, None])
+        return np.clip(codes, -127, 127).astype(np.int8), scales
+    raise ValueError(f"Unknown vector storage: {storage}")
+
+
+@contextmanager
+def _exclusive(thread_lock: threading.Lock, lock_path: Path) -> Iterator[None]:
+    """Hold `thread_lock` and an exclusive flock on `lock_path`, where fcntl exists"""
+    with thread_lock, open(lock_path, "a") as lock_file:
+        if fcntl is not None:
+            fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            if fcntl is not None:
+                fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+class VectorIndexWriter:
+    """
+    Appends the document text and embedded chunks straight to disk, nothing
+    but offsets and the BM25 term counts stay in memory. Chunks are stored as
+    spans of the text, so overlapping chunk text is not stored twice. The
+    manifest is written last by close(), so a half-written index is never
+    opened.
+    """
+
+    def __init__(self, path: Path, storage: str = VECTOR_STORAGE):
+        self.path = Path(path)
+        if storage != "float32" and storage not in QUANTIZED:
+            raise ValueError(f"Unknown vector storage: {storage}")
+        if self.path.exists():
+            shutil.rmtree(self.path)
+        self.path.mkdir(parents=True)
+        self.storage = storage
+        self.dim: Optional[int] = None
+        self.count = 0
+        self._spans: List[Tuple[int, int]] = []
+        self._meta: List[Tuple[int, int, int]] = []
+        self._text_chars = 0
+        self._text_bytes = 0
+        self._vectors = open(self.path / VECTORS, "wb")
+        self._norms = open(self.path / NORMS, "wb")
+        self._text = open(self.path / TEXT, "wb")
+        self._codes = open(self.path / QUANTIZED[storage], "wb") if storage in QUANTIZED else None
+        self._scales = open(self.path / SCALES, "wb") if storage == "int8" else None
+        self._lexical = LexicalIndexWriter()
+
+    def append_text(self, text: str) -> None:
+        """Append to the document text that chunk spans point into"""
+        data = text.encode("utf-8")
+        self._text.write(data)
+        self._text_chars += len(text)
+        self._text_bytes += len(data)
+
+    def add(self, texts: Sequence[str], vectors: Sequence[Sequence[float]],
+            spans: Optional[Sequence[Span]] = None) -> None:
+        """
+        Append embedded chunks. `spans` locate each text in what was given to
+        append_text(); without them the texts are appended here, one per line.
+        """
+        if spans is None:
+            spans = []
+            for text in texts:
+                if self._text_chars:
+                    self.append_text(PAGE_SEPARATOR)
+                start, byte_start = self._text_chars, self._text_bytes
+                self.append_text(text)
+                spans.append(Span(start, self._text_chars, byte_start, self._text_bytes, 0))
+        matrix = np.asarray(vectors, dtype=np.float32)
+        if self.dim is None:
+            self.dim = int(matrix.shape[1])
+        elif matrix.shape[1] != self.dim:
+            raise ValueError(f"Vector dimension {matrix.shape[1]} does not match index dimension {self.dim}")
+        self._vectors.write(matrix.tobytes())
+        self._norms.write(np.einsum("ij,ij->i", matrix, matrix).astype(np.float32).tobytes())
+        if self._codes is not None:
+            codes, scales = quantize(matrix, self.storage)
+            self._codes.write(codes.tobytes())
+            if scales is not None:
+                self._scales.write(scales.tobytes())
+        for chunk_span in spans:
+            self._spans.append((chunk_span.byte_start, chunk_span.byte_end))
+            self._meta.append((chunk_span.start, chunk_span.end, chunk_span.page))
+        self._lexical.add(texts)
+        self.count += len(texts)
+
+    def close(self, extra: Optional[Dict[str, Any]] = None) -> None:
+        if self._vectors.closed:
+            return
+        for f in (self._vectors, self._norms, self._text, self._codes, self._scales):
+            if f is not None:
+                f.close()
+        np.save(self.path / OFFSETS, np.asarray(self._spans, dtype=np.int64).reshape(-1, 2))
+        np.save(self.path / CHUNK_META, np.asarray(self._meta, dtype=np.int64).reshape(-1, 3))
+        self._lexical.write(self.path)
+        manifest = {"format_version": FORMAT_VERSION, "dim": self.dim or 0, "count": self.count,
+                    "metric": "l2", **(extra or {})}
+        (self.path / MANIFEST).write_text(json.dumps(manifest), encoding="utf-8")
+
+
+class VectorIndex:
+    """
+    Read-only index over memory-mapped files. Opening maps the files and
+    reads the manifest, so it costs the same for any document size, and
+    the OS page cache shares the pages between every worker process.
+    Search is exact L2, matching the flat FAISS indexes it replaces. With
+    float16 or int8 `storage` the scan runs over the compact copy (built
+    on first open if the index has none) and the best
+    `VECTOR_RESCORE_FACTOR * k` candidates are re-scored exactly from the
+    float32 vectors, which are then only read a few rows at a time.
+    """
+
+    def __init__(self, path: Path, storage: str = VECTOR_STORAGE):
+        self.path = Path(path)
+        manifest = json.loads((self.path / MANIFEST).read_text(encoding="utf-8"))
+        version = manifest.get("format_version")
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported index format: {version}")
+        self.manifest = manifest
+        self.dim = manifest["dim"]
+        self.count = manifest["count"]
+        if self.count:
+            self.vectors = np.memmap(self.path / VECTORS, dtype=np.float32, mode="r", shape=(self.count, self.dim))
+            self.norms = np.memmap(self.path / NORMS, dtype=np.float32, mode="r", shape=(self.count,))
+            with open(self.path / TEXT, "rb") as f:
+                self._text = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) if f.seek(0, 2) else b""
+        else:
+            self.vectors = np.zeros((0, self.dim), dtype=np.float32)
+            self.norms = np.zeros(0, dtype=np.float32)
+            self._text = b""
+        # Byte span of every chunk in the text file
+        self.spans = np.load(self.path / OFFSETS, mmap_mode="r")
+        self.chunk_meta = np.load(self.path / CHUNK_META, mmap_mode="r")
+        self._bm25: Optional[BM25Index] = None
+        self.storage = storage if self.count else "float32"
+        self.codes: Optional[np.ndarray] = None
+        self.scales: Optional[np.ndarray] = None
+        if self.storage != "float32":
+            self._open_quantized()
+
+    def _open_quantized(self) -> None:
+        if self.storage not in QUANTIZED:
+            raise ValueError(f"Unknown vector storage: {self.storage}")
+        codes_path = self.path / QUANTIZED[self.storage]
+        if not codes_path.exists():
+            # Index written in another storage mode (VectorIndexWriter builds the copy at ingest otherwise):
+            # quantize it once, block by block. Every builder, thread or worker process, writes its own
+            # tmp files; scales are renamed into place first and the codes last, marking a complete copy.
+            # Concurrent builders produce identical bytes, so whichever rename wins leaves a matching pair
+            suffix = f".{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp"
+            tmp = codes_path.with_name(codes_path.name + suffix)
+            scales_tmp = self.path / (SCALES + suffix)
+            try:
+                with open(tmp, "wb") as codes_out:
+                    scales = []
+                    for start in range(0, self.count, SCAN_BLOCK_ROWS):
+                        codes, block_scales = quantize(np.asarray(self.vectors[start:start + SCAN_BLOCK_ROWS]), self.storage)
+                        codes_out.write(codes.tobytes())
+                        if block_scales is not None:
+                            scales.append(block_scales)
+                if scales:
+                    np.concatenate(scales).tofile(scales_tmp)
+                    os.replace(scales_tmp, self.path / SCALES)
+                os.replace(tmp, codes_path)
+            finally:
+                tmp.unlink(missing_ok=True)
+                scales_tmp.unlink(missing_ok=True)
+            logger.info(f"Built {self.storage} vectors for {self.path}")
+        dtype = np.float16 if self.storage == "float16" else np.int8
+        self.codes = np.memmap(codes_path, dtype=dtype, mode="r", shape=(self.count, self.dim))
+        if self.storage == "int8":
+            self.scales = np.memmap(self.path / SCALES, dtype=np.float32, mode="r", shape=(self.count,))
+
+    @property
+    def lexical(self) -> BM25Index:
+        if self._bm25 is None:
+            if not BM25Index.exists(self.path):
+                self._build_lexical()
+            self._bm25 = BM25Index(self.path)
+        return self._bm25
+
+    def _build_lexical(self) -> None:
+        """Index written before the lexical files existed: build them once from the stored chunks"""
+        with _exclusive(_lexical_build_lock, self.path / ".lexical.lock"):
+            # Whoever held the lock before us may have built them already
+            if BM25Index.exists(self.path):
+                return
+            writer = LexicalIndexWriter()
+            writer.add(self.chunk_text(i) for i in range(self.count))
+            writer.write(self.path)
+            logger.info(f"Built missing lexical index for {self.path}")
+
+    def prefetch(self) -> None:
+        """
+        Read the pages every query scans and open the lexical index, so the
+        first query after a restart does not fault them in from disk
+        """
+        scanned = [self.norms, self.codes if self.codes is not None else self.vectors]
+        if self.scales is not None:
+            scanned.append(self.scales)
+        for array in scanned:
+            for start in range(0, len(array), SCAN_BLOCK_ROWS):
+                np.asarray(array[start:start + SCAN_BLOCK_ROWS]).sum()
+        self.lexical
+
+    def resident_bytes(self) -> int:
+        """
+        Estimated resident memory: the files every query scans. Chunk text
+        and offsets, and the float32 vectors when a compact copy is scanned
+        instead, are only read for the few chunks a query returns, so they
+        are left out. Pages are shared across processes.
+        """
+        on_demand = {TEXT, OFFSETS, CHUNK_META, SCALES, *QUANTIZED.values()}
+        if self.codes is not None:
+            on_demand = (on_demand - {QUANTIZED[self.storage], SCALES}) | {VECTORS}
+        return sum(f.stat().st_size for f in self.path.iterdir() if f.name not in on_demand)
+
+    def vector_bytes(self) -> int:
+        """Bytes of vector data every query scans: norms plus the float32 vectors or their compact copy"""
+        scanned = self.codes if self.codes is not None else self.vectors
+        return self.norms.nbytes + scanned.nbytes + (self.scales.nbytes if self.scales is not None else 0)
+
+    def disk_bytes(self) -> int:
+        return sum(f.stat().st_size for f in self.path.iterdir())
+
+    def chunk_text(self, i: int) -> str:
+        start, end = self.spans[i]
+        return bytes(self._text[int(start):int(end)]).decode("utf-8")
+
+    def document(self, i: int) -> Document:
+        text = self.chunk_text(i)
+        start, end, page = (int(v) for v in self.chunk_meta[i])
+        return Document(page_content=text, metadata={"chunk": int(i), "start": start, "end": end, "page": page})
+
+    def search_by_vector(self, query: Sequence[float], k: int = 4) -> List[Tuple[int, float]]:
+        """(chunk id, squared L2 distance) of the k nearest chunks, closest first"""
+        return self.search_by_vectors([query], k)[0]
+
+    def search_by_vectors(self, queries: Sequence[Sequence[float]], k: int = 4,
+                          exact: bool = False) -> List[List[Tuple[int, float]]]:
+        """
+        search_by_vector for many queries at once: one matrix product scans
+        the mapped vectors a single time for the whole batch. `exact` scans
+        the float32 vectors even when a compact copy is in use.
+        """
+        if not self.count or not len(queries):
+            return [[] for _ in range(len(queries))]
+        with span("vector_search"):
+            q = np.asarray(queries, dtype=np.float32).reshape(len(queries), self.dim)
+            qq = np.einsum("ij,ij->i", q, q)
+            k = min(k, self.count)
+            if self.codes is None or exact:
+                distances = self.norms[None, :] - 2.0 * (q @ self.vectors.T) + qq[:, None]
+                top = np.argpartition(distances, k - 1, axis=1)[:, :k]
+                rows = np.arange(len(q))[:, None]
+                top = np.take_along_axis(top, np.argsort(distances[rows, top], axis=1), axis=1)
+                return [[(int(i), float(distances[r, i])) for i in top[r]] for r in range(len(q))]
+            shortlist = min(self.count, k * max(1, VECTOR_RESCORE_FACTOR))
+            candidates = np.argpartition(self._approximate_distances(q, qq), shortlist - 1, axis=1)[:, :shortlist]
+            results = []
+            for r in range(len(q)):
+                # Ascending ids read the float32 rows front to back
+                ids = np.sort(candidates[r])
+                distances = self.norms[ids] - 2.0 * (self.vectors[ids] @ q[r]) + qq[r]
+                order = np.argsort(distances)[:k]
+                results.append([(int(ids[i]), float(distances[i])) for i in order])
+            return results
+
+    def _approximate_distances(self, q: np.ndarray, qq: np.ndarray) -> np.ndarray:
+        """Squared L2 distances from the compact copy, exact norms, dot products scanned in blocks"""
+        dots = np.empty((len(q), self.count), dtype=np.float32)
+        for start in range(0, self.count, SCAN_BLOCK_ROWS):
+            stop = min(start + SCAN_BLOCK_ROWS, self.count)
+            dots[:, start:stop] = q @ np.asarray(self.codes[start:stop], dtype=np.float32).T
+            if self.scales is not None:
+                dots[:, start:stop] *= self.scales[start:stop]
+        return self.norms[None, :] - 2.0 * dots + qq[:, None]
+
+    def similarity_search_with_score_by_vector(self, embedding: Sequence[float], k: int = 4) -> List[Tuple[Document, float]]:
+        return [(self.document(i), score) for i, score in self.search_by_vector(embedding, k)]
+
+    def similarity_search_by_vector(self, embedding: Sequence[float], k: int = 4) -> List[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score_by_vector(embedding, k)]
+
+    def similarity_search(self, query: str, k: int = 4) -> List[Document]:
+        return self.similarity_search_by_vector(get_embeddings().embed_query(query), k)
+
+    def lexical_search(self, query: str, k: int = 4) -> List[Tuple[int, float]]:
+        """(chunk id, BM25 score), best first. Needs no embedding model"""
+        with span("lexical_search"):
+            return self.lexical.search(query, k)
+
+    def hybrid_search(self, query: str, embedding: Sequence[float], k: int = 4, candidates: int = 20) -> List[int]:
+        """Chunk ids ranked by reciprocal rank fusion of the vector and BM25 rankings"""
+        return self.hybrid_search_many([query], [embedding], k, candidates)[0]
+
+    def hybrid_search_many(self, queries: Sequence[str], embeddings: Sequence[Sequence[float]], k: int = 4,
+                           candidates: int = 20) -> List[List[int]]:
+        """hybrid_search for a batch of queries, sharing one vector scan"""
+        vector_hits = self.search_by_vectors(embeddings, max(k, candidates))
+        return [
+            reciprocal_rank_fusion([[i for i, _ in hits], [i for i, _ in self.lexical_search(query, max(k, candidates))]])[:k]
+            for query, hits in zip(queries, vector_hits)
+        ]
+
+
+def convert_faiss_index(faiss_dir: Path, out_dir: Path) -> None:
+    """
+    One-off migration of a legacy LangChain FAISS directory written by this
+    service. The index is written to a sibling temporary directory and
+    renamed into place, under a lock, so a crash or a concurrent convert
+    never leaves a partial `out_dir` behind.
+    """
+    from langchain_community.vectorstores import FAISS
+
+    out_dir = Path(out_dir)
+    out_dir.parent.mkdir(parents=True, exist_ok=True)
+    with _exclusive(_convert_lock, out_dir.parent / f".{out_dir.name}.convert.lock"):
+        # Whoever held the lock before us may have converted it already
+        if (out_dir / MANIFEST).exists():
+            return
+        tmp = out_dir.with_name(f"{out_dir.name}.{os.getpid()}-{uuid.uuid4().hex[:8]}.tmp")
+        try:
+            # Only ever called on indexes this service wrote itself, so the pickle is trusted
+            legacy = FAISS.load_local(str(faiss_dir), get_embeddings(), allow_dangerous_deserialization=True)
+            writer = VectorIndexWriter(tmp)
+            ids = [legacy.index_to_docstore_id[i] for i in range(legacy.index.ntotal)]
+            docs = [legacy.docstore.search(doc_id) for doc_id in ids]
+            if ids:
+                writer.add([d.page_content for d in docs], legacy.index.reconstruct_n(0, len(ids)))
+            writer.close()
+            # A directory without a manifest is what an interrupted convert left before this one
+            shutil.rmtree(out_dir, ignore_errors=True)
+            os.replace(tmp, out_dir)
+        finally:
+            shutil.rmtree(tmp, ignore_errors=True)
+    logger.info(f"Converted legacy FAISS index {faiss_dir} ({len(ids)} chunks)")
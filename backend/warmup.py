@@ -0,0 +1,139 @@
+import logging
+import threading
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import Any, Callable, Dict, List, Optional
+
+from config import WARMUP_INTERVAL, WARMUP_WINDOW_HOURS, WARMUP_MAX_DOCS, WARMUP_MAX_BYTES
+from index_cache import IndexCache, estimate_index_bytes
+from metrics import span
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+
+def _hour(moment: datetime) -> str:
+    return moment.strftime("%Y-%m-%dT%H")
+
+
+class AccessLog:
+    """
+    Per-document query hits in hourly buckets of the catalog, shared by
+    every worker process and kept across restarts. Hits are counted in
+    memory and written by flush(), so a request never waits on a write.
+    """
+
+    def __init__(self, catalog, window_hours: int = WARMUP_WINDOW_HOURS):
+        self.catalog = catalog
+        self.window_hours = window_hours
+        self._counts: Counter = Counter()
+        self._lock = threading.Lock()
+
+    def record(self, doc_id: str) -> None:
+        with self._lock:
+            self._counts[doc_id] += 1
+
+    def flush(self) -> int:
+        """Write the hits counted since the last flush; returns how many"""
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        if counts:
+            self.catalog.record_access(dict(counts), _hour(datetime.now()))
+        self.catalog.prune_access(self._since())
+        return sum(counts.values())
+
+    def hottest(self, limit: int) -> List[str]:
+        return self.catalog.hottest_documents(self._since(), limit)
+
+    def _since(self) -> str:
+        return _hour(datetime.now() - timedelta(hours=self.window_hours))
+
+
+class Warmer:
+    """
+    Background warm-up of one worker process. A pass flushes the access
+    log, loads the embedding model (`warm_embeddings`) and then the hottest
+    indexes that are not cached yet, hottest first, while the cache holds
+    less than `max_bytes`; each index is prefetched so its first query
+    finds the pages in memory. The first pass runs at startup and `ready`
+    turns true once it is done; later passes every `interval` seconds
+    follow the access pattern as it shifts.
+    """
+
+    def __init__(self, cache: IndexCache, access_log: AccessLog, load: Callable[[str], Any],
+                 warm_embeddings: Optional[Callable[[], None]] = None, interval: float = WARMUP_INTERVAL,
+                 max_docs: int = WARMUP_MAX_DOCS, max_bytes: int = WARMUP_MAX_BYTES):
+        self.cache = cache
+        self.access_log = access_log
+        self._load = load
+        self._warm_embeddings = warm_embeddings
+        self.interval = interval
+        self.max_docs = max_docs
+        self.max_bytes = min(max_bytes, cache.max_bytes)
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.ready = False
+        self.passes = 0
+        self.loaded = 0
+        self.last_pass_seconds: Optional[float] = None
+
+    def start(self) -> None:
+        self._thread = threading.Thread(target=self._run, name="warm-up", daemon=True)
+        self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+        self.access_log.flush()
+
+    def run_once(self) -> int:
+        """One warm-up pass; returns the number of indexes it loaded"""
+        started = time.perf_counter()
+        self.access_log.flush()
+        if self._warm_embeddings is not None and not self.passes:
+            try:
+                self._warm_embeddings()
+            except Exception as e:
+                logger.error(f"Embedding model warm-up failed: {e}")
+        loaded = 0
+        for doc_id in self.access_log.hottest(self.max_docs):
+            if self._stop.is_set() or self.cache.bytes >= self.max_bytes:
+                break
+            if doc_id in self.cache:
+                continue
+            try:
+                with span("index_warm"):
+                    index = self._load(doc_id)
+                    size = estimate_index_bytes(index)
+                    if self.cache.bytes + size > self.max_bytes:
+                        # Hotter indexes already fill the budget; a smaller, colder one may still fit
+                        continue
+                    if hasattr(index, "prefetch"):
+                        index.prefetch()
+            except Exception as e:
+                logger.warning(f"Warm-up could not load index {doc_id}: {e}")
+                continue
+            self.cache.put(doc_id, index)
+            loaded += 1
+        self.passes += 1
+        self.loaded += loaded
+        self.last_pass_seconds = round(time.perf_counter() - started, 3)
+        return loaded
+
+    def stats(self) -> Dict[str, Any]:
+        return {"ready": self.ready, "passes": self.passes, "indexes_loaded": self.loaded,
+                "last_pass_seconds": self.last_pass_seconds, "cache_bytes": self.cache.bytes,
+                "max_bytes": self.max_bytes}
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            try:
+                loaded = self.run_once()
+                if not self.ready:
+                    logger.info(f"Warm-up done: {loaded} indexes in {self.last_pass_seconds}s")
+            except Exception as e:
+                logger.error(f"Warm-up pass failed: {e}")
+            # A failed first pass still ends startup: requests then load what they need themselves
+            self.ready = True
+            if self.interval <= 0 or self._stop.wait(self.interval):
+                return
@@ -1,23 +1,62 @@
-import streamlit as st, requests
+import streamlit as st, requests, time, json
 
 API = "http://localhost:8000"
 st.set_page_config(page_title="Smart Research Assistant")
 st.title("📄 Smart PDF Assist")
 
+
+@st.cache_resource
+def http_session():
+    # One pooled session for every rerun: keep-alive connections instead of a new one per request
+    return requests.Session()
+
+
+http = http_session()
+
+
+def new_conversation():
+    # The backend keeps the history; each question only sends this id
+    r = http.post(f"{API}/sessions", json={"document_id": st.session_state["doc_id"]})
+    st.session_state["session_id"] = r.json()["session_id"] if r.ok else None
+
+
 if "doc_id" not in st.session_state:
     st.session_state["doc_id"] = None
-if "history" not in st.session_state:
-    st.session_state["history"] = []
+if "session_id" not in st.session_state:
+    st.session_state["session_id"] = None
 
 uploaded = st.file_uploader("Upload PDF or TXT", type=["pdf", "txt"])
 if uploaded and st.session_state["doc_id"] is None:
-    r = requests.post(f"{API}/upload", files={"file": uploaded})
+    r = http.post(f"{API}/upload", files={"file": uploaded})
     if r.ok:
-        res = r.json()
-        st.session_state["doc_id"] = res.get("document_id")
-        st.success("Summary: " + res["summary"])
+        job_id = r.json()["job_id"]
+        bar = st.progress(0.0, text="Queued")
+        while True:
+            job = http.get(f"{API}/jobs/{job_id}").json()
+            bar.progress(job["progress"], text=job["status"].capitalize())
+            if job["status"] in ("ready", "failed"):
+                break
+            time.sleep(1)
+        if job["status"] == "ready":
+            res = job["result"]
+            st.session_state["doc_id"] = res.get("document_id")
+            new_conversation()
+            st.success("Summary: " + res["summary"])
+            st.caption("A summary of the whole document is being generated, see below.")
+        else:
+            st.error("Processing failed: " + (job.get("error") or "unknown error"))
+    else:
+        # Too large, wrong type, too many pages or queue full
+        st.error("Upload rejected: " + r.json().get("detail", r.reason))
 
 if st.session_state["doc_id"]:
+    with st.expander("Full summary"):
+        summary = http.get(f"{API}/document/{st.session_state['doc_id']}/summary").json()
+        if summary.get("status") == "ready":
+            st.write(summary["summary"])
+        else:
+            st.caption("Still being generated, it appears here once ready.")
+
     mode = st.radio("Mode", ["Ask Anything", "Challenge Me"])
 
     if mode == "Ask Anything":
@@ -25,35 +64,55 @@ if st.session_state["doc_id"]:
             q = st.text_input("Ask a question")
             send = st.form_submit_button("Send")
             if send and q:
-                r = requests.post(f"{API}/ask", json={
+                if st.session_state["session_id"] is None:
+                    new_conversation()
+                payload = {
                     "document_id": st.session_state["doc_id"],
                     "question": q,
-                    "conversation_history": st.session_state["history"],
-                })
-                if r.ok:
-                    ans = r.json()
-                    st.write("**Answer:**", ans["answer"])
-                    st.write("**Justification:**", ans["justification"])
-                    st.code(ans["snippet"])
-                    # Store as dict for backend compatibility
-                    st.session_state["history"].append({
-                        "question": q,
-                        "answer": ans["answer"],
-                        "justification": ans.get("justification", "")
-                    })
+                    "session_id": st.session_state["session_id"],
+                }
+                # Server-sent events: meta (snippet) first, then answer tokens, then done/error
+                answer_box = st.empty()
+                ans, text, event = None, "", None
+                with http.post(f"{API}/ask/stream", json=payload, stream=True) as r:
+                    if r.status_code == 404 and st.session_state["session_id"]:
+                        # Expired after a long pause: the next question starts a new conversation
+                        st.session_state["session_id"] = None
+                        st.warning("The conversation expired, please ask again.")
+                    elif r.ok:
+                        for line in r.iter_lines(decode_unicode=True):
+                            if line.startswith("event:"):
+                                event = line[len("event:"):].strip()
+                            elif line.startswith("data:"):
+                                data = json.loads(line[len("data:"):])
+                                if event == "meta":
+                                    st.write("**Justification:**", data["justification"])
+                                    st.code(data["snippet"])
+                                    if data.get("snippet_location"):
+                                        loc = data["snippet_location"]
+                                        st.caption(f"Page {loc['page']}, characters {loc['start']}–{loc['end']}")
+                                elif event == "token":
+                                    text += data["text"]
+                                    answer_box.markdown("**Answer:** " + text + "▌")
+                                elif event == "done":
+                                    ans = data
+                                elif event == "error":
+                                    st.error("Answer failed: " + data["detail"])
+                if ans:
+                    answer_box.markdown("**Answer:** " + ans["answer"])
 
     else:  # Challenge Me
         if "challenges" not in st.session_state:
-            r = requests.get(f"{API}/challenges", params={"document_id": st.session_state["doc_id"]})
+            r = http.get(f"{API}/challenges", params={"document_id": st.session_state["doc_id"]})
             st.session_state["challenges"] = r.json()
         for i, ch in enumerate(st.session_state["challenges"]):
             with st.expander(f"Challenge {i+1}"):
                 st.write(ch["question"])
                 user = st.text_area("Your answer", key=f"u{i}")
                 if st.button("Submit", key=f"s{i}"):
-                    r = requests.post(f"{API}/evaluate", json={
+                    r = http.post(f"{API}/evaluate", json={
                         "document_id": st.session_state["doc_id"],
-                        "challenge_index": i,
+                        "challenge_id": ch["challenge_id"],
                         "user_answer": user,
                     })
                     st.json(r.json())
\ No newline at end of file